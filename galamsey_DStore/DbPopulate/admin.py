@@ -1,6 +1,80 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
 from django.contrib.auth.models import User
-from .models import UploadedFile, SiteRecords  # Importing the models
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+from .jobs import submit
+from .models import UploadedFile, SiteRecords, UploadJob, Region, Town  # Importing the models
+from .purge import delete_records_and_refresh, purge_files
+
+DEFAULT_ADMIN_COUNT_LIMIT = 100000
+DEFAULT_ADMIN_FILTER_CACHE_TIMEOUT = 5 * 60
+REGION_FILTER_KEY = 'galamsey:admin:regions'
+
+
+def estimated_row_count(model):
+    """
+    Approximate number of rows in a model's table, read from the planner
+    statistics (PostgreSQL, or SQLite after ANALYZE) without scanning the
+    table. None if no estimate is available.
+    """
+    connection = connections[model.objects.db]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                # Every row of a table's statistics, one per index, starts with its row count
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never counts a large table exactly: the unfiltered
+    changelist uses the table estimate, filtered ones count up to
+    GALAMSEY_ADMIN_COUNT_LIMIT matching rows.
+    """
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'GALAMSEY_ADMIN_COUNT_LIMIT', DEFAULT_ADMIN_COUNT_LIMIT)
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return queryset.order_by()[:limit].count()
+
+
+class CachedRegionFilter(admin.SimpleListFilter):
+    """
+    Region filter whose choices are cached rather than queried on every page.
+    """
+    title = 'region'
+    parameter_name = 'region'
+
+    def lookups(self, request, model_admin):
+        timeout = getattr(settings, 'GALAMSEY_ADMIN_FILTER_CACHE_TIMEOUT', DEFAULT_ADMIN_FILTER_CACHE_TIMEOUT)
+        return cache.get_or_set(REGION_FILTER_KEY, lambda: list(Region.objects.order_by('Name').values_list('id', 'Name')), timeout)
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        if not self.value().isdigit():
+            return queryset.none()
+        return queryset.filter(Region_id=int(self.value()))
 
 # Register the User model if not already registered
 if not admin.site.is_registered(User):
@@ -12,10 +86,68 @@ class UploadedFileAdmin(admin.ModelAdmin):
     list_display = ('id', 'FileName', 'DateUploaded')
     search_fields = ('FileName',)
     list_filter = ('DateUploaded',)
+    actions = ['purge_in_background']
+
+    def get_actions(self, request):
+        # Deleting a file through the ORM collects all of its records in Python
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def has_delete_permission(self, request, obj=None):
+        # Single files are purged through the action as well
+        return False if obj is not None else super().has_delete_permission(request, obj)
 
-# Register SiteRecords model
+    @admin.action(description='Purge selected files in the background', permissions=['delete'])
+    def purge_in_background(self, request, queryset):
+        file_ids = list(queryset.values_list('id', flat=True))
+        transaction.on_commit(lambda: submit(purge_files, file_ids))
+        self.message_user(request, f"{len(file_ids)} file(s) are being purged in the background.", messages.SUCCESS)
+
+# Register SiteRecords model, built for tables of tens of millions of rows
 @admin.register(SiteRecords)
 class SiteRecordsAdmin(admin.ModelAdmin):
     list_display = ('id', 'Town', 'Region', 'Number_of_Galamsay_Sites', 'FileID')
-    search_fields = ('Town', 'Region')
-    list_filter = ('Region',)
+    list_select_related = ('Town', 'Region', 'FileID')
+    search_fields = ('Town__Name', 'Region__Name')
+    list_filter = (CachedRegionFilter,)
+    raw_id_fields = ('Town', 'FileID')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['delete_in_background']
+
+    def get_actions(self, request):
+        # The stock delete action loads every selected record to confirm it
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Match the search against the small Town and Region tables first, then
+        filter the records by the matching (indexed) ids instead of joining.
+        """
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        town_ids = Town.objects.filter(Name__icontains=search_term).values_list('id', flat=True)
+        region_ids = Region.objects.filter(Name__icontains=search_term).values_list('id', flat=True)
+        return queryset.filter(Q(Town_id__in=list(town_ids)) | Q(Region_id__in=list(region_ids))), False
+
+    @admin.action(description='Delete selected site records in the background')
+    def delete_in_background(self, request, queryset):
+        # Only the query is handed over: the records are never loaded in the request
+        transaction.on_commit(lambda: submit(delete_records_and_refresh, queryset.order_by()))
+        self.message_user(request, "The selected site records are being deleted in the background.", messages.SUCCESS)
+
+# Register the Region and Town lookup tables
+@admin.register(Region, Town)
+class DimensionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'Name')
+    search_fields = ('Name',)
+
+# Register UploadJob model
+@admin.register(UploadJob)
+class UploadJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'FileName', 'Status', 'RowsInserted', 'RowsRejected', 'DateCreated', 'DateFinished')
+    list_filter = ('Status',)
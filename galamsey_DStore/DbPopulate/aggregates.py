@@ -0,0 +1,219 @@
+"""
+Precomputed per-region aggregates.
+
+The analytic endpoints read RegionAggregate rows (one per region) instead of
+grouping SiteRecords on every request. They are built when a file is ingested
+and rebuilt whenever its records change (in-place updates, deletes); reads
+never write them, so files from before aggregates existed are grouped from
+their SiteRecords until backfill_region_aggregates has run.
+"""
+from django.db import transaction
+from django.db.models import Count, Exists, Max, Min, OuterRef, Sum
+
+from .models import Region, RegionAggregate, SiteRecords
+from .snapshots import open_snapshot, snapshots_enabled
+
+
+class RegionAccumulator:
+    """
+    Collects region totals, keyed by Region id, while rows are being ingested.
+    """
+
+    def __init__(self):
+        self.regions = {}
+
+    def add(self, region, sites):
+        totals = self.regions.get(region)
+        if totals is None:
+            self.regions[region] = [1, sites, sites, sites]
+        else:
+            totals[0] += 1
+            totals[1] += sites
+            if sites < totals[2]:
+                totals[2] = sites
+            if sites > totals[3]:
+                totals[3] = sites
+
+    def save(self, uploaded_file):
+        RegionAggregate.objects.bulk_create([
+            RegionAggregate(
+                FileID=uploaded_file,
+                Region_id=region_id,
+                RecordCount=count,
+                TotalSites=total,
+                MinSites=lowest,
+                MaxSites=highest
+            )
+            for region_id, (count, total, lowest, highest) in self.regions.items()
+        ])
+
+
+def region_groups(file_ids):
+    """
+    Per-region (FileID, Region id, Region name, count, total, lowest, highest)
+    of files, grouped from their SiteRecords.
+    """
+    return (
+        SiteRecords.objects
+        .filter(FileID__in=file_ids)
+        .values('FileID', 'Region', 'Region__Name')
+        .annotate(
+            count=Count('id'),
+            total=Sum('Number_of_Galamsay_Sites'),
+            lowest=Min('Number_of_Galamsay_Sites'),
+            highest=Max('Number_of_Galamsay_Sites')
+        )
+        .order_by()
+        .values_list('FileID', 'Region', 'Region__Name', 'count', 'total', 'lowest', 'highest')
+    )
+
+
+def grouped_region_stats(file_ids):
+    """
+    Unsaved RegionAggregate objects of files, grouped from their SiteRecords
+    without writing anything, for files whose aggregates are not built yet
+    (see the backfill_region_aggregates command). Returns {file id: [aggregates]},
+    each list ordered by Region name.
+    """
+    stats = {file_id: [] for file_id in file_ids}
+    if not stats:
+        return stats
+    for file_id, region_id, region, count, total, lowest, highest in sorted(region_groups(file_ids), key=lambda group: group[2]):
+        stats[file_id].append(RegionAggregate(
+            FileID_id=file_id,
+            Region=Region(id=region_id, Name=region),
+            RecordCount=count,
+            TotalSites=total,
+            MinSites=lowest,
+            MaxSites=highest
+        ))
+    return stats
+
+
+def build_region_aggregates(uploaded_file):
+    """
+    (Re)compute the aggregates of a file from its SiteRecords.
+    """
+    accumulator = RegionAccumulator()
+    for _, region_id, _, count, total, lowest, highest in region_groups([uploaded_file.id]):
+        accumulator.regions[region_id] = [count, total, lowest, highest]
+
+    with transaction.atomic():
+        RegionAggregate.objects.filter(FileID=uploaded_file).delete()
+        accumulator.save(uploaded_file)
+
+
+def region_aggregates(uploaded_file):
+    """
+    Aggregates of a file ordered by Region name. Files uploaded before aggregates
+    existed are grouped from their SiteRecords, read-only.
+    """
+    aggregates = list(RegionAggregate.objects.filter(FileID=uploaded_file).select_related('Region').order_by('Region__Name'))
+    if not aggregates:
+        return grouped_region_stats([uploaded_file.id])[uploaded_file.id]
+    return aggregates
+
+
+def region_stats(uploaded_file):
+    """
+    Per-region statistics of a file as RegionAggregate objects ordered by Region name,
+    computed from its columnar snapshot when that backend is enabled.
+    """
+    snapshot = open_snapshot(uploaded_file) if snapshots_enabled() else None
+    if snapshot is None:
+        return region_aggregates(uploaded_file)
+    return [
+        RegionAggregate(
+            FileID=uploaded_file,
+            Region=Region(Name=region),
+            RecordCount=count,
+            TotalSites=total,
+            MinSites=lowest,
+            MaxSites=highest
+        )
+        for region, (count, total, lowest, highest) in sorted(snapshot.region_stats().items())
+    ]
+
+
+def region_stats_by_file(files):
+    """
+    RegionAggregate objects of several files, ordered by Region name, read in
+    a single query. Returns {file id: [aggregates]}.
+    """
+    files = list(files)
+    stats = {uploaded_file.id: [] for uploaded_file in files}
+    aggregates = (
+        RegionAggregate.objects
+        .filter(FileID__in=list(stats))
+        .select_related('Region')
+        .order_by('Region__Name')
+    )
+    for aggregate in aggregates:
+        stats[aggregate.FileID_id].append(aggregate)
+    # Files without aggregates yet are grouped read-only
+    stats.update(grouped_region_stats([file_id for file_id, file_stats in stats.items() if not file_stats]))
+    return stats
+
+
+def cross_file_region_stats(files, limit=None):
+    """
+    Per-region totals and per-file trends over many files, read from their
+    aggregates in a single query. Files without aggregates yet (see the
+    backfill_region_aggregates command) are grouped from their SiteRecords
+    instead, without writing anything. Returns (files, regions, trends);
+    raises ValueError when more than limit files match.
+    """
+    files = (
+        files
+        .annotate(has_aggregates=Exists(RegionAggregate.objects.filter(FileID=OuterRef('pk'))))
+        .order_by('DateUploaded', 'id')
+    )
+    files = list(files[:limit + 1] if limit else files)
+    if limit and len(files) > limit:
+        raise ValueError(f"At most {limit} files per request; narrow file_ids or the date range")
+
+    rows = list(
+        RegionAggregate.objects
+        .filter(FileID__in=[uploaded_file.id for uploaded_file in files if uploaded_file.has_aggregates])
+        .values_list('FileID', 'Region', 'Region__Name', 'RecordCount', 'TotalSites')
+    )
+    without_aggregates = [uploaded_file.id for uploaded_file in files if not uploaded_file.has_aggregates]
+    if without_aggregates:
+        rows.extend(
+            SiteRecords.objects
+            .filter(FileID__in=without_aggregates)
+            .values('FileID', 'Region', 'Region__Name')
+            .annotate(count=Count('id'), total=Sum('Number_of_Galamsay_Sites'))
+            .order_by()
+            .values_list('FileID', 'Region', 'Region__Name', 'count', 'total')
+        )
+    positions = {uploaded_file.id: position for position, uploaded_file in enumerate(files)}
+    names = {}
+    totals = {}
+    trends = []
+    for file_id, region_id, region, count, total in rows:
+        names[region_id] = region
+        region_totals = totals.setdefault(region_id, [0, 0, 0])
+        region_totals[0] += count
+        region_totals[1] += total
+        region_totals[2] += 1
+        trends.append({
+            "Region": region,
+            "FileID": file_id,
+            "total_sites": total,
+            "average_sites": total / count
+        })
+    trends.sort(key=lambda trend: (trend["Region"], positions[trend["FileID"]]))
+
+    regions = [
+        {
+            "Region": names[region_id],
+            "total_sites": total,
+            "record_count": count,
+            "average_sites": total / count,
+            "file_count": file_count
+        }
+        for region_id, (count, total, file_count) in totals.items()
+    ]
+    regions.sort(key=lambda region: region["Region"])
+    return files, regions, trends
@@ -0,0 +1,156 @@
+"""
+Async versions of the read endpoints, served under api/async/.
+
+Under an ASGI server (e.g. `uvicorn galamsey_DStore.asgi:application`) they
+wait on the database through Django's async ORM instead of holding a worker
+thread, so one process can serve many slow dashboard clients at once. The
+responses carry the same data as the synchronous views.
+"""
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from .models import RegionAggregate, SiteRecords, UploadedFile
+from .routers import reads_from_reader
+from .renderers import FastJSONRenderer
+from .streaming import aiter_row_chunks, astream_rows, row_builder
+from .views import DEFAULT_SITE_DATA_PAGE_SIZE, SITE_DATA_FIELDS
+
+
+def json_response(data, status=200):
+    # Same bytes as the DRF views render
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def aget_file(file_id):
+    try:
+        return await UploadedFile.objects.aget(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return None
+
+
+async def aregion_totals(uploaded_file):
+    """
+    (Region, RecordCount, TotalSites) of every region of a file, ordered by Region
+    name. Read from its precomputed aggregates, or grouped from its SiteRecords
+    for files that do not have them yet.
+    """
+    aggregates = (
+        RegionAggregate.objects
+        .filter(FileID=uploaded_file)
+        .order_by('Region__Name')
+        .values_list('Region__Name', 'RecordCount', 'TotalSites')
+    )
+    totals = [row async for row in aggregates]
+    if totals:
+        return totals
+
+    groups = (
+        SiteRecords.objects
+        .filter(FileID=uploaded_file)
+        .values('Region')
+        .annotate(count=Count('id'), total=Sum('Number_of_Galamsay_Sites'))
+        .order_by('Region__Name')
+        .values_list('Region__Name', 'count', 'total')
+    )
+    return [row async for row in groups]
+
+
+# 1. All sites that were recorded (GET api/async/getsitedata [FileID])
+@require_GET
+@reads_from_reader
+async def get_site_data(request, file_id):
+    """
+    Retrieve all site records for a specific file.
+    Accepts the same ?stream= and ?cursor=&page_size= parameters as api/getsitedata.
+    """
+    uploaded_file = await aget_file(file_id)
+    if uploaded_file is None:
+        return json_response({"error": "File not found"}, status=404)
+
+    sites = SiteRecords.objects.filter(FileID=uploaded_file).order_by('id')
+
+    stream = request.GET.get('stream')
+    if stream:
+        # Streams are read after the view returns: pin the connection chosen now
+        return astream_rows(sites.using(sites.db), SITE_DATA_FIELDS, ndjson=(stream == 'ndjson'))
+
+    if 'cursor' in request.GET or 'page_size' in request.GET:
+        return await get_site_data_page(request, sites)
+
+    records = []
+    async for chunk in aiter_row_chunks(sites, SITE_DATA_FIELDS):
+        records.extend(chunk)
+    return json_response(records)
+
+
+async def get_site_data_page(request, sites):
+    max_page_size = getattr(settings, 'GALAMSEY_SITE_DATA_MAX_PAGE_SIZE', DEFAULT_SITE_DATA_PAGE_SIZE)
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+        page_size = int(request.GET.get('page_size', max_page_size))
+    except ValueError:
+        return json_response({"error": "cursor and page_size must be integers"}, status=400)
+    page_size = max(1, min(page_size, max_page_size))
+
+    rows = sites.filter(id__gt=cursor).values_list(*SITE_DATA_FIELDS.values())[:page_size + 1]
+    build = row_builder(tuple(SITE_DATA_FIELDS))
+    page = [build(row) async for row in rows]
+    next_cursor = None
+    next_url = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = page[-1]['id']
+        query = request.GET.copy()
+        query['cursor'] = next_cursor
+        query['page_size'] = page_size
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+
+    return json_response({"results": page, "next_cursor": next_cursor, "next": next_url})
+
+
+# 2. Average sites per region (GET api/async/averagesitesperregion [FileID])
+@require_GET
+@reads_from_reader
+async def average_sites_per_region(request, file_id):
+    uploaded_file = await aget_file(file_id)
+    if uploaded_file is None:
+        return json_response({"error": "File not found"}, status=404)
+
+    return json_response([
+        {"Region": region, "average_sites": total / count}
+        for region, count, total in await aregion_totals(uploaded_file)
+    ])
+
+
+# 3. Sites above a threshold (GET api/async/sitesabovethreshold [FileID] [threshold])
+@require_GET
+@reads_from_reader
+async def sites_above_threshold(request, file_id, threshold):
+    uploaded_file = await aget_file(file_id)
+    if uploaded_file is None:
+        return json_response({"error": "File not found"}, status=404)
+
+    region_totals = [
+        {"Region": region, "total_sites": total}
+        for region, count, total in await aregion_totals(uploaded_file)
+        if total > threshold
+    ]
+    if not region_totals:
+        return json_response({"message": "No regions exceed the threshold"}, status=404)
+    return json_response(region_totals)
+
+
+# 4. Region with Highest number of Sites (GET api/async/regionwithhighestsite [FileID])
+@require_GET
+@reads_from_reader
+async def region_with_highest_site(request, file_id):
+    uploaded_file = await aget_file(file_id)
+    if uploaded_file is None:
+        return json_response({"error": "File not found"}, status=404)
+
+    highest = max(await aregion_totals(uploaded_file), key=lambda row: row[2], default=None)
+    if highest is None:
+        return json_response({"error": "No records found"}, status=404)
+    return json_response({"Region": highest[0], "total_sites": highest[2]})
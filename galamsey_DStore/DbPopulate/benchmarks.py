@@ -0,0 +1,328 @@
+"""
+Benchmark harness for ingestion and the API endpoints.
+
+Synthetic CSVs shaped like galamsey_dataset/galamsay_data.csv are uploaded
+through the API, then every endpoint is timed. Results are plain dicts so the
+benchmark command can save them as JSON and runs can be compared across
+commits.
+"""
+import gc
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import django
+from django.core.cache import cache
+from django.db import connection, connections
+from django.test import Client
+
+from .exports import delete_exports
+from .ranking import clear_rankings
+
+GHANA_REGIONS = [
+    'Ahafo', 'Ashanti', 'Bono', 'Bono East', 'Central', 'Eastern', 'Greater Accra', 'North East',
+    'Northern', 'Oti', 'Savannah', 'Upper East', 'Upper West', 'Volta', 'Western', 'Western North',
+]
+
+
+def generate_csv(path, rows, regions=16, towns=1000, seed=0, dirty_ratio=0.0):
+    """
+    Write a CSV of `rows` data lines with the given region and town cardinality.
+    A dirty_ratio share of the lines is made invalid the way the sample file is.
+    """
+    rng = random.Random(seed)
+    region_names = GHANA_REGIONS[:regions] if regions <= len(GHANA_REGIONS) else [
+        f"Region {number}" for number in range(regions)
+    ]
+    # Every town belongs to one region, like real data
+    town_regions = [(f"Town {number}", region_names[number % len(region_names)]) for number in range(towns)]
+    dirty_lines = [',Ashanti,10', 'Unknown City,,15', 'Tamale,Northern,abc', 'Ho,Volta,eleven']
+
+    with open(path, 'w', encoding='utf-8', newline='') as handle:
+        handle.write('Town,Region,Number_of_Galamsay_Sites\n')
+        lines = []
+        for _ in range(rows):
+            if dirty_ratio and rng.random() < dirty_ratio:
+                lines.append(rng.choice(dirty_lines))
+            else:
+                town, region = town_regions[rng.randrange(towns)]
+                lines.append(f"{town},{region},{rng.randint(0, 50)}")
+            if len(lines) >= 10000:
+                handle.write('\n'.join(lines) + '\n')
+                lines = []
+        if lines:
+            handle.write('\n'.join(lines) + '\n')
+    return path
+
+
+def percentiles(samples):
+    """
+    p50/p95/p99/mean/max of latency samples in seconds, reported in milliseconds.
+    """
+    ordered = sorted(samples)
+
+    def nearest_rank(percentile):
+        return ordered[max(0, min(len(ordered) - 1, round(percentile / 100 * len(ordered)) - 1))]
+
+    return {
+        'p50_ms': round(nearest_rank(50) * 1000, 3),
+        'p95_ms': round(nearest_rank(95) * 1000, 3),
+        'p99_ms': round(nearest_rank(99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def peak_rss_kb():
+    """
+    High-water mark of the process's resident memory, so far.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # macOS reports bytes
+
+
+def peak_rss_of(fn):
+    """
+    Run fn() in a forked child and return the child's peak RSS in KB, so the
+    figure covers that one call rather than everything the benchmark did
+    before it. None where fork() is not available or fn() fails.
+    """
+    if not hasattr(os, 'fork'):
+        return None
+    # The child must not share the parent's database connections; both reconnect
+    connections.close_all()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        status = 1
+        try:
+            fn()
+            os.write(write_fd, str(peak_rss_kb()).encode())
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as pipe:
+        output = pipe.read()
+    os.waitpid(pid, 0)
+    return int(output) if output else None
+
+
+def consume(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def reset_caches(file_id=None):
+    cache.clear()
+    clear_rankings()
+    if file_id is not None:
+        delete_exports(file_id)
+
+
+def time_endpoint(client, url, iterations, cold=True, data=None, file_id=None):
+    """
+    Time GET url (or a JSON POST of data) `iterations` times. Cold runs clear
+    the response cache, rankings and the file's spooled exports before every
+    request.
+    """
+    def request():
+        if data is not None:
+            return client.post(url, data, content_type='application/json')
+        return client.get(url)
+
+    samples = []
+    size = status = None
+    for _ in range(iterations):
+        if cold:
+            reset_caches(file_id)
+        started = time.perf_counter()
+        response = request()
+        size = consume(response)
+        samples.append(time.perf_counter() - started)
+        status = response.status_code
+
+    # One more run under tracemalloc for the peak Python allocation of a request
+    if cold:
+        reset_caches(file_id)
+    gc.collect()
+    tracemalloc.start()
+    consume(request())
+    peak_alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # And one in a child process for the peak RSS of a request
+    if cold:
+        reset_caches(file_id)
+    peak_rss = peak_rss_of(lambda: consume(request()))
+
+    result = {'url': url, 'status': status, 'iterations': iterations, 'response_bytes': size}
+    result.update(percentiles(samples))
+    result['peak_alloc_kb'] = peak_alloc // 1024
+    result['peak_rss_kb'] = peak_rss
+    return result
+
+
+def time_upload(client, path):
+    """
+    Upload a CSV through the API and report its throughput.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as handle:
+        started = time.perf_counter()
+        response = client.post('/api/upload/', {'file': handle})
+        elapsed = time.perf_counter() - started
+    data = response.json()
+    rows = data.get('RowsAccepted', 0)
+    return data.get('FileID'), {
+        'status': response.status_code,
+        'bytes': size,
+        'rows_accepted': rows,
+        'rows_rejected': data.get('RowsRejected', 0),
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed, 1) if elapsed else None,
+        'mb_per_second': round(size / elapsed / 1e6, 3) if elapsed else None,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def endpoint_urls(file_id, job_id):
+    """
+    Every GET endpoint in DbPopulate/urls.py, with arguments for the benchmarked file.
+    """
+    return {
+        'api-root': '/api/',
+        'uploaded-files-list': '/api/uploadedfiles/',
+        'get-site-data': f'/api/getsitedata/{file_id}/',
+        'get-site-data-page': f'/api/getsitedata/{file_id}/?page_size=1000',
+        'get-site-data-stream': f'/api/getsitedata/{file_id}/?stream=1',
+        'average-sites-per-region': f'/api/averagesitesperregion/{file_id}/',
+        'sites-above-threshold': f'/api/sitesabovethreshold/{file_id}/5/',
+        'region-with-highest-site': f'/api/regionwithhighestsite/{file_id}/',
+        'ranking-regions': f'/api/ranking/{file_id}/?metric=avg&top=5',
+        'ranking-towns': f'/api/ranking/{file_id}/?by=town&above=45',
+        'summary': f'/api/summary/{file_id}/',
+        'export-file': f'/api/export/{file_id}/?fmt=csv',
+        'region-trends': f'/api/regiontrends/?file_ids={file_id}',
+        'async-get-site-data': f'/api/async/getsitedata/{file_id}/',
+        'async-average-sites-per-region': f'/api/async/averagesitesperregion/{file_id}/',
+        'async-sites-above-threshold': f'/api/async/sitesabovethreshold/{file_id}/5/',
+        'async-region-with-highest-site': f'/api/async/regionwithhighestsite/{file_id}/',
+        'upload-job-status': f'/api/uploadjobs/{job_id}/',
+        'response-cache-stats': '/api/cachestats/',
+    }
+
+
+def endpoint_posts(file_id):
+    """
+    The POST endpoints in DbPopulate/urls.py, other than the upload, with their JSON bodies.
+    """
+    return {
+        'summaries': ('/api/summary/', {'file_ids': [file_id]}),
+    }
+
+
+def time_serialization(file_id, iterations=3):
+    """
+    Time building a file's full site data response body two ways: DRF's
+    SiteRecordsSerializer and JSONRenderer over model instances, and
+    values_list() rows with FastJSONRenderer. Best of `iterations`, with
+    the cost of each phase also scaled to 100k rows.
+    """
+    from rest_framework.renderers import JSONRenderer
+    from .models import SiteRecords
+    from .renderers import FastJSONRenderer
+    from .serializers import SiteRecordsSerializer
+    from .streaming import build_rows
+    from .views import SITE_DATA_FIELDS
+
+    sites = SiteRecords.objects.filter(FileID_id=file_id).order_by('id')
+    rows = sites.count()
+    paths = {
+        'serializer': (
+            lambda: SiteRecordsSerializer(sites.select_related('Town', 'Region'), many=True).data,
+            JSONRenderer(),
+        ),
+        'values_list': (
+            lambda: build_rows(sites.values_list(*SITE_DATA_FIELDS.values()), SITE_DATA_FIELDS),
+            FastJSONRenderer(),
+        ),
+    }
+
+    results = {'rows': rows}
+    bodies = {}
+    for name, (build, renderer) in paths.items():
+        build_samples, render_samples = [], []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            data = build()
+            built = time.perf_counter()
+            bodies[name] = renderer.render(data)
+            build_samples.append(built - started)
+            render_samples.append(time.perf_counter() - built)
+        build_seconds, render_seconds = min(build_samples), min(render_samples)
+        per_100k = 100000 / rows * 1000 if rows else 0
+        results[name] = {
+            'build_ms': round(build_seconds * 1000, 1),
+            'render_ms': round(render_seconds * 1000, 1),
+            'build_ms_per_100k_rows': round(build_seconds * per_100k, 1),
+            'render_ms_per_100k_rows': round(render_seconds * per_100k, 1),
+            'total_ms_per_100k_rows': round((build_seconds + render_seconds) * per_100k, 1),
+            'bytes': len(bodies[name]),
+        }
+    results['identical_output'] = bodies['serializer'] == bodies['values_list']
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_dataset(path, rows, iterations, skip=()):
+    """
+    Upload one dataset and time every endpoint against it, cold and warm.
+    """
+    from .models import UploadJob
+
+    client = Client()
+    file_id, upload = time_upload(client, path)
+    job = UploadJob.objects.create(FileName=os.path.basename(path), StoredPath='', FileID_id=file_id)
+
+    requests = {name: (url, None) for name, url in endpoint_urls(file_id, job.id).items()}
+    requests.update(endpoint_posts(file_id))
+    endpoints = {}
+    for name, (url, data) in requests.items():
+        if name in skip:
+            continue
+        endpoints[name] = {
+            'cold': time_endpoint(client, url, iterations, cold=True, data=data, file_id=file_id),
+            'warm': time_endpoint(client, url, iterations, cold=False, data=data, file_id=file_id),
+        }
+    serialization = time_serialization(file_id) if 'serialization' not in skip else None
+    return {'rows': rows, 'file': os.path.basename(path), 'upload': upload, 'endpoints': endpoints,
+            'serialization': serialization}
+
+
+def environment():
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'database': connection.vendor,
+    }
@@ -0,0 +1,60 @@
+"""
+Bulk writes of new SiteRecords.
+
+On PostgreSQL a batch is streamed with COPY FROM STDIN, which skips the
+per-statement parsing and planning of INSERTs; other databases get batched
+multi-row INSERTs through bulk_create.
+"""
+import io
+
+from django.conf import settings
+from django.db import connections, router
+
+from .models import SiteRecords
+
+# Columns written for a new record, in COPY order
+COPY_FIELDS = ('Town', 'Region', 'Number_of_Galamsay_Sites', 'FileID', 'RowNumber')
+
+
+def copy_enabled(connection):
+    return connection.vendor == 'postgresql' and getattr(settings, 'GALAMSEY_POSTGRES_COPY', True)
+
+
+def insert_records(records, batch_size):
+    """
+    Insert new (unsaved) SiteRecords.
+    """
+    connection = connections[router.db_for_write(SiteRecords)]
+    if copy_enabled(connection):
+        copy_records(connection, records)
+    else:
+        SiteRecords.objects.bulk_create(records, batch_size=batch_size)
+
+
+def copy_statement(connection):
+    opts = SiteRecords._meta
+    columns = ', '.join(connection.ops.quote_name(opts.get_field(name).column) for name in COPY_FIELDS)
+    return f'COPY {connection.ops.quote_name(opts.db_table)} ({columns}) FROM STDIN'
+
+
+def copy_rows(records):
+    for record in records:
+        yield (record.Town_id, record.Region_id, record.Number_of_Galamsay_Sites, record.FileID_id, record.RowNumber)
+
+
+def copy_records(connection, records):
+    """
+    COPY records into the SiteRecords table, with psycopg 3 or psycopg2.
+    """
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy'):
+            with raw.copy(copy_statement(connection)) as copy:
+                for row in copy_rows(records):
+                    copy.write_row(row)
+        else:
+            # Every column is an integer or NULL, so no text escaping is needed
+            raw.copy_expert(copy_statement(connection), io.StringIO(''.join(
+                '\t'.join(r'\N' if value is None else str(value) for value in row) + '\n'
+                for row in copy_rows(records)
+            )))
@@ -0,0 +1,175 @@
+"""
+Response cache for the per-file read endpoints.
+
+Entries are keyed by (endpoint, file_id, params) and by a per-file version
+token, so re-uploading or deleting a file invalidates every cached answer
+for it at once. Responses carry an ETag and Last-Modified taken from the
+file, letting clients revalidate with a 304. Concurrent misses for the same
+entry are coalesced, so a burst of identical requests runs the view once.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from .coalescing import coalesce, coalescing_enabled, get_wait, wait_for_result
+from .models import UploadedFile
+
+VERSION_KEY = 'galamsey:file:{}:version'
+DATE_KEY = 'galamsey:file:{}:{}:date'
+RESPONSE_KEY = 'galamsey:response:{}:{}:{}:{}'
+STATS_KEY = 'galamsey:responsecache:{}'
+LOCK_KEY = 'galamsey:lock:{}'
+
+DEFAULT_TIMEOUT = 60 * 60
+DEFAULT_MAX_ROWS = 10000
+
+
+def get_cache():
+    return caches[getattr(settings, 'GALAMSEY_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'GALAMSEY_RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def file_version(file_id):
+    cache = get_cache()
+    version = cache.get(VERSION_KEY.format(file_id))
+    if version is None:
+        cache.add(VERSION_KEY.format(file_id), uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY.format(file_id))
+    return version
+
+
+def invalidate_file(file_id):
+    """
+    Drop every cached response of a file by moving it to a new version.
+    """
+    get_cache().set(VERSION_KEY.format(file_id), uuid.uuid4().hex, None)
+
+
+def file_date_modified(file_id, version):
+    """
+    DateModified of a file, cached alongside its responses. None if it does not exist.
+    """
+    cache = get_cache()
+    key = DATE_KEY.format(file_id, version)
+    date_modified = cache.get(key)
+    if date_modified is None:
+        date_modified = UploadedFile.objects.filter(id=file_id).values_list('DateModified', flat=True).first()
+        if date_modified is not None:
+            cache.set(key, date_modified, get_timeout())
+    return date_modified
+
+
+def record(outcome):
+    cache = get_cache()
+    key = STATS_KEY.format(outcome)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def cache_stats():
+    cache = get_cache()
+    hits = cache.get(STATS_KEY.format('hits'), 0)
+    misses = cache.get(STATS_KEY.format('misses'), 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else None,
+        "coalesced": cache.get(STATS_KEY.format('coalesced'), 0)
+    }
+
+
+def params_digest(request, view_kwargs):
+    params = sorted(view_kwargs.items()) + sorted(request.query_params.lists())
+    return hashlib.sha1(repr(params).encode('utf-8')).hexdigest()
+
+
+def cached_file_response(endpoint):
+    """
+    Cache successful responses of a view taking a file_id argument.
+    Goes beneath @api_view so the view still runs inside DRF.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, file_id, **kwargs):
+            version = file_version(file_id)
+            date_modified = file_date_modified(file_id, version)
+            if date_modified is None:
+                return view(request, file_id, **kwargs)  # Let the view report the missing file
+
+            digest = params_digest(request, kwargs)
+            etag = quote_etag(hashlib.sha1(f"{endpoint}:{file_id}:{version}:{digest}".encode('utf-8')).hexdigest())
+            last_modified = int(date_modified.timestamp())
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                cache = get_cache()
+                key = RESPONSE_KEY.format(endpoint, file_id, version, digest)
+                cached = cache.get(key)
+                if cached is not None:
+                    record('hits')
+                    response = Response(cached['data'], status=cached['status'])
+                elif coalescing_enabled():
+                    # Identical concurrent misses share one run of the view
+                    (shared, response), computed = coalesce(key, lambda: compute_response(view, request, file_id, kwargs, key))
+                    if computed and response is not None:
+                        record('misses')
+                    elif shared is not None:
+                        record('coalesced')
+                        response = Response(shared['data'], status=shared['status'])
+                    else:
+                        record('misses')
+                        response = view(request, file_id, **kwargs)
+                else:
+                    record('misses')
+                    response = compute_response(view, request, file_id, kwargs, key)[1]
+
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def compute_response(view, request, file_id, kwargs, key):
+    """
+    Run the view and cache its response. Returns (shareable data and status,
+    response); the response is None when another process computed the data.
+    """
+    cache = get_cache()
+    lock_key = LOCK_KEY.format(key)
+    locked = coalescing_enabled() and get_wait() > 0
+    if locked and not cache.add(lock_key, 1, get_wait()):
+        cached = wait_for_result(cache, key, lock_key)
+        if cached is not None:
+            return cached, None
+        locked = False
+    try:
+        response = view(request, file_id, **kwargs)
+        shared = None
+        if isinstance(response, Response):
+            shared = {'data': response.data, 'status': response.status_code}
+            if response.status_code == 200 and is_cacheable(response.data):
+                cache.set(key, shared, get_timeout())
+        return shared, response
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def is_cacheable(data):
+    max_rows = getattr(settings, 'GALAMSEY_RESPONSE_CACHE_MAX_ROWS', DEFAULT_MAX_ROWS)
+    return not isinstance(data, list) or len(data) <= max_rows
@@ -0,0 +1,86 @@
+"""
+Single-flight coalescing of identical concurrent computations.
+
+When many clients ask for the same uncached answer at once (typically the
+analytics of a file that has just been uploaded), only the first request in
+a process computes it; the others wait for that computation and share its
+result. Across processes, the first one to take a short-lived lock in the
+cache computes while the others poll the cache for its result, which only
+helps when the cache is shared between processes (e.g. the file backend).
+"""
+import time
+from threading import Event, Lock
+
+from django.conf import settings
+
+DEFAULT_WAIT = 10
+DEFAULT_POLL_INTERVAL = 0.05
+
+
+class Flight:
+    """
+    One in-flight computation that other callers can wait on.
+    """
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.failed = False
+
+
+_flights = {}
+_flights_lock = Lock()
+
+
+def coalescing_enabled():
+    return getattr(settings, 'GALAMSEY_COALESCE_REQUESTS', True)
+
+
+def get_wait():
+    return getattr(settings, 'GALAMSEY_COALESCE_WAIT', DEFAULT_WAIT)
+
+
+def coalesce(key, compute):
+    """
+    Run compute() once for all concurrent callers with the same key.
+    Returns (result, whether this caller computed it). Waiting callers
+    compute for themselves if the computation fails or takes too long.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        if flight.done.wait(get_wait()) and not flight.failed:
+            return flight.result, False
+        return compute(), True
+
+    try:
+        flight.result = compute()
+    except BaseException:
+        flight.failed = True
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+    return flight.result, True
+
+
+def wait_for_result(cache, key, lock_key):
+    """
+    Poll the cache for the result another process is computing, until it
+    appears, the other process lets go of its lock, or the wait runs out.
+    """
+    interval = getattr(settings, 'GALAMSEY_COALESCE_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    deadline = time.monotonic() + get_wait()
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        result = cache.get(key)
+        if result is not None:
+            return result
+        if cache.get(lock_key) is None:
+            return cache.get(key)
+    return None
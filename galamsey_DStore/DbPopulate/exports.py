@@ -0,0 +1,273 @@
+"""
+Bulk exports of a file's records as CSV, NDJSON or the columnar snapshot
+format, optionally gzip compressed.
+
+Records are read with a server-side `.iterator()` and encoded a chunk at a
+time. The first full download of an export is streamed to the client and
+written to a spool file as it goes; once an export is spooled it is served
+from disk with a Content-Length and HTTP Range support, so interrupted
+downloads can resume. Spool files are named after the upload they were
+made from, so a re-uploaded or updated file never serves a stale export;
+the spools of the old version are removed when an update is committed.
+
+A Range request for an export that is not spooled yet is answered with the
+whole export (200), spooled as it streams, rather than making the client
+wait for the spool. The columnar format needs every row before its header
+can be written, so it is always spooled first, within the request.
+"""
+import csv
+import glob
+import io
+import json
+import os
+import re
+import uuid
+import zlib
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+from .snapshots import SnapshotWriter
+from .streaming import get_stream_chunk_size
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+COLUMNAR = 'columnar'
+
+# Columns of an export, named like the CSV upload headers, and their lookups
+EXPORT_FIELDS = {
+    'Town': 'Town__Name',
+    'Region': 'Region__Name',
+    'Number_of_Galamsay_Sites': 'Number_of_Galamsay_Sites',
+}
+EXPORT_FORMATS = {
+    CSV: ('csv', 'text/csv; charset=utf-8'),
+    NDJSON: ('ndjson', 'application/x-ndjson'),
+    COLUMNAR: ('gcol', 'application/octet-stream'),
+}
+COMPRESSIONS = ('gzip',)
+FILE_CHUNK_SIZE = 256 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def export_dir():
+    return str(getattr(settings, 'GALAMSEY_EXPORT_DIR', os.path.join(settings.BASE_DIR, 'exports')))
+
+
+def export_name(uploaded_file, fmt, compress=None):
+    extension = EXPORT_FORMATS[fmt][0] + ('.gz' if compress else '')
+    return f"{os.path.splitext(uploaded_file.FileName)[0]}.{extension}"
+
+
+def spool_version(uploaded_file):
+    """
+    Name shared by every spooled export of the current version of a file, up to the extension.
+    """
+    return f"{uploaded_file.id}-{int(uploaded_file.DateModified.timestamp() * 1000000)}"
+
+
+def spool_path(uploaded_file, fmt, compress=None):
+    extension = EXPORT_FORMATS[fmt][0] + ('.gz' if compress else '')
+    return os.path.join(export_dir(), f"{spool_version(uploaded_file)}.{extension}")
+
+
+def delete_exports(file_id, keep=None):
+    """
+    Remove the spooled exports of a file; with keep (an uploaded file), only
+    those of its older versions, leaving spools being written alone.
+    """
+    for path in glob.glob(os.path.join(export_dir(), f"{file_id}-*")):
+        name = os.path.basename(path)
+        if keep is not None and (name.endswith('.tmp') or name.split('.')[0] == spool_version(keep)):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def export_rows(queryset):
+    chunk_size = get_stream_chunk_size()
+    return queryset.order_by('id').values_list(*EXPORT_FIELDS.values()).iterator(chunk_size=chunk_size)
+
+
+def iter_csv(rows):
+    chunk_size = get_stream_chunk_size()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_FIELDS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(rows):
+    chunk_size = get_stream_chunk_size()
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False, separators=(',', ':')))
+        if len(lines) >= chunk_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_export(queryset, fmt, compress=None):
+    """
+    Encoded chunks of a CSV or NDJSON export.
+    """
+    chunks = (iter_ndjson if fmt == NDJSON else iter_csv)(export_rows(queryset))
+    return iter_gzip(chunks) if compress else chunks
+
+
+def write_columnar(queryset, uploaded_file, path):
+    writer = SnapshotWriter(uploaded_file)
+    try:
+        for town, region, sites in export_rows(queryset):
+            writer.add(town, region, sites)
+        writer.write(path)
+    finally:
+        writer.discard()
+
+
+def spool_export(queryset, uploaded_file, fmt, compress=None):
+    """
+    Write an export to its spool file, unless it is there already. Returns its path.
+    """
+    path = spool_path(uploaded_file, fmt, compress)
+    if os.path.exists(path):
+        return path
+    os.makedirs(export_dir(), exist_ok=True)
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        if fmt == COLUMNAR:
+            write_columnar(queryset, uploaded_file, temporary_path)
+            if compress:
+                with open(temporary_path, 'rb') as source, open(f"{temporary_path}.gz", 'wb') as output:
+                    for data in iter_gzip(iter(lambda: source.read(FILE_CHUNK_SIZE), b'')):
+                        output.write(data)
+                os.replace(f"{temporary_path}.gz", temporary_path)
+        else:
+            with open(temporary_path, 'wb') as output:
+                for data in iter_export(queryset, fmt, compress):
+                    output.write(data)
+        os.replace(temporary_path, path)
+    finally:
+        for leftover in (temporary_path, f"{temporary_path}.gz"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return path
+
+
+def iter_spooling(chunks, path):
+    """
+    Pass chunks through while writing them to the spool file; the spool is
+    only kept if every chunk was sent.
+    """
+    os.makedirs(export_dir(), exist_ok=True)
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporary_path, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                yield chunk
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def iter_file(path, start, length):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        while length > 0:
+            data = handle.read(min(FILE_CHUNK_SIZE, length))
+            if not data:
+                return
+            length -= len(data)
+            yield data
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single `bytes=` range, inclusive; None for headers that
+    are ignored (multiple ranges, other units); raises ValueError if unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1  # Suffix: the last N bytes
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+def export_response(request, queryset, uploaded_file, fmt, compress=None):
+    """
+    Response serving an export, from its spool file when there is one.
+    """
+    content_type = 'application/gzip' if compress else EXPORT_FORMATS[fmt][1]
+    etag = quote_etag(os.path.basename(spool_path(uploaded_file, fmt, compress)))
+    last_modified = int(uploaded_file.DateModified.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    path = spool_path(uploaded_file, fmt, compress)
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag:
+        range_header = None  # The client's partial copy is of another version
+
+    if not os.path.exists(path) and fmt == COLUMNAR:
+        spool_export(queryset, uploaded_file, fmt, compress)
+
+    if os.path.exists(path):
+        size = os.path.getsize(path)
+        byte_range = None
+        if range_header:
+            try:
+                byte_range = parse_range(range_header, size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+        if byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(iter_file(path, start, end - start + 1), status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = end - start + 1
+        else:
+            response = StreamingHttpResponse(iter_file(path, 0, size), content_type=content_type)
+            response['Content-Length'] = size
+    else:
+        response = StreamingHttpResponse(iter_spooling(iter_export(queryset, fmt, compress), path), content_type=content_type)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Content-Disposition'] = content_disposition_header(True, export_name(uploaded_file, fmt, compress))
+    return response
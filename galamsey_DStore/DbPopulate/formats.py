@@ -0,0 +1,301 @@
+"""
+Upload formats other than plain CSV.
+
+An upload may be gzip or zstd compressed (zstd needs the `zstandard`
+package), and may hold CSV, newline-delimited JSON objects with Town, Region
+and Number_of_Galamsay_Sites keys, or a Parquet table with those columns
+(needs `pyarrow`). The format is picked from the file extension, e.g.
+`.ndjson.gz`, falling back to the upload's content type, then to CSV.
+
+Compressed uploads are decompressed chunk by chunk and Parquet tables are
+read a row group batch at a time, so no format is held in memory whole.
+Every format yields the same (line number, Town, Region, sites) records and
+reports rejected rows the same way as CSV; Parquet rows are numbered from 1.
+"""
+import json
+import os
+import zlib
+
+from .parsing import iter_lines, iter_parsed_rows, parse_row
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - exercised when zstandard is not installed
+    zstandard = None
+
+try:
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - exercised when pyarrow is not installed
+    pyarrow = None
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+PARQUET = 'parquet'
+GZIP = 'gzip'
+ZSTD = 'zstd'
+
+FIELDS = ('Town', 'Region', 'Number_of_Galamsay_Sites')
+
+FORMAT_EXTENSIONS = {'.csv': CSV, '.txt': CSV, '.ndjson': NDJSON, '.jsonl': NDJSON, '.parquet': PARQUET}
+COMPRESSION_EXTENSIONS = {'.gz': GZIP, '.gzip': GZIP, '.zst': ZSTD, '.zstd': ZSTD}
+FORMAT_CONTENT_TYPES = {
+    'text/csv': CSV,
+    'application/csv': CSV,
+    'application/x-ndjson': NDJSON,
+    'application/jsonl': NDJSON,
+    'application/vnd.apache.parquet': PARQUET,
+    'application/x-parquet': PARQUET,
+}
+COMPRESSION_CONTENT_TYPES = {
+    'application/gzip': GZIP,
+    'application/x-gzip': GZIP,
+    'application/zstd': ZSTD,
+}
+
+# Most bytes a compressed chunk may expand to in one step
+MAX_DECOMPRESSED_CHUNK = 1024 * 1024
+PARQUET_BATCH_ROWS = 64 * 1024
+
+
+class UploadFormatError(ValueError):
+    """
+    An upload that cannot be read in its format, e.g. corrupt gzip data.
+    """
+
+
+class UnsupportedFormat(UploadFormatError):
+    """
+    An upload format whose optional library is not installed.
+    """
+
+
+def upload_format(file_obj):
+    """
+    (format, compression or None) of an upload.
+    """
+    name, extension = os.path.splitext(os.path.basename(file_obj.name or '').lower())
+    content_type = (getattr(file_obj, 'content_type', None) or '').split(';')[0].strip().lower()
+
+    compression = COMPRESSION_EXTENSIONS.get(extension)
+    if compression:
+        extension = os.path.splitext(name)[1]
+    else:
+        compression = COMPRESSION_CONTENT_TYPES.get(content_type)
+    file_format = FORMAT_EXTENSIONS.get(extension) or FORMAT_CONTENT_TYPES.get(content_type) or CSV
+    return file_format, compression
+
+
+def is_plain_csv(file_obj):
+    return upload_format(file_obj) == (CSV, None)
+
+
+def iter_gunzip(chunks):
+    # Concatenated gzip members are read one after another, like gzip(1) does
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    started = False
+    try:
+        for chunk in chunks:
+            while chunk:
+                started = True
+                data = decompressor.decompress(chunk, MAX_DECOMPRESSED_CHUNK)
+                if data:
+                    yield data
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+                    started = False
+                else:
+                    chunk = decompressor.unconsumed_tail
+        data = decompressor.flush()
+        if data:
+            yield data
+        if not decompressor.eof and started:
+            raise UploadFormatError("Invalid gzip data: the file is truncated")
+    except zlib.error as e:
+        raise UploadFormatError(f"Invalid gzip data: {e}") from e
+
+
+class ZstdFrameTracker:
+    """
+    Follows the frame and block headers of a zstd stream as it is read, to
+    tell whether it ends on a frame boundary: the decompressor's stream
+    reader returns what it has when its input runs out, without saying
+    whether the last frame was complete.
+    """
+
+    def __init__(self):
+        self.buffer = b''
+        self.skip = 0  # Bytes of block content, checksum or skippable frame still to come
+        self.state = 'magic'
+        self.has_checksum = False
+
+    @property
+    def at_boundary(self):
+        return self.state == 'magic' and not self.skip and not self.buffer
+
+    def feed(self, data):
+        self.buffer += data
+        while True:
+            if self.skip:
+                skipped = min(self.skip, len(self.buffer))
+                self.buffer = self.buffer[skipped:]
+                self.skip -= skipped
+                if self.skip:
+                    return
+            needed = self.header_size()
+            if needed is None or len(self.buffer) < needed:
+                return
+            header, self.buffer = self.buffer[:needed], self.buffer[needed:]
+            self.parse(header)
+
+    def header_size(self):
+        if self.state == 'magic':
+            return 4
+        if self.state == 'skippable':
+            return 4
+        if self.state == 'frame':
+            if not self.buffer:
+                return None
+            descriptor = self.buffer[0]
+            single_segment = descriptor & 0x20
+            content_size = (1 if single_segment else 0, 2, 4, 8)[descriptor >> 6]
+            return 1 + (0 if single_segment else 1) + (0, 1, 2, 4)[descriptor & 0x03] + content_size
+        return 3  # Block header
+
+    def parse(self, header):
+        if self.state == 'magic':
+            magic = int.from_bytes(header, 'little')
+            if magic == 0xFD2FB528:
+                self.state = 'frame'
+            elif magic & 0xFFFFFFF0 == 0x184D2A50:
+                self.state = 'skippable'
+            else:
+                raise UploadFormatError("Invalid zstd data: unknown frame")
+        elif self.state == 'skippable':
+            self.skip = int.from_bytes(header, 'little')
+            self.state = 'magic'
+        elif self.state == 'frame':
+            self.has_checksum = bool(header[0] & 0x04)
+            self.state = 'block'
+        else:
+            block = int.from_bytes(header, 'little')
+            block_type, size = (block >> 1) & 0x03, block >> 3
+            self.skip = 1 if block_type == 1 else size  # RLE blocks hold one byte
+            if block & 0x01:
+                self.skip += 4 if self.has_checksum else 0
+                self.state = 'magic'
+
+
+class ChunkReader:
+    """
+    File-like reader over byte chunks, passing what is read to a tracker.
+    """
+
+    def __init__(self, chunks, tracker):
+        self.chunks = iter(chunks)
+        self.tracker = tracker
+        self.pending = b''
+
+    def read(self, size=-1):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b''
+                return b''
+        if size < 0:
+            size = len(self.pending)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        self.tracker.feed(data)
+        return data
+
+
+def iter_unzstd(chunks):
+    if zstandard is None:
+        raise UnsupportedFormat("zstd uploads need the zstandard package")
+    tracker = ZstdFrameTracker()
+    reader = zstandard.ZstdDecompressor().stream_reader(ChunkReader(chunks, tracker), read_across_frames=True)
+    try:
+        while True:
+            data = reader.read(MAX_DECOMPRESSED_CHUNK)
+            if not data:
+                break
+            yield data
+    except zstandard.ZstdError as e:
+        raise UploadFormatError(f"Invalid zstd data: {e}") from e
+    if not tracker.at_boundary:
+        raise UploadFormatError("Invalid zstd data: the file is truncated")
+
+
+DECOMPRESSORS = {GZIP: iter_gunzip, ZSTD: iter_unzstd}
+
+
+def iter_ndjson_rows(lines, errors):
+    """
+    Parse JSON object lines into (line number, Town, Region, sites) tuples.
+    """
+    for line_num, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            errors.add(line_num, "Not valid JSON")
+            continue
+        if not isinstance(value, dict):
+            errors.add(line_num, "Expected a JSON object")
+            continue
+        missing = [name for name in FIELDS if value.get(name) is None]
+        if missing:
+            errors.add(line_num, f"Missing {', '.join(missing)}")
+            continue
+        try:
+            town, region, sites = parse_row([str(value[name]) for name in FIELDS])
+        except ValueError as error:
+            errors.add(line_num, str(error))
+            continue
+        yield line_num, town, region, sites
+
+
+def iter_parquet_rows(file_obj, errors):
+    """
+    Read the Town, Region and Number_of_Galamsay_Sites columns of a Parquet
+    table a batch at a time, yielding (row number, Town, Region, sites).
+    """
+    if pyarrow is None:
+        raise UnsupportedFormat("Parquet uploads need the pyarrow package")
+    try:
+        table = pyarrow.parquet.ParquetFile(file_obj)
+        missing = [name for name in FIELDS if name not in table.schema_arrow.names]
+        if missing:
+            raise UploadFormatError(f"Parquet file has no {', '.join(missing)} column")
+        batches = table.iter_batches(batch_size=PARQUET_BATCH_ROWS, columns=list(FIELDS))
+        row_num = 0
+        for batch in batches:
+            columns = batch.to_pydict()
+            for values in zip(*(columns[name] for name in FIELDS)):
+                row_num += 1
+                try:
+                    town, region, sites = parse_row(['' if value is None else str(value) for value in values])
+                except ValueError as error:
+                    errors.add(row_num, str(error))
+                    continue
+                yield row_num, town, region, sites
+    except pyarrow.ArrowException as e:
+        raise UploadFormatError(f"Invalid Parquet file: {e}") from e
+
+
+def iter_format_records(file_obj, chunks, errors):
+    """
+    Records of an upload in any supported format. chunks is the raw (possibly
+    compressed) content of the file; Parquet files are read from file_obj itself.
+    """
+    file_format, compression = upload_format(file_obj)
+    if file_format == PARQUET:
+        if compression:
+            raise UploadFormatError("Parquet files are compressed internally; upload them uncompressed")
+        return iter_parquet_rows(file_obj, errors)
+    if compression:
+        chunks = DECOMPRESSORS[compression](chunks)
+    if file_format == NDJSON:
+        return iter_ndjson_rows(iter_lines(chunks), errors)
+    return iter_parsed_rows(iter_lines(chunks), errors)
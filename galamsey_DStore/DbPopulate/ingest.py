@@ -0,0 +1,354 @@
+"""
+CSV ingestion pipeline used by the upload endpoint.
+
+Uploads are read chunk by chunk (or parsed in parallel, see parsing.py),
+decompressed and decoded according to their format (see formats.py),
+validated, and written in batches (COPY on PostgreSQL, multi-row INSERTs otherwise) inside a single
+transaction, so a failed upload never leaves a partially populated file behind.
+
+Uploads are content-addressed: a file identical to one already stored is
+answered with the existing UploadedFile, and a new version that changes
+only a few lines of the latest file with the same name is applied to that
+file in place, writing just the changed rows.
+"""
+import hashlib
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .aggregates import RegionAccumulator, build_region_aggregates
+from .bulkload import insert_records
+from .caching import invalidate_file
+from .exports import delete_exports
+from .models import Region, SiteRecords, Town, UploadedFile
+from .formats import PARQUET, is_plain_csv, iter_format_records, upload_format
+from .parsing import ErrorReport, iter_parallel_rows, parallel_parse_path
+from .snapshots import SnapshotWriter, build_snapshot, snapshots_enabled
+from .uploadhandlers import content_hash
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_DELTA_MAX_CHANGED_RATIO = 0.1
+
+# How an upload was stored
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+UPDATED = 'updated'
+
+
+@dataclass
+class IngestResult:
+    uploaded_file: UploadedFile
+    rows_accepted: int = 0
+    rows_rejected: int = 0
+    bytes_read: int = 0
+    rows_changed: int = 0
+    status: str = CREATED
+    errors: ErrorReport = field(default_factory=ErrorReport, repr=False)
+    hasher: object = field(default_factory=hashlib.sha256, repr=False)
+    digest: str = None  # Set when the file is hashed apart from being read
+
+    @property
+    def content_hash(self):
+        return self.digest or self.hasher.hexdigest()
+
+
+class DeltaTooLarge(Exception):
+    """
+    An upload changes too many rows of the earlier version to be stored as a delta.
+    """
+
+
+def get_batch_size():
+    return getattr(settings, 'GALAMSEY_INGEST_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def iter_chunks(file_obj, result, chunk_size=None):
+    """
+    Yield raw chunks of an uploaded file, keeping count of the bytes read and hashing them.
+    """
+    for chunk in file_obj.chunks(chunk_size or DEFAULT_CHUNK_SIZE):
+        result.bytes_read += len(chunk)
+        result.hasher.update(chunk)
+        yield chunk
+
+
+def iter_records(file_obj, result):
+    """
+    Yield (line number, Town, Region, Number_of_Galamsay_Sites) for every valid
+    row of an upload in any supported format, recording the rows that are
+    rejected in result.errors. Large CSV uploads stored on disk are parsed in parallel.
+    """
+    path = parallel_parse_path(file_obj) if is_plain_csv(file_obj) else None
+    if path is not None:
+        result.digest = content_hash(file_obj)
+        records = iter_parallel_rows(path, result.errors, progress=lambda size: add_bytes_read(result, size))
+    elif upload_format(file_obj)[0] == PARQUET:
+        # Parquet is read from the file itself rather than as a stream of chunks
+        result.digest = content_hash(file_obj)
+        result.bytes_read = file_obj.size
+        records = iter_format_records(file_obj, None, result.errors)
+    else:
+        records = iter_format_records(file_obj, iter_chunks(file_obj, result), result.errors)
+    for record in records:
+        result.rows_rejected = result.errors.count
+        yield record
+    result.rows_rejected = result.errors.count
+
+
+def add_bytes_read(result, size):
+    result.bytes_read += size
+
+
+class DimensionCache:
+    """
+    Interns Region or Town names into ids for one ingest. Names not seen yet
+    are looked up, and created if missing, a whole batch at a time.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.ids = {}
+
+    def resolve(self, names):
+        missing = {name for name in names if name not in self.ids}
+        if missing:
+            self.ids.update(self.model.objects.filter(Name__in=missing).values_list('Name', 'id'))
+            new_names = [name for name in missing if name not in self.ids]
+            if new_names:
+                # Another ingest may create the same names concurrently
+                self.model.objects.bulk_create([self.model(Name=name) for name in new_names], ignore_conflicts=True)
+                self.ids.update(self.model.objects.filter(Name__in=new_names).values_list('Name', 'id'))
+        return self.ids
+
+
+def build_records(batch, uploaded_file, towns, regions, aggregates=None):
+    """
+    SiteRecords of a batch of (line number, Town, Region, sites) rows.
+    """
+    town_ids = towns.resolve({town for _, town, _, _ in batch})
+    region_ids = regions.resolve({region for _, _, region, _ in batch})
+    records = []
+    for line_num, town, region, sites in batch:
+        region_id = region_ids[region]
+        if aggregates is not None:
+            aggregates.add(region_id, sites)
+        records.append(SiteRecords(
+            Town_id=town_ids[town],
+            Region_id=region_id,
+            Number_of_Galamsay_Sites=sites,
+            FileID=uploaded_file,
+            RowNumber=line_num
+        ))
+    return records
+
+
+def ingest_csv(file_obj, file_name=None, batch_size=None, progress=None):
+    """
+    Store an uploaded CSV as a new UploadedFile and its SiteRecords.
+    Rows that cannot be parsed are counted as rejected and skipped, and the
+    file's region aggregates (and columnar snapshot, when enabled) are stored
+    alongside its rows. If given, progress(result) is called after every batch written.
+    """
+    batch_size = batch_size or get_batch_size()
+    snapshot = None
+
+    try:
+        with transaction.atomic():
+            uploaded_file = UploadedFile.objects.create(FileName=file_name or file_obj.name)
+            result = IngestResult(uploaded_file=uploaded_file)
+            aggregates = RegionAccumulator()
+            towns, regions = DimensionCache(Town), DimensionCache(Region)
+            if snapshots_enabled():
+                snapshot = SnapshotWriter(uploaded_file)
+            batch = []
+
+            for record in iter_records(file_obj, result):
+                if snapshot:
+                    snapshot.add(*record[1:])
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    records = build_records(batch, uploaded_file, towns, regions, aggregates)
+                    insert_records(records, batch_size)
+                    result.rows_accepted += len(batch)
+                    batch = []
+                    if progress:
+                        progress(result)
+
+            if batch:
+                records = build_records(batch, uploaded_file, towns, regions, aggregates)
+                insert_records(records, batch_size)
+                result.rows_accepted += len(batch)
+            aggregates.save(uploaded_file)
+            uploaded_file.ContentHash = result.content_hash
+            UploadedFile.objects.filter(id=uploaded_file.id).update(ContentHash=uploaded_file.ContentHash)
+            if snapshot:
+                snapshot.finish()  # Published when the transaction commits
+            if progress:
+                progress(result)
+    except BaseException:
+        if snapshot:
+            snapshot.discard()
+        raise
+
+    return result
+
+
+def find_duplicate(file_obj):
+    """
+    The earliest stored file with exactly the same content, or None.
+    """
+    return UploadedFile.objects.filter(ContentHash=content_hash(file_obj)).order_by('id').first()
+
+
+def get_delta_max_changed_ratio():
+    return getattr(settings, 'GALAMSEY_DELTA_MAX_CHANGED_RATIO', DEFAULT_DELTA_MAX_CHANGED_RATIO)
+
+
+def ingest_upload(file_obj, file_name=None, batch_size=None, progress=None):
+    """
+    Store an uploaded CSV without duplicating what is already stored.
+    An identical file is answered with the existing UploadedFile; a new version
+    of the latest file with the same name that changes at most
+    GALAMSEY_DELTA_MAX_CHANGED_RATIO of its rows updates that file in place;
+    anything else is ingested as a new file.
+    """
+    file_name = file_name or file_obj.name
+    duplicate = find_duplicate(file_obj)
+    if duplicate is not None:
+        return IngestResult(uploaded_file=duplicate, status=DUPLICATE)
+
+    previous = UploadedFile.objects.filter(FileName=file_name).order_by('-id').first()
+    if previous is not None:
+        max_changes = int(SiteRecords.objects.filter(FileID=previous).count() * get_delta_max_changed_ratio())
+        try:
+            return update_csv(file_obj, previous, batch_size, max_changes=max_changes, progress=progress)
+        except DeltaTooLarge:
+            file_obj.seek(0)
+
+    return ingest_csv(file_obj, file_name=file_name, batch_size=batch_size, progress=progress)
+
+
+def upsert_csv(file_obj, file_name=None, batch_size=None):
+    """
+    Load a CSV into the latest UploadedFile of the same name, creating it if needed.
+    Only changed lines are written and records of lines that are no longer valid
+    are removed, so loading the same file twice is idempotent.
+    """
+    file_name = file_name or file_obj.name
+
+    with transaction.atomic():
+        uploaded_file = UploadedFile.objects.filter(FileName=file_name).order_by('-id').first()
+        if uploaded_file is None:
+            uploaded_file = UploadedFile.objects.create(FileName=file_name)
+        return update_csv(file_obj, uploaded_file, batch_size)
+
+
+def update_csv(file_obj, uploaded_file, batch_size=None, max_changes=None, progress=None):
+    """
+    Bring a stored file in line with a new version of its CSV in one transaction,
+    writing only the lines that changed. Raises DeltaTooLarge, leaving the file
+    untouched, as soon as more than max_changes rows would change.
+    """
+    batch_size = batch_size or get_batch_size()
+
+    with transaction.atomic():
+        result = IngestResult(uploaded_file=uploaded_file, status=UPDATED)
+        towns, regions = DimensionCache(Town), DimensionCache(Region)
+        stored = SiteRecords.objects.filter(FileID=uploaded_file)
+        # Records from before line numbers were kept cannot be matched to a line
+        result.rows_changed, _ = stored.filter(RowNumber__isnull=True).delete()
+        stored_rows = iter_stored_rows(uploaded_file, batch_size)
+        current = next(stored_rows, None)
+        stale_lines = []
+        changed = []
+
+        for record in iter_records(file_obj, result):
+            result.rows_accepted += 1
+            line_num = record[0]
+            while current is not None and current[0] < line_num:
+                stale_lines.append(current[0])
+                current = next(stored_rows, None)
+            if current is not None and current[0] == line_num:
+                unchanged = current[1:] == record[1:]
+                current = next(stored_rows, None)
+                if unchanged:
+                    continue
+            changed.append(record)
+            _check_changes(result.rows_changed + len(changed) + len(stale_lines), max_changes)
+            if len(changed) >= batch_size:
+                _upsert(build_records(changed, uploaded_file, towns, regions), batch_size)
+                result.rows_changed += len(changed)
+                changed = []
+                if progress:
+                    progress(result)
+
+        # Lines past the end of the new version are gone too
+        while current is not None:
+            stale_lines.append(current[0])
+            current = next(stored_rows, None)
+        _check_changes(result.rows_changed + len(changed) + len(stale_lines), max_changes)
+
+        if changed:
+            _upsert(build_records(changed, uploaded_file, towns, regions), batch_size)
+            result.rows_changed += len(changed)
+        for start in range(0, len(stale_lines), batch_size):
+            stored.filter(RowNumber__in=stale_lines[start:start + batch_size]).delete()
+        result.rows_changed += len(stale_lines)
+
+        fields = {'ContentHash': result.content_hash}
+        if result.rows_changed:
+            # The content is new, so conditional requests must not get 304s for the old one
+            fields['DateUploaded'] = fields['DateModified'] = timezone.now()
+        UploadedFile.objects.filter(id=uploaded_file.id).update(**fields)
+        for name, value in fields.items():
+            setattr(uploaded_file, name, value)
+
+        if result.rows_changed:
+            build_region_aggregates(uploaded_file)
+            if snapshots_enabled():
+                build_snapshot(uploaded_file)
+            invalidate_file(uploaded_file.id)
+            transaction.on_commit(lambda: invalidate_file(uploaded_file.id))
+            transaction.on_commit(lambda: delete_exports(uploaded_file.id, keep=uploaded_file))
+        if progress:
+            progress(result)
+
+    return result
+
+
+def iter_stored_rows(uploaded_file, chunk_size):
+    """
+    Yield (RowNumber, Town, Region, Number_of_Galamsay_Sites) of a file's records
+    in line order, one keyset query per chunk.
+    """
+    rows = (
+        SiteRecords.objects
+        .filter(FileID=uploaded_file, RowNumber__isnull=False)
+        .order_by('RowNumber')
+        .values_list('RowNumber', 'Town__Name', 'Region__Name', 'Number_of_Galamsay_Sites')
+    )
+    last_line = None
+    while True:
+        chunk = list((rows if last_line is None else rows.filter(RowNumber__gt=last_line))[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_line = chunk[-1][0]
+
+
+def _check_changes(changes, max_changes):
+    if max_changes is not None and changes > max_changes:
+        raise DeltaTooLarge(f"More than {max_changes} rows changed")
+
+
+def _upsert(batch, batch_size):
+    SiteRecords.objects.bulk_create(
+        batch,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['FileID', 'RowNumber'],
+        update_fields=['Town', 'Region', 'Number_of_Galamsay_Sites']
+    )
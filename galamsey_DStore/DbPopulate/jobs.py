@@ -0,0 +1,155 @@
+"""
+Background upload jobs.
+
+An asynchronous upload stores the raw file, records an UploadJob and returns
+straight away; the parse and insert then run on a local thread pool. Live
+progress is kept in the cache because the ingest transaction holds the
+database write lock until it commits.
+
+The pool lives in the web process, so a restart loses the jobs it was
+running or had queued. A job still pending or running after
+GALAMSEY_UPLOAD_JOB_TIMEOUT is taken to be lost and marked failed when its
+status is read.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .ingest import ingest_upload
+from .models import UploadJob
+
+DEFAULT_WORKERS = 2
+DEFAULT_JOB_TIMEOUT = 6 * 60 * 60
+PROGRESS_KEY = 'galamsey:uploadjob:{}:progress'
+PROGRESS_TIMEOUT = 24 * 60 * 60
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'GALAMSEY_UPLOAD_WORKERS', DEFAULT_WORKERS)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='galamsey-upload')
+    return _executor
+
+
+def submit(fn, *args):
+    """
+    Run fn on the background pool, or inline when GALAMSEY_UPLOAD_JOBS_EAGER is set.
+    """
+    if getattr(settings, 'GALAMSEY_UPLOAD_JOBS_EAGER', False):
+        fn(*args)
+    else:
+        get_executor().submit(_run_in_thread, fn, *args)
+
+
+def _run_in_thread(fn, *args):
+    close_old_connections()
+    try:
+        fn(*args)
+    finally:
+        connection.close()
+
+
+def create_upload_job(file_obj):
+    """
+    Store the raw upload and queue it for ingestion. Returns the UploadJob.
+    """
+    stored_path = default_storage.save(f"uploads/{file_obj.name}", file_obj)
+    job = UploadJob.objects.create(
+        FileName=file_obj.name,
+        StoredPath=stored_path,
+        BytesTotal=file_obj.size or 0,
+    )
+    transaction.on_commit(lambda: submit(run_upload_job, job.id))
+    return job
+
+
+def run_upload_job(job_id):
+    job = UploadJob.objects.get(id=job_id)
+    job.DateStarted = timezone.now()
+    # A job expired while it was queued stays failed
+    if not UploadJob.objects.filter(id=job_id, Status=UploadJob.PENDING).update(Status=UploadJob.RUNNING, DateStarted=job.DateStarted):
+        return
+
+    def progress(result):
+        cache.set(PROGRESS_KEY.format(job_id), {
+            'BytesRead': result.bytes_read,
+            'RowsInserted': result.rows_accepted,
+            'RowsRejected': result.rows_rejected,
+        }, PROGRESS_TIMEOUT)
+
+    try:
+        with default_storage.open(job.StoredPath, 'rb') as file_obj:
+            # The stored name may have a suffix added; the format is told by the original name
+            file_obj.name = job.FileName
+            result = ingest_upload(file_obj, file_name=job.FileName, progress=progress)
+    except Exception as e:
+        fields = {'Status': UploadJob.FAILED, 'Error': str(e)}
+    else:
+        fields = {
+            'Status': UploadJob.SUCCEEDED,
+            'FileID': result.uploaded_file,
+            'BytesRead': result.bytes_read,
+            'RowsInserted': result.rows_accepted,
+            'RowsRejected': result.rows_rejected,
+            'RejectedLines': result.errors.errors,
+        }
+    finally:
+        default_storage.delete(job.StoredPath)
+
+    # Only finish the job if expire_stale_job has not reported it failed meanwhile
+    UploadJob.objects.filter(id=job_id, Status=UploadJob.RUNNING).update(DateFinished=timezone.now(), **fields)
+    cache.delete(PROGRESS_KEY.format(job_id))
+
+
+def expire_stale_job(job):
+    """
+    Mark a job failed if it has been pending or running for longer than
+    GALAMSEY_UPLOAD_JOB_TIMEOUT, e.g. because the process running it restarted.
+    Returns the job, refreshed if it was expired.
+    """
+    timeout = getattr(settings, 'GALAMSEY_UPLOAD_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)
+    if job.Status not in (UploadJob.PENDING, UploadJob.RUNNING) or timeout is None:
+        return job
+    if (job.DateStarted or job.DateCreated) > timezone.now() - timedelta(seconds=timeout):
+        return job
+    # Only expire it if no worker updated it meanwhile
+    expired = UploadJob.objects.filter(id=job.id, Status=job.Status, DateStarted=job.DateStarted).update(
+        Status=UploadJob.FAILED,
+        Error="The upload job was lost before it finished; upload the file again",
+        DateFinished=timezone.now(),
+    )
+    if expired:
+        default_storage.delete(job.StoredPath)
+        cache.delete(PROGRESS_KEY.format(job.id))
+        job.refresh_from_db()
+    return job
+
+
+def get_job_progress(job):
+    """
+    Current counters for a job, preferring live progress while it is running.
+    """
+    progress = {
+        'BytesRead': job.BytesRead,
+        'RowsInserted': job.RowsInserted,
+        'RowsRejected': job.RowsRejected,
+    }
+    if job.Status == UploadJob.RUNNING:
+        progress.update(cache.get(PROGRESS_KEY.format(job.id)) or {})
+
+    elapsed = None
+    if job.DateStarted:
+        elapsed = ((job.DateFinished or timezone.now()) - job.DateStarted).total_seconds()
+    progress['RowsPerSecond'] = round(progress['RowsInserted'] / elapsed, 1) if elapsed else None
+    return progress
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...purge import purge_file, remove_files, retention_candidates, stale_spool_files
+
+
+class Command(BaseCommand):
+    help = 'Purge uploaded files that fall outside the retention policy'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-last', type=int, default=getattr(settings, 'GALAMSEY_RETENTION_KEEP_LAST', None),
+            help='Keep only the newest N uploads of each file name',
+        )
+        parser.add_argument(
+            '--max-age-days', type=int, default=getattr(settings, 'GALAMSEY_RETENTION_MAX_AGE_DAYS', None),
+            help='Purge uploads older than this many days',
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help='Records deleted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='List the files that would be purged')
+
+    def handle(self, *args, **options):
+        keep_last, max_age_days = options['keep_last'], options['max_age_days']
+        if keep_last is None and max_age_days is None:
+            raise CommandError('Give --keep-last or --max-age-days, or set GALAMSEY_RETENTION_KEEP_LAST/MAX_AGE_DAYS')
+        if (keep_last is not None and keep_last < 1) or (max_age_days is not None and max_age_days < 0):
+            raise CommandError('--keep-last must be at least 1 and --max-age-days not negative')
+
+        files = list(retention_candidates(keep_last, max_age_days))
+        if options['dry_run']:
+            for uploaded_file in files:
+                self.stdout.write(f'{uploaded_file.id}\t{uploaded_file.FileName}\t{uploaded_file.DateUploaded.isoformat()}')
+            self.stdout.write(self.style.SUCCESS(f'{len(files)} file(s) would be purged'))
+            return
+
+        records = 0
+        for uploaded_file in files:
+            records += purge_file(uploaded_file, options['batch_size'])
+        stale = stale_spool_files()
+        remove_files(stale)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {len(files)} file(s) and {records} site record(s), removed {len(stale)} stale snapshot/export file(s)'
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from ...aggregates import build_region_aggregates
+from ...models import UploadedFile
+
+
+class Command(BaseCommand):
+    help = 'Compute region aggregates for files uploaded before they were stored at ingest time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_ids', nargs='*', type=int, help='Only backfill these file IDs')
+        parser.add_argument('--force', action='store_true', help='Rebuild aggregates that already exist')
+
+    def handle(self, *args, **options):
+        files = UploadedFile.objects.order_by('id')
+        if options['file_ids']:
+            files = files.filter(id__in=options['file_ids'])
+        if not options['force']:
+            files = files.filter(RegionAggregates__isnull=True)
+
+        count = 0
+        for uploaded_file in files.iterator():
+            build_region_aggregates(uploaded_file)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Backfilled region aggregates for {count} file(s)'))
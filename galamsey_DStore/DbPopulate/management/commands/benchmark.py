@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from ...benchmarks import benchmark_dataset, environment, generate_csv
+
+
+class Command(BaseCommand):
+    help = 'Benchmark CSV ingestion and every API endpoint on synthetic datasets, saving the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000],
+                            help='Dataset sizes to benchmark, e.g. --rows 10000 1000000 10000000')
+        parser.add_argument('--regions', type=int, default=16, help='Number of distinct regions')
+        parser.add_argument('--towns', type=int, default=1000, help='Number of distinct towns')
+        parser.add_argument('--dirty-ratio', type=float, default=0.01, help='Share of invalid rows')
+        parser.add_argument('--iterations', type=int, default=20, help='Requests timed per endpoint')
+        parser.add_argument('--skip', nargs='*', default=[], help='Endpoint names (or serialization) to leave out')
+        parser.add_argument('--data-dir', type=str, default=None, help='Where to generate the CSVs (kept for later runs)')
+        parser.add_argument('--output', type=str, default='benchmark-results.json', help='JSON results file')
+
+    def handle(self, *args, **options):
+        # Never touch the configured database: benchmark against a throwaway
+        # test database, kept on disk rather than in memory for SQLite
+        work_dir = tempfile.mkdtemp(prefix='galamsey-bench-')
+        if connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(work_dir, 'bench.sqlite3')
+        data_dir = options['data_dir'] or work_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+        # Snapshots and exports of the throwaway files go to the work directory too
+        file_settings = override_settings(GALAMSEY_SNAPSHOT_DIR=os.path.join(work_dir, 'snapshots'),
+                                          GALAMSEY_EXPORT_DIR=os.path.join(work_dir, 'exports'))
+        file_settings.enable()
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = {'environment': environment(), 'datasets': []}
+            for rows in options['rows']:
+                path = os.path.join(data_dir, f'galamsey_{rows}_{options["regions"]}r_{options["towns"]}t.csv')
+                if not os.path.exists(path):
+                    self.stdout.write(f"Generating {rows} rows into {path}")
+                    generate_csv(path, rows, regions=options['regions'], towns=options['towns'],
+                                 dirty_ratio=options['dirty_ratio'])
+
+                self.stdout.write(f"Benchmarking {rows} rows")
+                dataset = benchmark_dataset(path, rows, options['iterations'], skip=options['skip'])
+                results['datasets'].append(dataset)
+                self.summarize(dataset)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            file_settings.disable()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        with open(options['output'], 'w') as handle:
+            json.dump(results, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {options['output']}"))
+
+    def summarize(self, dataset):
+        upload = dataset['upload']
+        self.stdout.write(
+            f"  upload: {upload['rows_accepted']} rows in {upload['seconds']}s "
+            f"({upload['rows_per_second']} rows/sec)"
+        )
+        for name, timings in dataset['endpoints'].items():
+            cold, warm = timings['cold'], timings['warm']
+            self.stdout.write(
+                f"  {name}: cold p50 {cold['p50_ms']}ms p99 {cold['p99_ms']}ms, "
+                f"warm p50 {warm['p50_ms']}ms, peak alloc {cold['peak_alloc_kb']}KB, peak RSS {cold['peak_rss_kb']}KB"
+            )
+        serialization = dataset['serialization']
+        if serialization:
+            self.stdout.write(
+                f"  serialization per 100k rows: serializer {serialization['serializer']['total_ms_per_100k_rows']}ms, "
+                f"values_list {serialization['values_list']['total_ms_per_100k_rows']}ms "
+                f"(identical output: {serialization['identical_output']})"
+            )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from ...models import UploadedFile
+from ...snapshots import build_snapshot, open_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write columnar snapshots for files uploaded before snapshots were enabled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_ids', nargs='*', type=int, help='Only build snapshots of these file IDs')
+        parser.add_argument('--force', action='store_true', help='Rebuild snapshots that already exist')
+
+    def handle(self, *args, **options):
+        files = UploadedFile.objects.order_by('id')
+        if options['file_ids']:
+            files = files.filter(id__in=options['file_ids'])
+
+        count = 0
+        for uploaded_file in files.iterator():
+            if not options['force'] and open_snapshot(uploaded_file) is not None:
+                continue
+            build_snapshot(uploaded_file)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Built snapshots for {count} file(s)'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ...benchmarks import generate_csv
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic Galamsey CSV shaped like galamsey_dataset/galamsay_data.csv'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help='Path of the CSV file to write')
+        parser.add_argument('--rows', type=int, default=10000, help='Number of data rows')
+        parser.add_argument('--regions', type=int, default=16, help='Number of distinct regions')
+        parser.add_argument('--towns', type=int, default=1000, help='Number of distinct towns')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible files')
+        parser.add_argument('--dirty-ratio', type=float, default=0.0, help='Share of invalid rows')
+
+    def handle(self, *args, **options):
+        generate_csv(
+            options['output'], options['rows'], regions=options['regions'], towns=options['towns'],
+            seed=options['seed'], dirty_ratio=options['dirty_ratio']
+        )
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['rows']} rows to {options['output']}"))
@@ -1,53 +1,81 @@
-import csv
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.files import File
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models.functions import RowNumber
+from django.db import connections
+
+from ...ingest import get_batch_size, upsert_csv
+
+
+def _init_worker():
+    import django
+    django.setup()
+    # Never share the parent's database connections with a forked worker
+    connections.close_all()
+
+
+def load_file(path, batch_size):
+    """
+    Upsert one CSV file. Returns (path, FileID, rows accepted, rows rejected, seconds, rejected lines).
+    """
+    started = time.perf_counter()
+    with open(path, 'rb') as handle:
+        result = upsert_csv(File(handle), file_name=os.path.basename(path), batch_size=batch_size)
+    return (path, result.uploaded_file.id, result.rows_accepted, result.rows_rejected,
+            time.perf_counter() - started, result.errors.errors)
 
-from ...models import GSiteData
 
 class Command(BaseCommand):
-    help = 'Import data from a CSV file into the database'
+    help = 'Bulk load CSV files into UploadedFile/SiteRecords, updating files that were loaded before'
 
     def add_arguments(self, parser):
-        parser.add_argument('csv_file', type=str, help='Path to the CSV file')
+        parser.add_argument('csv_files', nargs='+', type=str, help='Paths or glob patterns of the CSV files')
+        parser.add_argument('--workers', type=int, default=1, help='Number of files loaded in parallel')
+        parser.add_argument('--batch-size', type=int, default=None, help='Records written per INSERT')
 
     def handle(self, *args, **options):
-        csv_file = options['csv_file']
-
-        try:
-            with open(csv_file, 'r') as file:
-                reader = csv.reader(file)
-                next(reader)  # Skip the header row if it exists
-
-                for row in reader:
-                    try:
-                        # Try to convert Number_of_Galamsay_Sites to an integer
-                        number_of_sites = int(row[2])
-
-                        # Create or update the GSiteData entry
-                        _, created = GSiteData.objects.get_or_create(
-                            Town=row[0],
-                            Region=row[1],
-                            defaults={'Number_of_Galamsay_Sites': number_of_sites}
-                        )
-                        if created:
-                            self.stdout.write(f'Successfully created record for {row[0]}')
-                        if not created:
-                            # If the entry already exists, update it
-                            GSiteData.objects.filter(
-                                Town=row[0],
-                                Region=row[1]
-                            ).update(Number_of_Galamsay_Sites=number_of_sites)
-                            self.stdout.write(f'Updated the record for {row[0]}')
-
-                    except ValueError:
-                        # Skip rows where Number_of_Galamsay_Sites is not an integer
-                        print(
-                            f"Skipping row: Town={row[0]}, Region={row[1]}. Number_of_Galamsay_Sites is not an integer.")
-                        continue
-
-        except FileNotFoundError:
-            raise CommandError(f"File '{csv_file}' not found.")
-        except IndexError:
-            raise CommandError("CSV file format incorrect. Ensure it has at least three columns: Town, Region, Number_of_Galamsay_Sites.")
-        except ValueError:
-            raise CommandError("Invalid 'Number_of_Galamsay_Sites' value. Ensure it's an integer.")
\ No newline at end of file
+        paths = []
+        for pattern in options['csv_files']:
+            matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+            paths.extend(matches)
+        if not paths:
+            raise CommandError("No CSV files matched.")
+        for path in paths:
+            if not os.path.isfile(path):
+                raise CommandError(f"File '{path}' not found.")
+
+        batch_size = options['batch_size'] or get_batch_size()
+        workers = max(1, min(options['workers'], len(paths)))
+
+        started = time.perf_counter()
+        results = []
+        if workers == 1:
+            for path in paths:
+                results.append(self.report(load_file(path, batch_size)))
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                futures = [executor.submit(load_file, path, batch_size) for path in paths]
+                for future in as_completed(futures):
+                    results.append(self.report(future.result()))
+        elapsed = time.perf_counter() - started
+
+        accepted = sum(result[2] for result in results)
+        rejected = sum(result[3] for result in results)
+        rate = accepted / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {accepted} rows ({rejected} rejected) from {len(results)} file(s) "
+            f"in {elapsed:.2f}s ({rate:,.0f} rows/sec) using {workers} worker(s)"
+        ))
+
+    def report(self, result):
+        path, file_id, accepted, rejected, seconds, rejected_lines = result
+        self.stdout.write(f"{path}: FileID {file_id}, {accepted} rows, {rejected} rejected, {seconds:.2f}s")
+        for error in rejected_lines:
+            self.stdout.write(f"  line {error['line']}: {error['reason']}")
+        if rejected > len(rejected_lines):
+            self.stdout.write(f"  ... and {rejected - len(rejected_lines)} more")
+        return result
@@ -0,0 +1,127 @@
+"""
+In-process request metrics, exported in the Prometheus text format.
+
+Counters and histograms live in memory, so each worker process exports its
+own series; Prometheus adds them up across the scraped processes.
+"""
+from collections import deque
+from threading import Lock
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            yield self.name, tuple(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.values = {}
+        self.lock = Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0))
+            for position, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[position] += 1
+                    break
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in values:
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + (('le', format_number(bound)),), cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.profiles = deque(maxlen=50)
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def reset(self):
+        for metric in self.metrics:
+            with metric.lock:
+                metric.values.clear()
+        self.profiles.clear()
+
+    def export(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{format_labels(labels)} {format_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    'galamsey_requests_total', 'Requests handled, by view, method and status.', ['view', 'method', 'status']))
+REQUEST_DURATION = registry.register(Histogram(
+    'galamsey_request_duration_seconds', 'Wall time of a request.', ['view']))
+DB_QUERIES = registry.register(Histogram(
+    'galamsey_db_queries', 'SQL queries issued per request.', ['view'], buckets=QUERY_BUCKETS))
+DB_DURATION = registry.register(Histogram(
+    'galamsey_db_duration_seconds', 'Time spent in SQL queries per request.', ['view']))
+SERIALIZATION_DURATION = registry.register(Histogram(
+    'galamsey_serialization_duration_seconds', 'Time spent rendering the response body.', ['view']))
+RESPONSE_SIZE = registry.register(Histogram(
+    'galamsey_response_size_bytes', 'Size of the response body.', ['view'], buckets=SIZE_BUCKETS))
+PROFILED_REQUESTS = registry.register(Counter(
+    'galamsey_profiled_requests_total', 'Requests sampled for profiling.', ['view']))
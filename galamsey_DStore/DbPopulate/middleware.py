@@ -0,0 +1,213 @@
+"""
+Per-request instrumentation.
+
+Records, per view: SQL query count and time, response rendering time,
+response size and wall time, and profiles a sampled fraction of requests
+with cProfile. Everything is exported by the /metrics endpoint.
+
+The middleware runs natively under both WSGI and ASGI; async requests are
+measured but not profiled, since cProfile only follows one thread. Queries
+are counted by an execute wrapper installed on every connection, which
+charges them to the request in the current context: sync_to_async copies
+the context into the thread the async ORM runs its queries on, so the
+queries of async views are counted too.
+"""
+import cProfile
+import io
+import pstats
+import random
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+DEFAULT_PROFILE_SAMPLE_RATE = 0.0
+PROFILE_STATS_LINES = 25
+
+# QueryTimer of the request whose code is running in this context
+current_queries = ContextVar('galamsey_current_queries', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    queries = current_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_query_recorder(connection, **kwargs):
+    """
+    Add record_query to a connection; connected to connection_created.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting queries and the time spent in them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class RequestMetrics:
+    def __init__(self, request):
+        self.request = request
+        self.started = time.perf_counter()
+        self.queries = QueryTimer()
+        self.render_started = None
+        self.render_duration = 0.0
+
+    @property
+    def view(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return (match.url_name or match.view_name) if match else 'unmatched'
+
+    def watch_queries(self, stack):
+        # Connections opened before the app was ready have no recorder yet
+        for connection in connections.all():
+            install_query_recorder(connection)
+        stack.callback(current_queries.set, current_queries.get())
+        current_queries.set(self.queries)
+
+    def record(self, response, size):
+        view = self.view
+        metrics.REQUESTS.inc(view=view, method=self.request.method, status=response.status_code)
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - self.started, view=view)
+        metrics.DB_QUERIES.observe(self.queries.count, view=view)
+        metrics.DB_DURATION.observe(self.queries.duration, view=view)
+        metrics.SERIALIZATION_DURATION.observe(self.render_duration, view=view)
+        metrics.RESPONSE_SIZE.observe(size, view=view)
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'GALAMSEY_METRICS_ENABLED', True)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        request_metrics = self.start(request)
+        profiler = None
+        if random.random() < getattr(settings, 'GALAMSEY_PROFILE_SAMPLE_RATE', DEFAULT_PROFILE_SAMPLE_RATE):
+            profiler = cProfile.Profile()
+
+        with ExitStack() as stack:
+            request_metrics.watch_queries(stack)
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+
+        if profiler:
+            self.save_profile(request_metrics.view, request, profiler)
+
+        return self.finish(request_metrics, response)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        request_metrics = self.start(request)
+        with ExitStack() as stack:
+            request_metrics.watch_queries(stack)
+            response = await self.get_response(request)
+        return self.finish(request_metrics, response)
+
+    def start(self, request):
+        request_metrics = RequestMetrics(request)
+        request._galamsey_metrics = request_metrics
+        return request_metrics
+
+    def finish(self, request_metrics, response):
+        if not response.streaming:
+            request_metrics.record(response, len(response.content))
+        elif getattr(response, 'is_async', False):
+            response.streaming_content = self.ameasure_stream(request_metrics, response, response.streaming_content)
+        else:
+            response.streaming_content = self.measure_stream(request_metrics, response, response.streaming_content)
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Called just before DRF/template responses are rendered: time the rendering.
+        """
+        request_metrics = getattr(request, '_galamsey_metrics', None)
+        if request_metrics is not None:
+            request_metrics.render_started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: setattr(
+                    request_metrics, 'render_duration', time.perf_counter() - request_metrics.render_started
+                )
+            )
+        return response
+
+    def measure_stream(self, request_metrics, response, content):
+        """
+        Streamed bodies are produced after the view returns, so keep counting
+        queries and bytes until the last chunk has been sent.
+        """
+        size = 0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            request_metrics.watch_queries(stack)
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        request_metrics.render_duration = time.perf_counter() - started
+        request_metrics.record(response, size)
+
+    async def ameasure_stream(self, request_metrics, response, content):
+        """
+        measure_stream for async streaming responses.
+        """
+        size = 0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            request_metrics.watch_queries(stack)
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+        request_metrics.render_duration = time.perf_counter() - started
+        request_metrics.record(response, size)
+
+    def save_profile(self, view, request, profiler):
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(PROFILE_STATS_LINES)
+        metrics.PROFILED_REQUESTS.inc(view=view)
+        metrics.registry.profiles.append({
+            'view': view,
+            'path': request.path,
+            'timestamp': time.time(),
+            'stats': output.getvalue(),
+        })
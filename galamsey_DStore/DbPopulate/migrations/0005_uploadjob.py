@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DbPopulate', '0004_rename_id_siterecords_id_rename_id_uploadedfile_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('FileName', models.CharField(max_length=150)),
+                ('StoredPath', models.CharField(max_length=255)),
+                ('Status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('BytesTotal', models.BigIntegerField(default=0)),
+                ('BytesRead', models.BigIntegerField(default=0)),
+                ('RowsInserted', models.BigIntegerField(default=0)),
+                ('RowsRejected', models.BigIntegerField(default=0)),
+                ('Error', models.TextField(blank=True)),
+                ('DateCreated', models.DateTimeField(auto_now_add=True)),
+                ('DateStarted', models.DateTimeField(blank=True, null=True)),
+                ('DateFinished', models.DateTimeField(blank=True, null=True)),
+                ('FileID', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='UploadJobs', to='DbPopulate.uploadedfile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DbPopulate', '0005_uploadjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegionAggregate',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('Region', models.CharField(max_length=200)),
+                ('RecordCount', models.IntegerField()),
+                ('TotalSites', models.BigIntegerField()),
+                ('MinSites', models.IntegerField()),
+                ('MaxSites', models.IntegerField()),
+                ('FileID', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='RegionAggregates', to='DbPopulate.uploadedfile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('FileID', 'Region'), name='uniq_regionaggregate_file_region')],
+            },
+        ),
+    ]
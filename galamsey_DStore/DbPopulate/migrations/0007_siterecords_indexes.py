@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DbPopulate', '0006_regionaggregate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='regionaggregate',
+            name='FileID',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='RegionAggregates', to='DbPopulate.uploadedfile'),
+        ),
+        migrations.AddIndex(
+            model_name='regionaggregate',
+            index=models.Index(fields=['FileID', '-TotalSites'], name='regionagg_file_total'),
+        ),
+        migrations.AddIndex(
+            model_name='siterecords',
+            index=models.Index(fields=['FileID', 'Region', 'Number_of_Galamsay_Sites'], name='siterec_file_region_sites'),
+        ),
+        migrations.AddIndex(
+            model_name='siterecords',
+            index=models.Index(fields=['FileID', 'Number_of_Galamsay_Sites'], name='siterec_file_sites'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DbPopulate', '0007_siterecords_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siterecords',
+            name='RowNumber',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='siterecords',
+            constraint=models.UniqueConstraint(fields=('FileID', 'RowNumber'), name='uniq_siterecords_file_row'),
+        ),
+    ]
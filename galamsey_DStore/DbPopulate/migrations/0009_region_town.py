@@ -0,0 +1,165 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def intern_names(apps, schema_editor):
+    """
+    Store every distinct Region and Town name once and point the rows at them.
+    """
+    Region = apps.get_model('DbPopulate', 'Region')
+    Town = apps.get_model('DbPopulate', 'Town')
+    SiteRecords = apps.get_model('DbPopulate', 'SiteRecords')
+    RegionAggregate = apps.get_model('DbPopulate', 'RegionAggregate')
+
+    region_names = set(SiteRecords.objects.values_list('Region', flat=True).distinct())
+    region_names.update(RegionAggregate.objects.values_list('Region', flat=True).distinct())
+    Region.objects.bulk_create([Region(Name=name) for name in region_names], batch_size=BATCH_SIZE)
+    town_names = SiteRecords.objects.values_list('Town', flat=True).distinct()
+    Town.objects.bulk_create([Town(Name=name) for name in town_names.iterator()], batch_size=BATCH_SIZE)
+
+    region_id = Subquery(Region.objects.filter(Name=OuterRef('Region')).values('id')[:1])
+    SiteRecords.objects.update(
+        RegionKey=region_id,
+        TownKey=Subquery(Town.objects.filter(Name=OuterRef('Town')).values('id')[:1])
+    )
+    RegionAggregate.objects.update(RegionKey=region_id)
+
+
+def restore_names(apps, schema_editor):
+    """
+    Copy the Region and Town names back into the rows' own columns.
+    """
+    Region = apps.get_model('DbPopulate', 'Region')
+    Town = apps.get_model('DbPopulate', 'Town')
+    SiteRecords = apps.get_model('DbPopulate', 'SiteRecords')
+    RegionAggregate = apps.get_model('DbPopulate', 'RegionAggregate')
+
+    region_name = Subquery(Region.objects.filter(id=OuterRef('RegionKey')).values('Name')[:1])
+    SiteRecords.objects.update(
+        Region=region_name,
+        Town=Subquery(Town.objects.filter(id=OuterRef('TownKey')).values('Name')[:1])
+    )
+    RegionAggregate.objects.update(Region=region_name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DbPopulate', '0008_siterecords_rownumber'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Region',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('Name', models.CharField(max_length=200, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Town',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('Name', models.CharField(max_length=200, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='siterecords',
+            name='RegionKey',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='DbPopulate.region'),
+        ),
+        migrations.AddField(
+            model_name='siterecords',
+            name='TownKey',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='DbPopulate.town'),
+        ),
+        migrations.AddField(
+            model_name='regionaggregate',
+            name='RegionKey',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='DbPopulate.region'),
+        ),
+        migrations.RunPython(intern_names, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='siterecords',
+            name='siterec_file_region_sites',
+        ),
+        migrations.RemoveConstraint(
+            model_name='regionaggregate',
+            name='uniq_regionaggregate_file_region',
+        ),
+        # Going backwards, the names are copied back once the char columns are
+        # there again (with an empty default) and before the constraint returns
+        migrations.RunPython(migrations.RunPython.noop, restore_names),
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='siterecords',
+                name='Region',
+                field=models.CharField(max_length=200, default=''),
+            ),
+            migrations.AlterField(
+                model_name='siterecords',
+                name='Town',
+                field=models.CharField(max_length=200, default=''),
+            ),
+            migrations.AlterField(
+                model_name='regionaggregate',
+                name='Region',
+                field=models.CharField(max_length=200, default=''),
+            ),
+        ]),
+        migrations.RemoveField(
+            model_name='siterecords',
+            name='Region',
+        ),
+        migrations.RemoveField(
+            model_name='siterecords',
+            name='Town',
+        ),
+        migrations.RemoveField(
+            model_name='regionaggregate',
+            name='Region',
+        ),
+        migrations.RenameField(
+            model_name='siterecords',
+            old_name='RegionKey',
+            new_name='Region',
+        ),
+        migrations.RenameField(
+            model_name='siterecords',
+            old_name='TownKey',
+            new_name='Town',
+        ),
+        migrations.RenameField(
+            model_name='regionaggregate',
+            old_name='RegionKey',
+            new_name='Region',
+        ),
+        migrations.AlterField(
+            model_name='siterecords',
+            name='Region',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='Sites', to='DbPopulate.region'),
+        ),
+        migrations.AlterField(
+            model_name='siterecords',
+            name='Town',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='Sites', to='DbPopulate.town'),
+        ),
+        migrations.AlterField(
+            model_name='regionaggregate',
+            name='Region',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='Aggregates', to='DbPopulate.region'),
+        ),
+        migrations.AddIndex(
+            model_name='siterecords',
+            index=models.Index(fields=['FileID', 'Region', 'Number_of_Galamsay_Sites'], name='siterec_file_region_sites'),
+        ),
+        migrations.AddConstraint(
+            model_name='regionaggregate',
+            constraint=models.UniqueConstraint(fields=('FileID', 'Region'), name='uniq_regionaggregate_file_region'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DbPopulate', '0009_region_town'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='ContentHash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:02
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_date_uploaded(apps, schema_editor):
+    """
+    Existing files were last modified when they were uploaded.
+    """
+    UploadedFile = apps.get_model('DbPopulate', 'UploadedFile')
+    UploadedFile.objects.update(DateModified=F('DateUploaded'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DbPopulate', '0011_uploadjob_rejectedlines'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='DateModified',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_date_uploaded, migrations.RunPython.noop),
+    ]
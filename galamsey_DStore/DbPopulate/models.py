@@ -1,6 +1,7 @@
 from typing import Any
 
 from django.db import models
+from django.utils import timezone
 from django.utils.timezone import localtime
 
 
@@ -10,6 +11,10 @@ class UploadedFile(models.Model):
     id = models.AutoField(primary_key=True)
     FileName = models.CharField(max_length=150)
     DateUploaded = models.DateTimeField(auto_now_add=True)
+    # When the file's records last changed; cached responses, snapshots and spooled exports are keyed by it
+    DateModified = models.DateTimeField(default=timezone.now)
+    # SHA-256 of the uploaded CSV; identical uploads are answered with the existing file
+    ContentHash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
 
     def __init__(self, *args: Any, **kwargs: Any):
         super().__init__(*args, **kwargs)
@@ -17,12 +22,100 @@ class UploadedFile(models.Model):
     def __str__(self):
         return f"[{self.id}] [{self.FileName}] - [{self.DateUploaded}]"
 
+class Region(models.Model):
+    """
+    Region names, stored once and referenced by id from the site records.
+    """
+    id = models.AutoField(primary_key=True)
+    Name = models.CharField(max_length=200, unique=True)
+
+    def __str__(self):
+        return self.Name
+
+class Town(models.Model):
+    """
+    Town names, stored once and referenced by id from the site records.
+    """
+    id = models.AutoField(primary_key=True)
+    Name = models.CharField(max_length=200, unique=True)
+
+    def __str__(self):
+        return self.Name
+
 class SiteRecords(models.Model):
     id = models.AutoField(primary_key=True)
-    Town = models.CharField(max_length=200)
-    Region = models.CharField(max_length=200)
+    Town = models.ForeignKey(Town, on_delete=models.PROTECT, related_name='Sites')
+    # Indexed through siterec_file_region_sites for per-file queries
+    Region = models.ForeignKey(Region, on_delete=models.PROTECT, related_name='Sites', db_index=False)
     Number_of_Galamsay_Sites = models.IntegerField()
     FileID = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='FileID')
+    # Line of the source CSV the record came from; re-imports update records in place by it
+    RowNumber = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['FileID', 'RowNumber'], name='uniq_siterecords_file_row'),
+        ]
+        indexes = [
+            # Covers the per-region grouping of a file without touching the table
+            models.Index(fields=['FileID', 'Region', 'Number_of_Galamsay_Sites'], name='siterec_file_region_sites'),
+            # Ranks or filters a file's towns by their number of sites
+            models.Index(fields=['FileID', 'Number_of_Galamsay_Sites'], name='siterec_file_sites'),
+        ]
+
+    def __str__(self):
+        return f"[{self.id}] [{self.Town.Name}] - [{self.Region.Name}] - [{self.Number_of_Galamsay_Sites}] - [{self.FileID}]"
+
+class RegionAggregate(models.Model):
+    """
+    Per-region totals of one uploaded file, computed once when the file is ingested.
+    """
+    id = models.AutoField(primary_key=True)
+    # Indexed through the (FileID, Region) unique constraint
+    FileID = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name='RegionAggregates', db_index=False)
+    Region = models.ForeignKey(Region, on_delete=models.PROTECT, related_name='Aggregates')
+    RecordCount = models.IntegerField()
+    TotalSites = models.BigIntegerField()
+    MinSites = models.IntegerField()
+    MaxSites = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['FileID', 'Region'], name='uniq_regionaggregate_file_region'),
+        ]
+        indexes = [
+            models.Index(fields=['FileID', '-TotalSites'], name='regionagg_file_total'),
+        ]
+
+    def __str__(self):
+        return f"[{self.FileID_id}] [{self.Region_id}] - [{self.TotalSites}]"
+
+class UploadJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    FileName = models.CharField(max_length=150)
+    StoredPath = models.CharField(max_length=255)
+    Status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    BytesTotal = models.BigIntegerField(default=0)
+    BytesRead = models.BigIntegerField(default=0)
+    RowsInserted = models.BigIntegerField(default=0)
+    RowsRejected = models.BigIntegerField(default=0)
+    RejectedLines = models.JSONField(default=list, blank=True)  # First GALAMSEY_INGEST_MAX_ERRORS rejected lines
+    Error = models.TextField(blank=True)
+    FileID = models.ForeignKey(UploadedFile, on_delete=models.SET_NULL, null=True, blank=True, related_name='UploadJobs')
+    DateCreated = models.DateTimeField(auto_now_add=True)
+    DateStarted = models.DateTimeField(null=True, blank=True)
+    DateFinished = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
-        return f"[{self.id}] [{self.Town}] - [{self.Region}] - [{self.Number_of_Galamsay_Sites}] - [{self.FileID}]"
\ No newline at end of file
+        return f"[{self.id}] [{self.FileName}] - [{self.Status}]"
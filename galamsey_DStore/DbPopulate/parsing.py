@@ -0,0 +1,220 @@
+"""
+CSV parsing and validation for the ingest pipeline.
+
+Every row is checked (three fields, a Town and a Region, a non-negative
+integer number of sites) and the rows that fail are reported by line number
+in a capped error report. A header row, recognised by its column names, is
+skipped rather than rejected.
+
+Uploads stored on disk (large uploads are spooled to a temporary file) are
+split into byte ranges ending on line boundaries and parsed in a process
+pool, one range per task; results come back in file order, so line numbers
+and the order rows are written in are the same as a sequential parse.
+Quoted fields spanning several lines are not supported by the parallel path.
+"""
+import codecs
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+DEFAULT_MAX_ERRORS = 100
+DEFAULT_PARSE_WORKERS = os.cpu_count() or 1
+DEFAULT_PARALLEL_PARSE_MIN_BYTES = 16 * 1024 * 1024
+DEFAULT_PARSE_CHUNK_BYTES = 4 * 1024 * 1024
+
+HEADER_NAMES = {'town', 'region', 'number_of_galamsay_sites'}
+
+
+class ErrorReport:
+    """
+    Rejected lines as {"line", "reason"}, keeping the first max_errors of them
+    but counting them all.
+    """
+
+    def __init__(self, max_errors=None):
+        self.max_errors = get_max_errors() if max_errors is None else max_errors
+        self.count = 0
+        self.errors = []
+
+    def add(self, line, reason):
+        self.count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "reason": reason})
+
+    def extend(self, errors, count):
+        self.count += count
+        self.errors.extend(errors[:max(0, self.max_errors - len(self.errors))])
+
+    @property
+    def truncated(self):
+        return self.count > len(self.errors)
+
+
+def get_max_errors():
+    return getattr(settings, 'GALAMSEY_INGEST_MAX_ERRORS', DEFAULT_MAX_ERRORS)
+
+
+def iter_lines(chunks, encoding='utf-8'):
+    """
+    Yield decoded lines from byte chunks without reading the whole file into memory.
+    Line endings are kept so the csv module can handle them itself.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def parse_row(row):
+    """
+    Turn a csv row into (Town, Region, Number_of_Galamsay_Sites).
+    Raises ValueError, with the reason, when the row is not valid.
+    """
+    if len(row) != 3:
+        raise ValueError(f"Expected 3 fields, got {len(row)}")
+    town, region, sites = (value.strip() for value in row)
+    if not town:
+        raise ValueError("Town is empty")
+    if not region:
+        raise ValueError("Region is empty")
+    try:
+        sites = int(sites)
+    except ValueError:
+        raise ValueError(f"Number_of_Galamsay_Sites is not an integer: {sites!r}") from None
+    if sites < 0:
+        raise ValueError(f"Number_of_Galamsay_Sites is negative: {sites}")
+    return town, region, sites
+
+
+def is_header(row):
+    """
+    A first row naming the columns, e.g. `Town,Region,Number_of_Galamsay_Sites`.
+    """
+    if len(row) != 3 or row[2].strip().lstrip('-').isdigit():
+        return False
+    return any(value.strip().lower() in HEADER_NAMES for value in row)
+
+
+def iter_parsed_rows(lines, errors, first_line=0, has_header=True):
+    """
+    Parse csv lines into (line number, Town, Region, sites) tuples, adding the
+    rejected lines to errors. Line numbers are counted from first_line.
+    """
+    reader = csv.reader(lines)
+    for row in reader:
+        if not row:
+            continue  # Blank line
+        if has_header:
+            has_header = False
+            if is_header(row):
+                continue
+        try:
+            town, region, sites = parse_row(row)
+        except ValueError as error:
+            errors.add(first_line + reader.line_num, str(error))
+            continue
+        yield first_line + reader.line_num, town, region, sites
+
+
+def parse_range(path, start, end, encoding='utf-8', max_errors=DEFAULT_MAX_ERRORS):
+    """
+    Parse the bytes [start, end) of a file; runs in a worker process.
+    Returns (rows, errors, error count, line count) with line numbers
+    relative to the start of the range.
+    """
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        data = handle.read(end - start)
+    errors = ErrorReport(max_errors)
+    rows = list(iter_parsed_rows(iter_lines([data], encoding), errors, has_header=(start == 0)))
+    return rows, errors.errors, errors.count, data.count(b'\n')
+
+
+def split_ranges(path, chunk_bytes):
+    """
+    (start, end) byte ranges covering a file, each ending just after a newline.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as handle:
+        start = 0
+        while start < size:
+            handle.seek(min(start + chunk_bytes, size))
+            handle.readline()
+            end = min(handle.tell(), size)
+            yield start, end
+            start = end
+
+
+def get_parse_workers():
+    return getattr(settings, 'GALAMSEY_PARSE_WORKERS', DEFAULT_PARSE_WORKERS)
+
+
+def local_path(file_obj):
+    """
+    Path of an upload that is stored on disk, or None.
+    """
+    if hasattr(file_obj, 'temporary_file_path'):
+        return file_obj.temporary_file_path()
+    name = getattr(getattr(file_obj, 'file', None), 'name', None)
+    return name if isinstance(name, str) and os.path.isfile(name) else None
+
+
+def parallel_parse_path(file_obj):
+    """
+    Path to parse file_obj from in parallel, or None when it should be read sequentially.
+    """
+    if get_parse_workers() < 2:
+        return None
+    path = local_path(file_obj)
+    min_bytes = getattr(settings, 'GALAMSEY_PARALLEL_PARSE_MIN_BYTES', DEFAULT_PARALLEL_PARSE_MIN_BYTES)
+    if path is None or os.path.getsize(path) < min_bytes:
+        return None
+    return path
+
+
+def iter_parallel_rows(path, errors, progress=None):
+    """
+    Parse a file on disk in a process pool, yielding (line number, Town, Region, sites)
+    in file order. progress(bytes) is called as each range is done.
+    """
+    chunk_bytes = getattr(settings, 'GALAMSEY_PARSE_CHUNK_BYTES', DEFAULT_PARSE_CHUNK_BYTES)
+    workers = get_parse_workers()
+    # Spawned workers: forking a server process that runs threads is unsafe
+    context = multiprocessing.get_context('spawn')
+    ranges = iter(split_ranges(path, chunk_bytes))
+    first_line = 0
+
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    try:
+        # Keep a bounded number of ranges in flight so memory stays flat
+        pending = []
+        for _ in range(workers * 2):
+            submit_next(executor, path, ranges, pending, errors.max_errors)
+        while pending:
+            (start, end), future = pending.pop(0)
+            rows, range_errors, error_count, line_count = future.result()
+            submit_next(executor, path, ranges, pending, errors.max_errors)
+            errors.extend([{"line": first_line + error["line"], "reason": error["reason"]} for error in range_errors], error_count)
+            for line, town, region, sites in rows:
+                yield first_line + line, town, region, sites
+            first_line += line_count
+            if progress:
+                progress(end - start)
+    finally:
+        # The ingest may stop early (e.g. a delta that grew too large)
+        executor.shutdown(cancel_futures=True)
+
+
+def submit_next(executor, path, ranges, pending, max_errors):
+    byte_range = next(ranges, None)
+    if byte_range is not None:
+        pending.append((byte_range, executor.submit(parse_range, path, *byte_range, max_errors=max_errors)))
@@ -0,0 +1,156 @@
+"""
+Deleting large numbers of SiteRecords, whole files and expired uploads.
+
+Records are deleted in bounded batches, each in its own short transaction
+followed by a short pause, so a big delete never holds the write lock for
+long, lets concurrent ingests in between batches, and never loads the rows
+into Python (Django's CASCADE would collect them all first). Files that
+lost some records get their aggregates, snapshot and cached responses
+rebuilt. Before the first batch, the files involved lose their ContentHash
+in a transaction of its own, so a purge that is interrupted part way never
+leaves a half-deleted file as the target of duplicate uploads. Purged files keep their aggregates until the file row itself is
+deleted, so their analytics stay consistent while the records go.
+"""
+import glob
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .aggregates import build_region_aggregates
+from .caching import invalidate_file
+from .exports import export_dir, spool_version
+from .models import SiteRecords, UploadedFile
+from .snapshots import build_snapshot, snapshot_dir, snapshots_enabled
+
+DEFAULT_PURGE_BATCH_SIZE = 10000
+DEFAULT_PURGE_BATCH_PAUSE = 0.05
+
+
+def get_purge_batch_size():
+    return getattr(settings, 'GALAMSEY_PURGE_BATCH_SIZE', DEFAULT_PURGE_BATCH_SIZE)
+
+
+def delete_records(queryset, batch_size=None):
+    """
+    Delete the SiteRecords of a queryset a batch at a time.
+    Returns (records deleted, ids of the files they belonged to).
+    """
+    batch_size = batch_size or get_purge_batch_size()
+    pause = getattr(settings, 'GALAMSEY_PURGE_BATCH_PAUSE', DEFAULT_PURGE_BATCH_PAUSE)
+    deleted = 0
+    file_ids = set()
+    while True:
+        batch = list(queryset.order_by('id').values_list('id', 'FileID')[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic():
+            # SiteRecords have no dependents, so this is a single DELETE
+            SiteRecords.objects.filter(id__in=[record_id for record_id, _ in batch]).delete()
+        deleted += len(batch)
+        file_ids.update(file_id for _, file_id in batch)
+        if pause and len(batch) == batch_size:
+            time.sleep(pause)  # Let waiting writers take the lock
+    return deleted, file_ids
+
+
+def refresh_files(file_ids):
+    """
+    Bring files whose records were deleted up to date: new aggregates and
+    snapshot, and a new DateModified and no ContentHash, since their content
+    no longer matches any upload.
+    """
+    for uploaded_file in UploadedFile.objects.filter(id__in=file_ids):
+        with transaction.atomic():
+            UploadedFile.objects.filter(id=uploaded_file.id).update(DateModified=timezone.now(), ContentHash=None)
+            uploaded_file.refresh_from_db(fields=['DateModified', 'ContentHash'])
+            build_region_aggregates(uploaded_file)
+            if snapshots_enabled():
+                build_snapshot(uploaded_file)
+        invalidate_file(uploaded_file.id)
+
+
+def forget_content(files):
+    """
+    Clear the ContentHash of files, so no upload is matched to them as a duplicate.
+    """
+    with transaction.atomic():
+        files.update(ContentHash=None)
+
+
+def delete_records_and_refresh(queryset, batch_size=None):
+    forget_content(UploadedFile.objects.filter(id__in=queryset.values('FileID')))
+    deleted, file_ids = delete_records(queryset, batch_size)
+    refresh_files(file_ids)
+    return deleted
+
+
+def purge_file(uploaded_file, batch_size=None):
+    """
+    Delete a file: its records in batches, then the file with its aggregates.
+    Returns the number of records deleted.
+    """
+    forget_content(UploadedFile.objects.filter(id=uploaded_file.id))
+    deleted, _ = delete_records(SiteRecords.objects.filter(FileID=uploaded_file), batch_size)
+    # Nothing is left to collect, so this is a handful of small statements
+    uploaded_file.delete()
+    return deleted
+
+
+def purge_files(file_ids, batch_size=None):
+    deleted = 0
+    for uploaded_file in UploadedFile.objects.filter(id__in=file_ids).order_by('id'):
+        deleted += purge_file(uploaded_file, batch_size)
+    return deleted
+
+
+def retention_candidates(keep_last=None, max_age_days=None):
+    """
+    Files that fall outside the retention policy: all but the newest keep_last
+    uploads of each FileName, and every upload older than max_age_days.
+    """
+    files = UploadedFile.objects.none()
+    if keep_last is not None:
+        ranked = UploadedFile.objects.annotate(
+            position=Window(RowNumber(), partition_by=[F('FileName')], order_by=[F('DateUploaded').desc(), F('id').desc()])
+        )
+        files |= UploadedFile.objects.filter(id__in=ranked.filter(position__gt=keep_last).values('id'))
+    if max_age_days is not None:
+        files |= UploadedFile.objects.filter(DateUploaded__lt=timezone.now() - timedelta(days=max_age_days))
+    return files.order_by('DateUploaded', 'id')
+
+
+def stale_spool_files():
+    """
+    Snapshots of files that no longer exist, and spooled exports of files that
+    no longer exist or of older versions of a file.
+    """
+    current = {uploaded_file.id: uploaded_file for uploaded_file in UploadedFile.objects.only('id', 'DateModified')}
+    stale = []
+    for path in glob.glob(os.path.join(snapshot_dir(), '*.gcol')):
+        file_id = os.path.basename(path).split('.')[0]
+        if file_id.isdigit() and int(file_id) not in current:
+            stale.append(path)
+    for path in glob.glob(os.path.join(export_dir(), '*-*')):
+        name = os.path.basename(path)
+        if name.endswith('.tmp'):
+            continue  # Being written
+        file_id = name.split('-')[0]
+        uploaded_file = current.get(int(file_id)) if file_id.isdigit() else None
+        version = uploaded_file and spool_version(uploaded_file)
+        if version is None or name.split('.')[0] != version:
+            stale.append(path)
+    return stale
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
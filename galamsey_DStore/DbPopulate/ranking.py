@@ -0,0 +1,169 @@
+"""
+Rankings of a file's regions and towns.
+
+A file's region rankings are built once and kept in a small per-process LRU,
+keyed by the file's cache version so re-uploads and deletes are picked up.
+Top-K, bottom-K, threshold and percentile questions are then answered by
+slicing or bisecting the sorted values instead of grouping and sorting again.
+
+Towns are ranked per site record, so a file can have millions of them; they
+are read with ORDER BY/LIMIT queries on the (FileID, Number_of_Galamsay_Sites)
+index rather than kept in memory, and one response holds at most
+GALAMSEY_RANKING_MAX_TOWNS of them.
+"""
+import math
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+
+from .aggregates import region_stats
+from .caching import file_version
+from .models import SiteRecords
+
+DEFAULT_RANKING_CACHE_SIZE = 32
+DEFAULT_RANKING_MAX_TOWNS = 10000
+
+# Region metrics and the response key each one is reported under
+REGION_METRICS = {
+    'sum': 'total_sites',
+    'avg': 'average_sites',
+    'max': 'max_sites',
+    'min': 'min_sites',
+    'count': 'record_count',
+}
+
+
+# Fields of a town ranking entry
+TOWN_FIELDS = ('Town__Name', 'Region__Name', 'Number_of_Galamsay_Sites')
+
+
+class SortedRanking:
+    """
+    Items sorted by ascending value, with the values kept in a parallel list for bisect.
+    """
+
+    def __init__(self, items, key):
+        self.items = sorted(items, key=key)
+        self.values = [key(item) for item in self.items]
+
+    def __len__(self):
+        return len(self.items)
+
+    def top(self, k):
+        return self.items[:-k - 1:-1] if k > 0 else []
+
+    def bottom(self, k):
+        return self.items[:k] if k > 0 else []
+
+    def above(self, threshold):
+        """
+        Items with a value strictly greater than threshold, highest first.
+        """
+        return self.items[bisect_right(self.values, threshold):][::-1]
+
+    def at_least(self, threshold):
+        return self.items[bisect_left(self.values, threshold):][::-1]
+
+    def percentile_cutoff(self, percentile):
+        """
+        Nearest-rank value at the given percentile (0-100), or None when empty.
+        """
+        if not self.values:
+            return None
+        rank = max(1, math.ceil(percentile / 100 * len(self.values)))
+        return self.values[rank - 1]
+
+
+class FileRankings:
+    """
+    Region rankings for every metric.
+    """
+
+    def __init__(self, uploaded_file):
+        self.uploaded_file = uploaded_file
+        regions = [
+            {
+                'Region': aggregate.Region.Name,
+                'sum': aggregate.TotalSites,
+                'avg': aggregate.TotalSites / aggregate.RecordCount,
+                'max': aggregate.MaxSites,
+                'min': aggregate.MinSites,
+                'count': aggregate.RecordCount,
+            }
+            for aggregate in region_stats(uploaded_file)
+        ]
+        self.regions = {
+            metric: SortedRanking(regions, key=lambda region, metric=metric: region[metric])
+            for metric in REGION_METRICS
+        }
+
+    @property
+    def record_count(self):
+        return sum(self.regions['count'].values)
+
+
+def get_max_towns():
+    return getattr(settings, 'GALAMSEY_RANKING_MAX_TOWNS', DEFAULT_RANKING_MAX_TOWNS)
+
+
+def town_ranking(uploaded_file, mode, value, record_count):
+    """
+    (Town, Region, sites) of a file's site records, highest first except for
+    bottom. Ties are ordered by id the same way the sorted rankings order them.
+    Raises ValueError when more than GALAMSEY_RANKING_MAX_TOWNS would be returned.
+    """
+    limit = get_max_towns()
+    if mode in ('top', 'bottom') and value > limit:
+        raise ValueError(f"At most {limit} towns per request")
+    sites = SiteRecords.objects.filter(FileID=uploaded_file)
+    highest_first = ('-Number_of_Galamsay_Sites', '-id')
+    if mode == 'top':
+        sites = sites.order_by(*highest_first)[:value]
+    elif mode == 'bottom':
+        sites = sites.order_by('Number_of_Galamsay_Sites', 'id')[:value]
+    elif mode == 'above':
+        sites = sites.filter(Number_of_Galamsay_Sites__gt=value).order_by(*highest_first)[:limit + 1]
+    else:
+        if not record_count:
+            return []
+        # Nearest-rank cutoff, read at its offset in the index
+        rank = max(1, math.ceil(value / 100 * record_count))
+        cutoff = sites.order_by('Number_of_Galamsay_Sites', 'id').values_list('Number_of_Galamsay_Sites', flat=True)[rank - 1:rank]
+        if not cutoff:
+            return []
+        sites = sites.filter(Number_of_Galamsay_Sites__gte=cutoff[0]).order_by(*highest_first)[:limit + 1]
+    towns = list(sites.values_list(*TOWN_FIELDS))
+    if len(towns) > limit:
+        raise ValueError(f"More than {limit} towns match; raise {mode} or use top")
+    return towns
+
+
+_rankings = OrderedDict()
+_rankings_lock = Lock()
+
+
+def get_file_rankings(uploaded_file):
+    """
+    Rankings of a file, built once per file version and reused afterwards.
+    """
+    key = (uploaded_file.id, file_version(uploaded_file.id))
+    with _rankings_lock:
+        rankings = _rankings.get(key)
+        if rankings is not None:
+            _rankings.move_to_end(key)
+            return rankings
+
+    rankings = FileRankings(uploaded_file)
+    with _rankings_lock:
+        _rankings[key] = rankings
+        max_size = getattr(settings, 'GALAMSEY_RANKING_CACHE_SIZE', DEFAULT_RANKING_CACHE_SIZE)
+        while len(_rankings) > max_size:
+            _rankings.popitem(last=False)
+    return rankings
+
+
+def clear_rankings():
+    with _rankings_lock:
+        _rankings.clear()
@@ -0,0 +1,78 @@
+"""
+JSON rendering for the API through orjson when it is installed.
+
+The output is byte for byte what DRF's JSONRenderer produces with the
+default settings (compact, UTF-8, U+2028/U+2029 escaped, DRF's encoding of
+dates, decimals and lazy strings). orjson writes floats below 1e-4 or from
+1e16 up differently from the json module, and writes NaN and infinities as
+null where the json module refuses them, so a response that may hold one is
+rendered again with the json module. Without orjson, or for indented
+output, JSONRenderer itself is used.
+"""
+import math
+import re
+from decimal import Decimal
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised when orjson is not installed
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+# Numbers orjson formats differently: exponents (1e16, 2.5e-7) and small
+# decimals (0.00001). Starting the pattern with the literal "e" keeps the scan fast.
+EXPONENT_RE = re.compile(rb'e(?<=[0-9]e)[-+]?[0-9]')
+SMALL_DECIMAL = b'0.0000'
+
+
+def has_non_finite(data):
+    """
+    Whether data holds a NaN or infinite float or Decimal.
+    """
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, Decimal):
+        return not data.is_finite()
+    if isinstance(data, dict):
+        return any(map(has_non_finite, data.values()))
+    if isinstance(data, (list, tuple)):
+        return any(map(has_non_finite, data))
+    return False
+
+
+def orjson_dumps(data):
+    """
+    data as JSON bytes, or None when orjson cannot match the json module's output.
+    """
+    if orjson is None:
+        return None
+    try:
+        content = orjson.dumps(data, default=JSONEncoder().default, option=ORJSON_OPTIONS)
+    except TypeError:
+        return None  # Let the json module raise or handle it
+    if SMALL_DECIMAL in content or EXPONENT_RE.search(content):
+        return None
+    if b'null' in content and has_non_finite(data):
+        return None  # orjson wrote it as null
+    return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson, with the same output and errors.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.compact and self.strict and not self.ensure_ascii:
+            if self.get_indent(accepted_media_type, renderer_context or {}) is None:
+                content = orjson_dumps(data)
+                if content is not None:
+                    return content
+        return super().render(data, accepted_media_type, renderer_context)
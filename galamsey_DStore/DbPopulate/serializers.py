@@ -1,7 +1,10 @@
 from rest_framework import serializers
-from .models import UploadedFile, SiteRecords
+from .models import UploadedFile, SiteRecords, UploadJob
 
 class SiteRecordsSerializer(serializers.ModelSerializer):
+    Town = serializers.CharField(source='Town.Name')
+    Region = serializers.CharField(source='Region.Name')
+
     class Meta:
         model = SiteRecords
         fields = ['id', 'Town', 'Region', 'Number_of_Galamsay_Sites']
@@ -21,6 +24,17 @@ class UploadedFileSerializer(serializers.ModelSerializer):
         fields = ['id', 'FileName', 'DateUploaded']
 
 class RecordSiteSerializer(serializers.ModelSerializer):
+    Town = serializers.CharField(source='Town.Name')
+    Region = serializers.CharField(source='Region.Name')
+
     class Meta:
         model = SiteRecords
-        fields = ['id', 'Town', 'Region', 'Number_of_Galamsay_Sites', 'FileID']
\ No newline at end of file
+        fields = ['id', 'Town', 'Region', 'Number_of_Galamsay_Sites', 'FileID']
+
+class UploadJobSerializer(serializers.ModelSerializer):
+    JobID = serializers.IntegerField(source='id', read_only=True)
+
+    class Meta:
+        model = UploadJob
+        fields = ['JobID', 'FileName', 'Status', 'BytesTotal', 'BytesRead', 'RowsInserted', 'RowsRejected',
+                  'RejectedLines', 'FileID', 'Error', 'DateCreated', 'DateStarted', 'DateFinished']
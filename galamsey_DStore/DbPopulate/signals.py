@@ -0,0 +1,49 @@
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from .caching import invalidate_file
+from .exports import delete_exports
+from .models import UploadedFile
+from .snapshots import delete_snapshot
+
+
+@receiver(post_save, sender=UploadedFile)
+@receiver(post_delete, sender=UploadedFile)
+def invalidate_file_responses(sender, instance, **kwargs):
+    """
+    Drop cached responses of a file when it is (re)uploaded or deleted.
+    Runs again after commit so nothing cached mid-transaction survives.
+    """
+    invalidate_file(instance.id)
+    transaction.on_commit(lambda: invalidate_file(instance.id))
+
+
+@receiver(post_delete, sender=UploadedFile)
+def delete_file_snapshot(sender, instance, **kwargs):
+    """
+    Remove a deleted file's columnar snapshot once the delete is committed.
+    """
+    file_id = instance.id
+    transaction.on_commit(lambda: delete_snapshot(file_id))
+
+
+@receiver(post_delete, sender=UploadedFile)
+def delete_file_exports(sender, instance, **kwargs):
+    """
+    Remove a deleted file's spooled exports once the delete is committed.
+    """
+    file_id = instance.id
+    transaction.on_commit(lambda: delete_exports(file_id))
+
+
+@receiver(post_migrate)
+def enable_wal(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Put a migrated SQLite database in WAL mode, which sticks to the file.
+    """
+    connection = connections[using]
+    if sender.name != 'DbPopulate' or connection.vendor != 'sqlite' or connection.is_in_memory_db():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
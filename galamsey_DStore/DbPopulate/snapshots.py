@@ -0,0 +1,284 @@
+"""
+Columnar, memory-mapped snapshots of uploaded files.
+
+When GALAMSEY_SNAPSHOTS_ENABLED is set, every ingested file is also written
+to a single snapshot file holding its Region and Town columns
+dictionary-encoded as uint32 codes and its Number_of_Galamsay_Sites as an
+int32 array. Readers mmap the file, so worker processes share it through
+the page cache, and region statistics are computed with vectorized NumPy
+operations when NumPy is installed (pure Python over the mapped arrays
+otherwise).
+
+Layout: b'GCOL', a uint32 format version and a uint64 header length, then a
+JSON header (dictionaries, row count, column offsets) and the columns, each
+aligned to 8 bytes.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import uuid
+from array import array
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - exercised when NumPy is not installed
+    numpy = None
+
+MAGIC = b'GCOL'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<4sIQ')
+ALIGNMENT = 8
+COLUMNS = (('region', 'I'), ('town', 'I'), ('sites', 'i'))
+NUMPY_DTYPES = {'I': '<u4', 'i': '<i4'}
+DEFAULT_OPEN_SNAPSHOTS = 64
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshots_enabled():
+    return getattr(settings, 'GALAMSEY_SNAPSHOTS_ENABLED', False)
+
+
+def snapshot_dir():
+    return str(getattr(settings, 'GALAMSEY_SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'snapshots')))
+
+
+def snapshot_path(file_id):
+    return os.path.join(snapshot_dir(), f'{file_id}.gcol')
+
+
+def file_token(uploaded_file):
+    """
+    Identifies the upload a snapshot belongs to, so a snapshot left behind
+    for a reused file id is never read.
+    """
+    return uploaded_file.DateModified.isoformat()
+
+
+def _padding(offset):
+    return -offset % ALIGNMENT
+
+
+class SnapshotWriter:
+    """
+    Streams rows into per-column temporary files, then assembles the snapshot.
+    The finished snapshot only replaces the live one when the transaction commits.
+    """
+
+    def __init__(self, uploaded_file):
+        self.uploaded_file = uploaded_file
+        os.makedirs(snapshot_dir(), exist_ok=True)
+        self.dictionaries = {'region': {}, 'town': {}}
+        self.buffers = {name: array(typecode) for name, typecode in COLUMNS}
+        self.columns = {name: tempfile.TemporaryFile(dir=snapshot_dir()) for name, _ in COLUMNS}
+        self.rows = 0
+        self.temporary_path = None
+
+    def add(self, town, region, sites):
+        self.buffers['region'].append(self._code('region', region))
+        self.buffers['town'].append(self._code('town', town))
+        self.buffers['sites'].append(sites)
+        self.rows += 1
+        if len(self.buffers['sites']) >= 65536:
+            self.flush()
+
+    def _code(self, column, value):
+        dictionary = self.dictionaries[column]
+        code = dictionary.get(value)
+        if code is None:
+            code = dictionary[value] = len(dictionary)
+        return code
+
+    def flush(self):
+        for name, buffer in self.buffers.items():
+            if sys.byteorder != 'little':
+                buffer.byteswap()
+            self.columns[name].write(buffer.tobytes())
+            del buffer[:]
+
+    def finish(self):
+        """
+        Write the snapshot next to the live one and publish it on commit.
+        """
+        self.temporary_path = f'{snapshot_path(self.uploaded_file.id)}.{uuid.uuid4().hex}.tmp'
+        self.write(self.temporary_path)
+        transaction.on_commit(self.publish)
+
+    def write(self, path):
+        """
+        Assemble the snapshot at path.
+        """
+        self.flush()
+        header = {
+            'version': FORMAT_VERSION,
+            'file_id': self.uploaded_file.id,
+            'token': file_token(self.uploaded_file),
+            'rows': self.rows,
+            'regions': list(self.dictionaries['region']),
+            'towns': list(self.dictionaries['town']),
+            'columns': {},
+        }
+        # Column offsets depend on the header length, which depends on the offsets:
+        # reserve enough digits by sizing the header with placeholder offsets first
+        for name, typecode in COLUMNS:
+            header['columns'][name] = {'offset': 10 ** 15, 'typecode': typecode}
+        header_length = len(json.dumps(header).encode('utf-8'))
+        offset = PREAMBLE.size + header_length
+        for name, typecode in COLUMNS:
+            offset += _padding(offset)
+            header['columns'][name] = {'offset': offset, 'typecode': typecode}
+            offset += self.rows * array(typecode).itemsize
+        encoded = json.dumps(header).encode('utf-8').ljust(header_length)
+
+        with open(path, 'wb') as output:
+            output.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, header_length))
+            output.write(encoded)
+            for name, _ in COLUMNS:
+                output.write(b'\0' * _padding(output.tell()))
+                column = self.columns[name]
+                column.seek(0)
+                while True:
+                    chunk = column.read(1 << 20)
+                    if not chunk:
+                        break
+                    output.write(chunk)
+                column.close()
+
+    def publish(self):
+        os.replace(self.temporary_path, snapshot_path(self.uploaded_file.id))
+        self.temporary_path = None
+
+    def discard(self):
+        for column in self.columns.values():
+            column.close()
+        if self.temporary_path and os.path.exists(self.temporary_path):
+            os.remove(self.temporary_path)
+
+
+class Snapshot:
+    """
+    A memory-mapped snapshot; columns are exposed as memoryviews (or NumPy arrays).
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as handle:
+            self.mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, header_length = PREAMBLE.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError(f'{path} is not a version {FORMAT_VERSION} snapshot')
+        self.header = json.loads(self.mmap[PREAMBLE.size:PREAMBLE.size + header_length])
+        self.rows = self.header['rows']
+        self.regions = self.header['regions']
+        self.towns = self.header['towns']
+        self.token = self.header['token']
+
+    def column(self, name):
+        spec = self.header['columns'][name]
+        size = self.rows * array(spec['typecode']).itemsize
+        if numpy is not None:
+            return numpy.frombuffer(self.mmap, dtype=NUMPY_DTYPES[spec['typecode']], count=self.rows, offset=spec['offset'])
+        return memoryview(self.mmap)[spec['offset']:spec['offset'] + size].cast(spec['typecode'])
+
+    def region_stats(self):
+        """
+        {Region: (count, sum, min, max)} over all rows.
+        """
+        if not self.rows:
+            return {}
+        codes = self.column('region')
+        sites = self.column('sites')
+        if numpy is not None:
+            groups = len(self.regions)
+            counts = numpy.bincount(codes, minlength=groups)
+            totals = numpy.bincount(codes, weights=sites, minlength=groups)
+            lowest = numpy.full(groups, numpy.iinfo(numpy.int32).max, dtype=numpy.int64)
+            highest = numpy.full(groups, numpy.iinfo(numpy.int32).min, dtype=numpy.int64)
+            numpy.minimum.at(lowest, codes, sites)
+            numpy.maximum.at(highest, codes, sites)
+            return {
+                region: (int(counts[code]), int(totals[code]), int(lowest[code]), int(highest[code]))
+                for code, region in enumerate(self.regions) if counts[code]
+            }
+
+        stats = [None] * len(self.regions)
+        for code, value in zip(codes, sites):
+            current = stats[code]
+            if current is None:
+                stats[code] = [1, value, value, value]
+            else:
+                current[0] += 1
+                current[1] += value
+                if value < current[2]:
+                    current[2] = value
+                if value > current[3]:
+                    current[3] = value
+        return {region: tuple(stats[code]) for code, region in enumerate(self.regions) if stats[code]}
+
+
+_open_snapshots = OrderedDict()
+_open_snapshots_lock = Lock()
+
+
+def open_snapshot(uploaded_file):
+    """
+    The mapped snapshot of a file, or None if it has none (or only a stale one).
+    Mappings are kept open per process and reused.
+    """
+    path = snapshot_path(uploaded_file.id)
+    try:
+        modified = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    key = (path, modified)
+    with _open_snapshots_lock:
+        snapshot = _open_snapshots.get(key)
+        if snapshot is not None:
+            _open_snapshots.move_to_end(key)
+    if snapshot is None:
+        snapshot = Snapshot(path)
+        with _open_snapshots_lock:
+            _open_snapshots[key] = snapshot
+            while len(_open_snapshots) > getattr(settings, 'GALAMSEY_OPEN_SNAPSHOTS', DEFAULT_OPEN_SNAPSHOTS):
+                _open_snapshots.popitem(last=False)
+
+    return snapshot if snapshot.token == file_token(uploaded_file) else None
+
+
+def build_snapshot(uploaded_file):
+    """
+    Write a file's snapshot from its stored SiteRecords.
+    """
+    from .models import SiteRecords
+
+    writer = SnapshotWriter(uploaded_file)
+    try:
+        rows = (
+            SiteRecords.objects
+            .filter(FileID=uploaded_file)
+            .order_by('id')
+            .values_list('Town__Name', 'Region__Name', 'Number_of_Galamsay_Sites')
+        )
+        for town, region, sites in rows.iterator(chunk_size=10000):
+            writer.add(town, region, sites)
+        writer.finish()
+    except Exception:
+        writer.discard()
+        raise
+
+
+def delete_snapshot(file_id):
+    try:
+        os.remove(snapshot_path(file_id))
+    except FileNotFoundError:
+        pass
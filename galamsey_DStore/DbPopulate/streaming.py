@@ -0,0 +1,147 @@
+"""
+Helpers for returning large row sets without holding them in memory.
+
+Rows are read from `.values_list()` with a chunked `.iterator()` (or
+`.aiterator()` for the async views), turned into dicts by a row builder and
+encoded straight to JSON a chunk at a time, bypassing the DRF serializers.
+"""
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .renderers import orjson_dumps
+
+DEFAULT_STREAM_CHUNK_SIZE = 2000
+
+
+def row_builder(keys):
+    """
+    Function turning a values_list() tuple into a dict with the given keys.
+    """
+    keys = tuple(keys)
+
+    def build(row):
+        return dict(zip(keys, row))
+    return build
+
+
+def build_rows(rows, keys):
+    """
+    List of dicts keyed by keys, from the tuples of a values_list().
+    """
+    return list(map(row_builder(tuple(keys)), rows))
+
+
+def get_stream_chunk_size():
+    return getattr(settings, 'GALAMSEY_STREAM_CHUNK_SIZE', DEFAULT_STREAM_CHUNK_SIZE)
+
+
+def iter_row_chunks(queryset, fields, chunk_size=None):
+    """
+    Yield lists of row dicts (keyed by fields) of at most chunk_size rows.
+    fields is a sequence of field names, or a mapping of keys to the lookups they are read from.
+    """
+    chunk_size = chunk_size or get_stream_chunk_size()
+    lookups = list(fields.values()) if isinstance(fields, dict) else list(fields)
+    build = row_builder(tuple(fields))
+    chunk = []
+    for row in queryset.values_list(*lookups).iterator(chunk_size=chunk_size):
+        chunk.append(build(row))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def aiter_row_chunks(queryset, fields, chunk_size=None):
+    """
+    Async version of iter_row_chunks, reading rows with aiterator().
+    """
+    chunk_size = chunk_size or get_stream_chunk_size()
+    lookups = list(fields.values()) if isinstance(fields, dict) else list(fields)
+    chunk = []
+    # values() rather than values_list(): on a values_list() with related
+    # lookups aiterator() runs the query before switching to a thread
+    async for row in queryset.values(*lookups).aiterator(chunk_size=chunk_size):
+        chunk.append({key: row[lookup] for key, lookup in zip(fields, lookups)})
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_row(row):
+    return json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_chunk(chunk):
+    """
+    The rows of a chunk as comma-separated JSON objects, without the brackets.
+    """
+    content = orjson_dumps(chunk)
+    if content is not None:
+        return content[1:-1]
+    return ','.join(encode_row(row) for row in chunk).encode('utf-8')
+
+
+def encode_ndjson_chunk(chunk):
+    lines = []
+    for row in chunk:
+        content = orjson_dumps(row)
+        lines.append(content if content is not None else encode_row(row).encode('utf-8'))
+        lines.append(b'\n')
+    return b''.join(lines)
+
+
+def iter_json_array(queryset, fields, chunk_size=None):
+    """
+    Encode rows as one JSON array, a chunk of rows at a time.
+    """
+    separator = b'['
+    for chunk in iter_row_chunks(queryset, fields, chunk_size):
+        yield separator + encode_chunk(chunk)
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
+
+
+def iter_ndjson(queryset, fields, chunk_size=None):
+    """
+    Encode rows as newline-delimited JSON, one object per line.
+    """
+    for chunk in iter_row_chunks(queryset, fields, chunk_size):
+        yield encode_ndjson_chunk(chunk)
+
+
+async def aiter_json_array(queryset, fields, chunk_size=None):
+    separator = b'['
+    async for chunk in aiter_row_chunks(queryset, fields, chunk_size):
+        yield separator + encode_chunk(chunk)
+        separator = b','
+    yield b'[]' if separator == b'[' else b']'
+
+
+async def aiter_ndjson(queryset, fields, chunk_size=None):
+    async for chunk in aiter_row_chunks(queryset, fields, chunk_size):
+        yield encode_ndjson_chunk(chunk)
+
+
+def stream_rows(queryset, fields, ndjson=False):
+    """
+    StreamingHttpResponse of the queryset's rows as a JSON array or NDJSON.
+    """
+    if ndjson:
+        return StreamingHttpResponse(iter_ndjson(queryset, fields), content_type='application/x-ndjson')
+    return StreamingHttpResponse(iter_json_array(queryset, fields), content_type='application/json')
+
+
+def astream_rows(queryset, fields, ndjson=False):
+    """
+    stream_rows for async views: the body is an async iterator, so under ASGI
+    no thread is held while the rows are sent.
+    """
+    if ndjson:
+        return StreamingHttpResponse(aiter_ndjson(queryset, fields), content_type='application/x-ndjson')
+    return StreamingHttpResponse(aiter_json_array(queryset, fields), content_type='application/json')
@@ -0,0 +1,88 @@
+"""
+Several analytics of a file answered from one read of its region statistics.
+
+Each metric is named after the endpoint it replaces and reports the same
+payload, so a dashboard can fetch all of its widgets in one request instead
+of one request (and one grouped read) per widget.
+"""
+from .aggregates import region_stats, region_stats_by_file
+
+
+def average_sites_per_region(stats, threshold):
+    return [{"Region": aggregate.Region.Name, "average_sites": aggregate.TotalSites / aggregate.RecordCount} for aggregate in stats]
+
+
+def sites_above_threshold(stats, threshold):
+    return [{"Region": aggregate.Region.Name, "total_sites": aggregate.TotalSites} for aggregate in stats if aggregate.TotalSites > threshold]
+
+
+def region_with_highest_site(stats, threshold):
+    highest = max(stats, key=lambda aggregate: aggregate.TotalSites, default=None)
+    return {"Region": highest.Region.Name, "total_sites": highest.TotalSites} if highest else None
+
+
+def region_totals(stats, threshold):
+    return [
+        {
+            "Region": aggregate.Region.Name,
+            "record_count": aggregate.RecordCount,
+            "total_sites": aggregate.TotalSites,
+            "min_sites": aggregate.MinSites,
+            "max_sites": aggregate.MaxSites,
+        }
+        for aggregate in stats
+    ]
+
+
+def file_totals(stats, threshold):
+    return {
+        "region_count": len(stats),
+        "record_count": sum(aggregate.RecordCount for aggregate in stats),
+        "total_sites": sum(aggregate.TotalSites for aggregate in stats),
+    }
+
+
+SUMMARY_METRICS = {
+    'average_sites_per_region': average_sites_per_region,
+    'sites_above_threshold': sites_above_threshold,
+    'region_with_highest_site': region_with_highest_site,
+    'region_totals': region_totals,
+    'file_totals': file_totals,
+}
+
+# Metrics that can only be computed with a threshold
+THRESHOLD_METRICS = ('sites_above_threshold',)
+
+
+def parse_metrics(names, threshold):
+    """
+    Validate the requested metric names; all metrics when none are given
+    (sites_above_threshold only with a threshold). Raises ValueError.
+    """
+    if not names:
+        return [name for name in SUMMARY_METRICS if threshold is not None or name not in THRESHOLD_METRICS]
+    unknown = [name for name in names if name not in SUMMARY_METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)}. Choose from {', '.join(SUMMARY_METRICS)}")
+    if threshold is None and any(name in THRESHOLD_METRICS for name in names):
+        raise ValueError("sites_above_threshold needs a threshold")
+    return list(dict.fromkeys(names))
+
+
+def summarize(stats, metrics, threshold=None):
+    return {name: SUMMARY_METRICS[name](stats, threshold) for name in metrics}
+
+
+def file_summary(uploaded_file, metrics, threshold=None):
+    return summarize(region_stats(uploaded_file), metrics, threshold)
+
+
+def files_summary(files, metrics, threshold=None):
+    """
+    Summaries of many files, with the aggregates of all of them read in one query.
+    """
+    stats = region_stats_by_file(files)
+    return [
+        {"FileID": uploaded_file.id, **summarize(stats[uploaded_file.id], metrics, threshold)}
+        for uploaded_file in files
+    ]
@@ -1,41 +1,1347 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from .models import UploadedFile, SiteRecords
+from .models import UploadedFile, SiteRecords, UploadJob, RegionAggregate, Region, Town
+from .benchmarks import generate_csv, percentiles
+from .metrics import registry
+from .ranking import clear_rankings
+from . import caching, exports, formats, renderers, snapshots
+from .bulkload import copy_enabled, copy_statement
+from .aggregates import build_region_aggregates
+from .ingest import ingest_csv, update_csv
+from .purge import purge_file, retention_candidates
+from .coalescing import coalesce
+from .renderers import FastJSONRenderer
+from .serializers import AverageSitesPerRegionSerializer, RegionWithHighestSitesSerializer, SiteRecordsSerializer
+from .routers import ReadWriteRouter, reads_from_reader
+
+
+def get_town(name):
+    return Town.objects.get_or_create(Name=name)[0]
+
+
+def get_region(name):
+    return Region.objects.get_or_create(Name=name)[0]
+
 
 class SiteRecordsTestCase(TestCase):
     def setUp(self):
         # Create sample file and site record
         self.file = UploadedFile.objects.create(FileName="test.csv")
         self.site1 = SiteRecords.objects.create(
-            Town="Accra",
-            Region="Greater Accra",
+            Town=get_town("Accra"),
+            Region=get_region("Greater Accra"),
             Number_of_Galamsay_Sites=5,
             FileID=self.file
         )
         self.site2 = SiteRecords.objects.create(
-            Town="Kumasi",
-            Region="Ashanti",
+            Town=get_town("Kumasi"),
+            Region=get_region("Ashanti"),
             Number_of_Galamsay_Sites=10,
             FileID=self.file
         )
         self.client = APIClient()
 
     def test_get_all_sites(self):
-        response = self.client.get(f'/api/getsitedata/{self.file.ID}/')
+        response = self.client.get(f'/api/getsitedata/{self.file.id}/')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 2)
 
+    def test_get_sites_by_cursor(self):
+        response = self.client.get(f'/api/getsitedata/{self.file.id}/?page_size=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([site['Town'] for site in response.data['results']], ["Accra"])
+        self.assertEqual(response.data['next_cursor'], self.site1.id)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([site['Town'] for site in response.data['results']], ["Kumasi"])
+        self.assertIsNone(response.data['next_cursor'])
+
+        response = self.client.get(f'/api/getsitedata/{self.file.id}/?cursor=abc')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_sites(self):
+        expected = self.client.get(f'/api/getsitedata/{self.file.id}/').data
+
+        response = self.client.get(f'/api/getsitedata/{self.file.id}/?stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), expected)
+
+        response = self.client.get(f'/api/getsitedata/{self.file.id}/?stream=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
     def test_average_sites_per_region(self):
-        response = self.client.get(f'/api/averagesitesperregion/{self.file.ID}/')
+        response = self.client.get(f'/api/averagesitesperregion/{self.file.id}/')
         self.assertEqual(response.status_code, 200)
 
     def test_sites_above_threshold(self):
-        response = self.client.get(f'/api/sitesabovethreshold/{self.file.ID}/7/')
+        response = self.client.get(f'/api/sitesabovethreshold/{self.file.id}/7/')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data), 1)  # Only Kumasi has >7 sites
 
     def test_region_with_highest_sites(self):
-        response = self.client.get(f'/api/regionwithhighestsite/{self.file.ID}/')
+        response = self.client.get(f'/api/regionwithhighestsite/{self.file.id}/')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.data['Region'], 'Ashanti')  # Highest sites in Ashanti
 
+
+class AsyncViewsTestCase(TestCase):
+    """
+    The async endpoints must answer exactly like their synchronous counterparts.
+    """
+    def setUp(self):
+        self.file = UploadedFile.objects.create(FileName="async.csv")
+        for town, region, sites in [("Accra", "Greater Accra", 5), ("Kumasi", "Ashanti", 10), ("Obuasi", "Ashanti", 4)]:
+            SiteRecords.objects.create(Town=get_town(town), Region=get_region(region), Number_of_Galamsay_Sites=sites, FileID=self.file)
+        self.async_client = AsyncClient()
+
+    async def assertSameResponse(self, path):
+        expected = await self.sync_get(f'/api/{path}')
+        response = await self.async_client.get(f'/api/async/{path}')
+        self.assertEqual(response.status_code, expected.status_code)
+        # Next-page links point back at the async endpoint
+        self.assertEqual(json.loads(response.content.decode().replace('/api/async/', '/api/')), expected.json())
+
+    async def sync_get(self, url):
+        return await sync_to_async(APIClient().get)(url)
+
+    async def test_analytic_endpoints(self):
+        for path in [
+            f'getsitedata/{self.file.id}/',
+            f'getsitedata/{self.file.id}/?page_size=2',
+            f'averagesitesperregion/{self.file.id}/',
+            f'sitesabovethreshold/{self.file.id}/7/',
+            f'sitesabovethreshold/{self.file.id}/100/',
+            f'regionwithhighestsite/{self.file.id}/',
+            'regionwithhighestsite/999/',
+        ]:
+            with self.subTest(path=path):
+                await self.assertSameResponse(path)
+
+    async def test_stream_sites(self):
+        expected = (await self.sync_get(f'/api/getsitedata/{self.file.id}/')).json()
+        response = await self.async_client.get(f'/api/async/getsitedata/{self.file.id}/?stream=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([json.loads(line) for line in body.decode().splitlines()], expected)
+
+
+class FileUploadTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def upload(self, content, name="upload.csv"):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'), content_type="text/csv")
+        return self.client.post('/api/upload/', {'file': upload}, format='multipart')
+
+    @override_settings(GALAMSEY_INGEST_BATCH_SIZE=2)
+    def test_upload_counts_accepted_and_rejected_rows(self):
+        response = self.upload(
+            "Town,Region,Number_of_Galamsay_Sites\n"
+            "Obuasi,Ashanti,15\n"
+            "Tarkwa,Western,10\n"
+            "\"Kumasi, Central\",Ashanti,3\n"
+            "Tamale,Northern,abc\n"
+            "Prestea,Western\n"
+            "\n"
+            "Konongo,Ashanti,12"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['RowsAccepted'], 4)
+        # The header is skipped, not rejected
+        self.assertEqual(response.data['RowsRejected'], 2)
+        self.assertEqual(response.data['RejectedLines'], [
+            {"line": 5, "reason": "Number_of_Galamsay_Sites is not an integer: 'abc'"},
+            {"line": 6, "reason": "Expected 3 fields, got 2"},
+        ])
+
+        sites = SiteRecords.objects.filter(FileID=response.data['FileID'])
+        self.assertEqual(sites.count(), 4)
+        self.assertTrue(sites.filter(Town__Name="Kumasi, Central", Number_of_Galamsay_Sites=3).exists())
+
+    def test_upload_stores_region_aggregates(self):
+        response = self.upload("Obuasi,Ashanti,15\nKonongo,Ashanti,5\nTarkwa,Western,10\n")
+        aggregates = {a.Region.Name: a for a in RegionAggregate.objects.filter(FileID=response.data['FileID'])}
+        self.assertEqual(set(aggregates), {"Ashanti", "Western"})
+        ashanti = aggregates["Ashanti"]
+        self.assertEqual(
+            (ashanti.RecordCount, ashanti.TotalSites, ashanti.MinSites, ashanti.MaxSites),
+            (2, 20, 5, 15)
+        )
+
+        # File date for the response cache, the file itself, then its aggregates
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/averagesitesperregion/{response.data['FileID']}/")
+        self.assertEqual(response.data, [
+            {"Region": "Ashanti", "average_sites": 10.0},
+            {"Region": "Western", "average_sites": 10.0},
+        ])
+
+    def test_region_and_town_names_are_stored_once(self):
+        self.upload("Obuasi,Ashanti,15\nKonongo,Ashanti,5\nObuasi,Ashanti,2\n")
+        response = self.upload("Obuasi,Ashanti,4\nTarkwa,Western,10\n")
+        self.assertEqual(sorted(Region.objects.values_list('Name', flat=True)), ["Ashanti", "Western"])
+        self.assertEqual(sorted(Town.objects.values_list('Name', flat=True)), ["Konongo", "Obuasi", "Tarkwa"])
+
+        response = self.client.get(f"/api/getsitedata/{response.data['FileID']}/")
+        self.assertEqual([(site['Town'], site['Region']) for site in response.data], [("Obuasi", "Ashanti"), ("Tarkwa", "Western")])
+
+    def test_failed_upload_leaves_nothing_behind(self):
+        with mock.patch.object(SiteRecords.objects, 'bulk_create', side_effect=RuntimeError("disk full")):
+            response = self.upload("Obuasi,Ashanti,15\n")
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(UploadedFile.objects.exists())
+
+    def test_upload_rejects_non_utf8_file(self):
+        upload = SimpleUploadedFile("bad.csv", b"Obuasi,Ashanti,\xff\xfe\n", content_type="text/csv")
+        response = self.client.post('/api/upload/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadedFile.objects.exists())
+
+
+class UploadFormatTestCase(TestCase):
+    rows = [("Obuasi", "Ashanti", 15), ("Tarkwa", "Western", 10), ("Konongo", "Ashanti", 5)]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def upload(self, name, content, content_type="application/octet-stream"):
+        upload = SimpleUploadedFile(name, content, content_type=content_type)
+        return self.client.post('/api/upload/', {'file': upload}, format='multipart')
+
+    def stored_rows(self, response):
+        self.assertEqual(response.status_code, 201, response.data)
+        sites = SiteRecords.objects.filter(FileID=response.data['FileID']).order_by('RowNumber')
+        return list(sites.values_list('Town__Name', 'Region__Name', 'Number_of_Galamsay_Sites'))
+
+    def csv_bytes(self):
+        return ("Town,Region,Number_of_Galamsay_Sites\n" + "".join(f"{t},{r},{n}\n" for t, r, n in self.rows)).encode()
+
+    def ndjson_bytes(self):
+        lines = [json.dumps({"Town": t, "Region": r, "Number_of_Galamsay_Sites": n}) for t, r, n in self.rows]
+        return ("\n".join(lines + ['{"Town": "Tamale"}', 'not json']) + "\n").encode()
+
+    def test_gzip_csv(self):
+        self.assertEqual(self.stored_rows(self.upload("sites.csv.gz", gzip.compress(self.csv_bytes()))), self.rows)
+
+    def test_ndjson_plain_and_compressed(self):
+        response = self.upload("sites.ndjson", self.ndjson_bytes())
+        self.assertEqual(self.stored_rows(response), self.rows)
+        self.assertEqual(response.data['RejectedLines'], [
+            {"line": 4, "reason": "Missing Region, Number_of_Galamsay_Sites"},
+            {"line": 5, "reason": "Not valid JSON"},
+        ])
+        # Told apart by content type alone
+        response = self.upload("sites.upload", self.ndjson_bytes() + b"\n", content_type="application/x-ndjson")
+        self.assertEqual(self.stored_rows(response), self.rows)
+        response = self.upload("sites.ndjson.gz", gzip.compress(self.ndjson_bytes()))
+        self.assertEqual(self.stored_rows(response), self.rows)
+
+    @skipUnless(formats.zstandard, "zstandard is not installed")
+    def test_zstd_csv(self):
+        content = formats.zstandard.ZstdCompressor().compress(self.csv_bytes())
+        self.assertEqual(self.stored_rows(self.upload("sites.csv", content, content_type="application/zstd")), self.rows)
+
+    @skipUnless(formats.zstandard, "zstandard is not installed")
+    def test_truncated_zstd_is_rejected(self):
+        content = formats.zstandard.ZstdCompressor().compress(self.csv_bytes() * 2000)
+        response = self.upload("sites.csv.zst", content[:len(content) // 2])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadedFile.objects.exists())
+
+    @skipUnless(formats.zstandard, "zstandard is not installed")
+    def test_zstd_output_is_bounded(self):
+        content = formats.zstandard.ZstdCompressor().compress(b"\0" * (8 * formats.MAX_DECOMPRESSED_CHUNK))
+        sizes = [len(data) for data in formats.iter_unzstd([content])]
+        self.assertEqual(sum(sizes), 8 * formats.MAX_DECOMPRESSED_CHUNK)
+        self.assertLessEqual(max(sizes), formats.MAX_DECOMPRESSED_CHUNK)
+
+    @skipUnless(formats.pyarrow, "pyarrow is not installed")
+    def test_parquet(self):
+        table = formats.pyarrow.table({
+            "Town": [t for t, _, _ in self.rows] + ["Tamale"],
+            "Region": [r for _, r, _ in self.rows] + [None],
+            "Number_of_Galamsay_Sites": [n for _, _, n in self.rows] + [3],
+        })
+        buffer = io.BytesIO()
+        formats.pyarrow.parquet.write_table(table, buffer)
+        response = self.upload("sites.parquet", buffer.getvalue())
+        self.assertEqual(self.stored_rows(response), self.rows)
+        self.assertEqual(response.data['RejectedLines'], [{"line": 4, "reason": "Region is empty"}])
+
+    def test_corrupt_gzip_is_rejected(self):
+        response = self.upload("sites.csv.gz", b"\x1f\x8b\x08\x00broken")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadedFile.objects.exists())
+
+
+class ParallelParseTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_csv(self, lines):
+        path = os.path.join(self.directory, "parallel.csv")
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(''.join(line + '\n' for line in lines))
+        return path
+
+    def ingest(self, path, **settings):
+        with self.settings(**settings), open(path, 'rb') as handle:
+            result = ingest_csv(File(handle), file_name="parallel.csv")
+        rows = SiteRecords.objects.filter(FileID=result.uploaded_file).order_by('RowNumber')
+        return result, list(rows.values_list('RowNumber', 'Town__Name', 'Region__Name', 'Number_of_Galamsay_Sites'))
+
+    def test_parallel_parse_matches_sequential_parse(self):
+        lines = ["Cape Coast,Region,Number_of_Galamsay_Sites"]
+        for number in range(200):
+            lines.append(f"Town {number},Region {number % 5},{number}" if number % 37 else f"Town {number},,{number}")
+        path = self.write_csv(lines)
+
+        sequential, sequential_rows = self.ingest(path, GALAMSEY_PARSE_WORKERS=1)
+        parallel, parallel_rows = self.ingest(
+            path, GALAMSEY_PARSE_WORKERS=2, GALAMSEY_PARALLEL_PARSE_MIN_BYTES=0, GALAMSEY_PARSE_CHUNK_BYTES=512
+        )
+        self.assertEqual(parallel_rows, sequential_rows)
+        self.assertEqual(len(parallel_rows), 194)
+        self.assertEqual(parallel.errors.errors, sequential.errors.errors)
+        self.assertEqual(parallel.errors.errors[0], {"line": 2, "reason": "Region is empty"})
+        self.assertEqual(parallel.rows_rejected, 6)
+        self.assertEqual(parallel.bytes_read, os.path.getsize(path))
+        self.assertEqual(parallel.content_hash, sequential.content_hash)
+
+    def test_error_report_is_capped(self):
+        path = self.write_csv(["Obuasi,Ashanti,-1", "Tarkwa,Western,ten", "Konongo,Ashanti,5"])
+        result, rows = self.ingest(path, GALAMSEY_INGEST_MAX_ERRORS=1)
+        self.assertEqual(result.rows_rejected, 2)
+        self.assertEqual(result.errors.errors, [{"line": 1, "reason": "Number_of_Galamsay_Sites is negative: -1"}])
+        self.assertTrue(result.errors.truncated)
+        self.assertEqual(len(rows), 1)
+
+
+class ContentAddressedUploadTestCase(TestCase):
+    base = "Town,Region,Number_of_Galamsay_Sites\n" + "".join(f"Town {i},Ashanti,{i}\n" for i in range(20))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def upload(self, content, name="regional.csv"):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'), content_type="text/csv")
+        return self.client.post('/api/upload/', {'file': upload}, format='multipart')
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=10)
+    def test_upload_is_hashed_while_received(self):
+        response = self.upload(self.base)
+        uploaded_file = UploadedFile.objects.get(id=response.data['FileID'])
+        self.assertEqual(uploaded_file.ContentHash, hashlib.sha256(self.base.encode('utf-8')).hexdigest())
+
+    def test_identical_upload_returns_existing_file(self):
+        with CaptureQueriesContext(connection) as context:
+            first = self.upload(self.base)
+        # A new file is looked up by its content once
+        lookups = [query for query in context.captured_queries if query['sql'].startswith('SELECT') and '"ContentHash" =' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        with self.assertNumQueries(1):
+            second = self.upload(self.base, name="resent.csv")
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['UploadStatus'], 'duplicate')
+        self.assertEqual(second.data['FileID'], first.data['FileID'])
+        self.assertEqual(UploadedFile.objects.count(), 1)
+        self.assertEqual(SiteRecords.objects.count(), 20)
+
+        response = self.client.post('/api/upload/?async=1', {
+            'file': SimpleUploadedFile("resent.csv", self.base.encode('utf-8'))
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(UploadJob.objects.exists())
+
+    def test_small_change_is_stored_as_delta(self):
+        first = self.upload(self.base)
+        file_id = first.data['FileID']
+        before = {site.RowNumber: site.id for site in SiteRecords.objects.filter(FileID=file_id)}
+        self.assertEqual(self.client.get(f'/api/regionwithhighestsite/{file_id}/').data['total_sites'], 190)
+
+        # One value edited, the last line dropped and a new line appended
+        changed = self.base.replace("Town 3,Ashanti,3\n", "Town 3,Ashanti,30\n").replace("Town 19,Ashanti,19\n", "")
+        response = self.upload(changed + "Town 20,Western,5\n")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['UploadStatus'], 'updated')
+        self.assertEqual((response.data['FileID'], response.data['RowsChanged']), (file_id, 2))
+
+        sites = SiteRecords.objects.filter(FileID=file_id)
+        self.assertEqual(sites.count(), 20)
+        self.assertEqual(sites.get(Town__Name="Town 3").Number_of_Galamsay_Sites, 30)
+        self.assertFalse(sites.filter(Town__Name="Town 19").exists())
+        # Unchanged rows were left alone
+        self.assertEqual(sites.get(Town__Name="Town 0").id, before[2])
+        self.assertEqual(self.client.get(f'/api/regionwithhighestsite/{file_id}/').data['total_sites'], 198)
+
+    def test_large_change_is_stored_as_new_file(self):
+        first = self.upload(self.base)
+        response = self.upload(self.base.replace("Ashanti", "Western"))
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.data['FileID'], first.data['FileID'])
+        self.assertEqual(SiteRecords.objects.filter(FileID=first.data['FileID'], Region__Name="Ashanti").count(), 20)
+
+
+@override_settings(GALAMSEY_UPLOAD_JOBS_EAGER=True)
+class UploadJobTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.client = APIClient()
+
+    def upload_async(self, content):
+        upload = SimpleUploadedFile("async.csv", content, content_type="text/csv")
+        with self.settings(MEDIA_ROOT=self.media_root), self.captureOnCommitCallbacks(execute=True):
+            return self.client.post('/api/upload/?async=1', {'file': upload}, format='multipart')
+
+    def test_async_upload_returns_job_and_reports_result(self):
+        response = self.upload_async(b"Obuasi,Ashanti,15\nTarkwa,Western,10\nTamale,Northern,abc\n")
+        self.assertEqual(response.status_code, 202)
+
+        response = self.client.get(f"/api/uploadjobs/{response.data['JobID']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['Status'], UploadJob.SUCCEEDED)
+        self.assertEqual(response.data['RowsInserted'], 2)
+        self.assertEqual(response.data['RowsRejected'], 1)
+        self.assertEqual(response.data['BytesRead'], response.data['BytesTotal'])
+        self.assertEqual(SiteRecords.objects.filter(FileID=response.data['FileID']).count(), 2)
+
+    def test_failed_async_upload_is_reported(self):
+        response = self.upload_async(b"Obuasi,Ashanti,\xff\n")
+        job = UploadJob.objects.get(id=response.data['JobID'])
+        self.assertEqual(job.Status, UploadJob.FAILED)
+        self.assertIsNone(job.FileID)
+        self.assertFalse(UploadedFile.objects.exists())
+        # The raw file is removed whatever the outcome
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "uploads")), [])
+
+    def test_lost_jobs_are_reported_as_failed(self):
+        with self.settings(MEDIA_ROOT=self.media_root):
+            stored_path = default_storage.save("uploads/lost.csv", io.BytesIO(b"Obuasi,Ashanti,15\n"))
+            job = UploadJob.objects.create(FileName="lost.csv", StoredPath=stored_path, Status=UploadJob.RUNNING,
+                                           DateStarted=timezone.now() - timedelta(hours=1))
+            with self.settings(GALAMSEY_UPLOAD_JOB_TIMEOUT=2 * 60 * 60):
+                self.assertEqual(self.client.get(f'/api/uploadjobs/{job.id}/').data['Status'], UploadJob.RUNNING)
+            with self.settings(GALAMSEY_UPLOAD_JOB_TIMEOUT=30 * 60):
+                response = self.client.get(f'/api/uploadjobs/{job.id}/')
+            self.assertEqual(response.data['Status'], UploadJob.FAILED)
+            self.assertTrue(response.data['Error'])
+            self.assertFalse(default_storage.exists(stored_path))
+
+    def test_expired_job_stays_failed_when_its_worker_finishes_late(self):
+        from . import jobs
+        real_ingest = jobs.ingest_upload
+
+        def slow_ingest(*args, **kwargs):
+            # The job is reported lost while it is still running
+            job = UploadJob.objects.get(FileName="late.csv")
+            with self.settings(GALAMSEY_UPLOAD_JOB_TIMEOUT=0):
+                jobs.expire_stale_job(job)
+            return real_ingest(*args, **kwargs)
+
+        with self.settings(MEDIA_ROOT=self.media_root):
+            stored_path = default_storage.save("uploads/late.csv", io.BytesIO(b"Obuasi,Ashanti,15\n"))
+            job = UploadJob.objects.create(FileName="late.csv", StoredPath=stored_path)
+            with mock.patch.object(jobs, 'ingest_upload', side_effect=slow_ingest):
+                jobs.run_upload_job(job.id)
+            job.refresh_from_db()
+            self.assertEqual(job.Status, UploadJob.FAILED)
+            self.assertFalse(default_storage.exists(stored_path))
+            # A job expired before a worker picked it up is never run
+            job = UploadJob.objects.create(FileName="queued.csv", StoredPath="uploads/queued.csv", Status=UploadJob.FAILED)
+            jobs.run_upload_job(job.id)
+            job.refresh_from_db()
+            self.assertEqual((job.Status, job.DateStarted), (UploadJob.FAILED, None))
+
+    def test_unknown_job(self):
+        response = self.client.get('/api/uploadjobs/999/')
+        self.assertEqual(response.status_code, 404)
+
+
+class RegionAggregateTestCase(TestCase):
+    def setUp(self):
+        self.file = UploadedFile.objects.create(FileName="legacy.csv")
+        SiteRecords.objects.create(Town=get_town("Obuasi"), Region=get_region("Ashanti"), Number_of_Galamsay_Sites=15, FileID=self.file)
+        SiteRecords.objects.create(Town=get_town("Tarkwa"), Region=get_region("Western"), Number_of_Galamsay_Sites=10, FileID=self.file)
+
+    def test_backfill_command(self):
+        call_command('backfill_region_aggregates', stdout=io.StringIO())
+        self.assertEqual(RegionAggregate.objects.filter(FileID=self.file).count(), 2)
+
+        # Existing aggregates are left alone unless forced
+        RegionAggregate.objects.filter(Region__Name="Western").update(TotalSites=0)
+        call_command('backfill_region_aggregates', stdout=io.StringIO())
+        self.assertEqual(RegionAggregate.objects.get(Region__Name="Western").TotalSites, 0)
+        call_command('backfill_region_aggregates', self.file.id, '--force', stdout=io.StringIO())
+        self.assertEqual(RegionAggregate.objects.get(Region__Name="Western").TotalSites, 10)
+
+    def test_missing_aggregates_are_grouped_read_only(self):
+        client = APIClient()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f'/api/regionwithhighestsite/{self.file.id}/')
+        self.assertEqual(response.data, {"Region": "Ashanti", "total_sites": 15})
+        self.assertFalse(RegionAggregate.objects.filter(FileID=self.file).exists())
+        self.assertFalse([query for query in context.captured_queries if not query['sql'].startswith('SELECT')])
+
+        response = client.post('/api/summary/', {'file_ids': [self.file.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(RegionAggregate.objects.filter(FileID=self.file).exists())
+
+
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.file = UploadedFile.objects.create(FileName="cached.csv")
+        SiteRecords.objects.create(Town=get_town("Obuasi"), Region=get_region("Ashanti"), Number_of_Galamsay_Sites=15, FileID=self.file)
+        SiteRecords.objects.create(Town=get_town("Tarkwa"), Region=get_region("Western"), Number_of_Galamsay_Sites=10, FileID=self.file)
+        self.client = APIClient()
+        self.url = f'/api/averagesitesperregion/{self.file.id}/'
+
+    def test_repeated_requests_are_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        response = self.client.get('/api/cachestats/')
+        self.assertEqual(response.data, {"hits": 1, "misses": 1, "hit_ratio": 0.5, "coalesced": 0})
+
+    def test_conditional_requests_get_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(GALAMSEY_COALESCE_POLL_INTERVAL=0.01)
+    def test_waits_for_a_response_computed_by_another_process(self):
+        version = caching.file_version(self.file.id)
+        key = caching.RESPONSE_KEY.format('average-sites-per-region', self.file.id, version, hashlib.sha1(b'[]').hexdigest())
+        shared = {'data': [{"Region": "Ashanti", "average_sites": 15.0}], 'status': 200}
+        # Another process holds the lock and caches its response a moment later
+        cache.add(caching.LOCK_KEY.format(key), 1, 10)
+        timer = threading.Timer(0.05, cache.set, [key, shared])
+        timer.start()
+        self.addCleanup(timer.cancel)
+        with self.assertNumQueries(1):  # Only the file's DateModified
+            response = self.client.get(self.url)
+        self.assertEqual(response.data, shared['data'])
+        self.assertEqual(self.client.get('/api/cachestats/').data["coalesced"], 1)
+
+    def test_lock_is_released_after_computing(self):
+        self.client.get(self.url)
+        key = caching.RESPONSE_KEY.format('average-sites-per-region', self.file.id, caching.file_version(self.file.id), hashlib.sha1(b'[]').hexdigest())
+        self.assertIsNotNone(cache.get(key))
+        self.assertIsNone(cache.get(caching.LOCK_KEY.format(key)))
+
+    def test_params_are_part_of_the_key(self):
+        above_5 = self.client.get(f'/api/sitesabovethreshold/{self.file.id}/5/')
+        above_12 = self.client.get(f'/api/sitesabovethreshold/{self.file.id}/12/')
+        self.assertEqual(len(above_5.data), 2)
+        self.assertEqual(len(above_12.data), 1)
+        self.assertNotEqual(above_5['ETag'], above_12['ETag'])
+
+    def test_deleting_a_file_invalidates_its_responses(self):
+        etag = self.client.get(self.url)['ETag']
+        self.file.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_streams_are_not_cached(self):
+        self.client.get(f'/api/getsitedata/{self.file.id}/?stream=1')
+        self.client.get(f'/api/getsitedata/{self.file.id}/?stream=1')
+        self.assertEqual(self.client.get('/api/cachestats/').data['hits'], 0)
+
+
+class RankingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_rankings()
+        self.file = UploadedFile.objects.create(FileName="ranking.csv")
+        for town, region, sites in (
+            ("Obuasi", "Ashanti", 15), ("Konongo", "Ashanti", 12), ("Tarkwa", "Western", 10),
+            ("Prestea", "Western", 8), ("Tamale", "Northern", 3), ("Kyebi", "Eastern", 20),
+        ):
+            SiteRecords.objects.create(Town=get_town(town), Region=get_region(region), Number_of_Galamsay_Sites=sites, FileID=self.file)
+        self.client = APIClient()
+
+    def rank(self, query):
+        response = self.client.get(f'/api/ranking/{self.file.id}/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_region_rankings(self):
+        self.assertEqual(self.rank('top=2'), [
+            {"Region": "Ashanti", "total_sites": 27},
+            {"Region": "Eastern", "total_sites": 20},
+        ])
+        self.assertEqual([r["Region"] for r in self.rank('metric=avg&bottom=2')], ["Northern", "Western"])
+        self.assertEqual([r["Region"] for r in self.rank('metric=max&above=12')], ["Eastern", "Ashanti"])
+        self.assertEqual([r["Region"] for r in self.rank('metric=sum&percentile=75')], ["Ashanti", "Eastern"])
+
+    def test_town_rankings(self):
+        self.assertEqual([t["Town"] for t in self.rank('by=town&top=3')], ["Kyebi", "Obuasi", "Konongo"])
+        self.assertEqual([t["Town"] for t in self.rank('by=town&above=10')], ["Kyebi", "Obuasi", "Konongo"])
+        self.assertEqual(self.rank('by=town&above=100'), [])
+
+    def test_town_percentile_and_bottom(self):
+        self.assertEqual([t["Town"] for t in self.rank('by=town&percentile=50')], ["Kyebi", "Obuasi", "Konongo", "Tarkwa"])
+        self.assertEqual([t["Town"] for t in self.rank('by=town&bottom=2')], ["Tamale", "Prestea"])
+
+    @override_settings(GALAMSEY_RANKING_MAX_TOWNS=3)
+    def test_town_rankings_are_capped(self):
+        self.assertEqual(len(self.rank('by=town&above=10')), 3)
+        for query in ('by=town&above=0', 'by=town&percentile=0', 'by=town&top=10000000'):
+            response = self.client.get(f'/api/ranking/{self.file.id}/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn("3 towns", response.data["error"])
+
+    def test_rankings_are_built_once_per_file(self):
+        self.rank('top=1')
+        # Only the file lookup: the sorted regions are reused for any new threshold
+        with self.assertNumQueries(1):
+            self.rank('metric=avg&above=5')
+        # Towns are never loaded whole: one bounded query on top of the file lookup
+        with CaptureQueriesContext(connection) as context:
+            self.rank('by=town&top=2')
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertIn('LIMIT 2', context.captured_queries[-1]['sql'])
+
+    def test_invalid_parameters(self):
+        for query in ('by=village', 'metric=median', 'top=2&above=3', 'top=x', 'percentile=120', 'top=nan', 'top=inf',
+                      'bottom=1e400', 'top=1.5', 'top=-1', 'above=nan', 'above=inf', 'percentile=nan', 'by=town&metric=avg'):
+            response = self.client.get(f'/api/ranking/{self.file.id}/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class SummaryTestCase(TestCase):
+    def setUp(self):
+        self.file = UploadedFile.objects.create(FileName="summary.csv")
+        self.other = UploadedFile.objects.create(FileName="other.csv")
+        for town, region, sites, uploaded_file in [
+            ("Obuasi", "Ashanti", 15, self.file),
+            ("Konongo", "Ashanti", 5, self.file),
+            ("Tarkwa", "Western", 12, self.file),
+            ("Prestea", "Western", 3, self.other),
+        ]:
+            SiteRecords.objects.create(Town=get_town(town), Region=get_region(region), Number_of_Galamsay_Sites=sites, FileID=uploaded_file)
+        self.client = APIClient()
+
+    def test_summary_matches_the_single_endpoints(self):
+        response = self.client.get(f'/api/summary/{self.file.id}/?threshold=13')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['average_sites_per_region'], self.client.get(f'/api/averagesitesperregion/{self.file.id}/').data)
+        self.assertEqual(response.data['sites_above_threshold'], self.client.get(f'/api/sitesabovethreshold/{self.file.id}/13/').data)
+        self.assertEqual(response.data['region_with_highest_site'], self.client.get(f'/api/regionwithhighestsite/{self.file.id}/').data)
+        self.assertEqual(response.data['file_totals'], {"region_count": 2, "record_count": 3, "total_sites": 32})
+
+    def test_requested_metrics_only(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/summary/{self.file.id}/?metrics=file_totals,region_with_highest_site')
+        self.assertEqual(set(response.data), {'FileID', 'file_totals', 'region_with_highest_site'})
+        aggregate_reads = [query for query in context.captured_queries if 'regionaggregate' in query['sql'].lower() and query['sql'].startswith('SELECT')]
+        self.assertLessEqual(len(aggregate_reads), 2)  # Existence check and one read
+
+        self.assertEqual(self.client.get(f'/api/summary/{self.file.id}/?metrics=median').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/summary/{self.file.id}/?metrics=sites_above_threshold').status_code, 400)
+        self.assertEqual(self.client.get('/api/summary/999/').status_code, 404)
+
+    def test_multi_file_summary(self):
+        response = self.client.post('/api/summary/', {
+            "file_ids": [self.file.id, self.other.id, 999],
+            "metrics": ["file_totals"]
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['files'], [
+            {"FileID": self.file.id, "file_totals": {"region_count": 2, "record_count": 3, "total_sites": 32}},
+            {"FileID": self.other.id, "file_totals": {"region_count": 1, "record_count": 1, "total_sites": 3}},
+        ])
+        self.assertEqual(response.data['missing'], [999])
+
+        response = self.client.post('/api/summary/', {"file_ids": "1"}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RegionTrendsTestCase(TestCase):
+    def setUp(self):
+        self.files = []
+        for month, sites in ((1, 10), (2, 20), (3, 30)):
+            uploaded_file = UploadedFile.objects.create(FileName=f"2025-{month:02}.csv")
+            UploadedFile.objects.filter(id=uploaded_file.id).update(DateUploaded=f"2025-{month:02}-15T12:00:00Z")
+            SiteRecords.objects.create(Town=get_town("Obuasi"), Region=get_region("Ashanti"), Number_of_Galamsay_Sites=sites, FileID=uploaded_file)
+            SiteRecords.objects.create(Town=get_town("Konongo"), Region=get_region("Ashanti"), Number_of_Galamsay_Sites=sites, FileID=uploaded_file)
+            SiteRecords.objects.create(Town=get_town("Tarkwa"), Region=get_region("Western"), Number_of_Galamsay_Sites=1, FileID=uploaded_file)
+            self.files.append(uploaded_file)
+        self.client = APIClient()
+
+    def test_trends_for_file_ids(self):
+        ids = ",".join(str(f.id) for f in self.files[:2])
+        response = self.client.get(f'/api/regiontrends/?file_ids={ids}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['regions'][0], {
+            "Region": "Ashanti", "total_sites": 60, "record_count": 4, "average_sites": 15.0, "file_count": 2
+        })
+        ashanti = [t["total_sites"] for t in response.data['trends'] if t["Region"] == "Ashanti"]
+        self.assertEqual(ashanti, [20, 40])
+        # Files without aggregates are grouped on the fly, never written on a GET
+        self.assertFalse(RegionAggregate.objects.exists())
+
+        call_command('backfill_region_aggregates', stdout=io.StringIO())
+        with self.assertNumQueries(2):
+            backfilled = self.client.get(f'/api/regiontrends/?file_ids={ids}')
+        self.assertEqual(backfilled.data, response.data)
+
+    @override_settings(GALAMSEY_CROSS_FILE_MAX_FILES=2)
+    def test_too_many_files_are_refused(self):
+        response = self.client.get('/api/regiontrends/?start=2025-01-01')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("At most 2 files", response.data["error"])
+        self.assertEqual(self.client.get('/api/regiontrends/?start=2025-02-01').status_code, 200)
+
+    def test_trends_for_date_range(self):
+        response = self.client.get('/api/regiontrends/?start=2025-02-01&end=2025-03-15')
+        self.assertEqual([f["FileID"] for f in response.data['files']], [f.id for f in self.files[1:]])
+
+    def test_trends_need_a_filter(self):
+        self.assertEqual(self.client.get('/api/regiontrends/').status_code, 400)
+        self.assertEqual(self.client.get('/api/regiontrends/?file_ids=a').status_code, 400)
+        self.assertEqual(self.client.get('/api/regiontrends/?start=yesterday').status_code, 400)
+        self.assertEqual(self.client.get('/api/regiontrends/?end=2025-13-01').status_code, 400)
+        self.assertEqual(self.client.get('/api/regiontrends/?file_ids=999').status_code, 404)
+
+
+class ImportCSVCommandTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write_csv(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as handle:
+            handle.write(content)
+        return path
+
+    def test_import_is_idempotent_and_updates_in_place(self):
+        path = self.write_csv("regional.csv", "Town,Region,Number_of_Galamsay_Sites\nObuasi,Ashanti,15\nObuasi,Ashanti,15\nTarkwa,Western,10\n")
+        out = io.StringIO()
+        call_command('import_csv', path, stdout=out)
+        self.assertIn("rows/sec", out.getvalue())
+        call_command('import_csv', path, stdout=io.StringIO())
+
+        uploaded_file = UploadedFile.objects.get(FileName="regional.csv")
+        self.assertEqual(SiteRecords.objects.filter(FileID=uploaded_file).count(), 3)
+
+        # Tarkwa changes and the duplicate Obuasi line becomes invalid
+        self.write_csv("regional.csv", "Town,Region,Number_of_Galamsay_Sites\nObuasi,Ashanti,15\nObuasi,Ashanti,\nTarkwa,Western,4\n")
+        call_command('import_csv', path, stdout=io.StringIO())
+        sites = SiteRecords.objects.filter(FileID=uploaded_file).order_by('RowNumber')
+        self.assertEqual(list(sites.values_list('RowNumber', 'Town__Name', 'Number_of_Galamsay_Sites')), [
+            (2, "Obuasi", 15),
+            (4, "Tarkwa", 4),
+        ])
+        self.assertEqual(RegionAggregate.objects.get(FileID=uploaded_file, Region__Name="Western").TotalSites, 4)
+
+    def test_import_glob(self):
+        self.write_csv("a.csv", "Obuasi,Ashanti,15\n")
+        self.write_csv("b.csv", "Tarkwa,Western,10\n")
+        call_command('import_csv', os.path.join(self.directory, "*.csv"), stdout=io.StringIO())
+        self.assertEqual(sorted(UploadedFile.objects.values_list('FileName', flat=True)), ["a.csv", "b.csv"])
+
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            call_command('import_csv', os.path.join(self.directory, "missing.csv"), stdout=io.StringIO())
+
+
+class SnapshotTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_rankings()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(GALAMSEY_SNAPSHOTS_ENABLED=True, GALAMSEY_SNAPSHOT_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+
+    def upload(self, content):
+        upload = SimpleUploadedFile("snapshot.csv", content.encode('utf-8'), content_type="text/csv")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/upload/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return UploadedFile.objects.get(id=response.data['FileID'])
+
+    def assert_region_stats(self, uploaded_file):
+        snapshot = snapshots.open_snapshot(uploaded_file)
+        self.assertIsNotNone(snapshot)
+        self.assertEqual(snapshot.rows, 4)
+        self.assertEqual(snapshot.region_stats(), {
+            "Ashanti": (2, 20, 5, 15),
+            "Western": (1, 10, 10, 10),
+            "Northern": (1, 0, 0, 0),
+        })
+
+    def test_upload_writes_snapshot(self):
+        uploaded_file = self.upload("Obuasi,Ashanti,15\nTarkwa,Western,10\nTamale,Northern,abc\nKonongo,Ashanti,5\nBolga,Northern,0\n")
+        self.assert_region_stats(uploaded_file)
+        with mock.patch.object(snapshots, 'numpy', None):
+            self.assert_region_stats(uploaded_file)
+
+        # The analytics are answered from the snapshot, not from the stored aggregates
+        RegionAggregate.objects.filter(FileID=uploaded_file).delete()
+        response = self.client.get(f'/api/regionwithhighestsite/{uploaded_file.id}/')
+        self.assertEqual(response.data, {"Region": "Ashanti", "total_sites": 20})
+        response = self.client.get(f'/api/sitesabovethreshold/{uploaded_file.id}/5/')
+        self.assertEqual(response.data, [
+            {"Region": "Ashanti", "total_sites": 20},
+            {"Region": "Western", "total_sites": 10},
+        ])
+
+    def test_stale_snapshots_are_ignored_and_removed(self):
+        uploaded_file = self.upload("Obuasi,Ashanti,15\n")
+        path = snapshots.snapshot_path(uploaded_file.id)
+        self.assertTrue(os.path.exists(path))
+
+        # A new upload that reuses the file id must not read the old snapshot
+        uploaded_file.DateModified = uploaded_file.DateModified.replace(year=2000)
+        self.assertIsNone(snapshots.open_snapshot(uploaded_file))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            uploaded_file.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_build_snapshots_command(self):
+        uploaded_file = UploadedFile.objects.create(FileName="old.csv")
+        for town, region, sites in (("Obuasi", "Ashanti", 15), ("Konongo", "Ashanti", 5), ("Tarkwa", "Western", 10), ("Bolga", "Northern", 0)):
+            SiteRecords.objects.create(Town=get_town(town), Region=get_region(region), Number_of_Galamsay_Sites=sites, FileID=uploaded_file)
+        self.assertIsNone(snapshots.open_snapshot(uploaded_file))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('build_snapshots', stdout=io.StringIO())
+        self.assert_region_stats(uploaded_file)
+
+
+class ExportTestCase(TestCase):
+    rows = [("Obuasi", "Ashanti", 15), ("Tarkwa, West", "Western", 10), ("Konongo", "Ashanti", 5)]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.export_dir = os.path.join(directory, "exports")
+        settings_override = override_settings(GALAMSEY_EXPORT_DIR=self.export_dir, GALAMSEY_SNAPSHOT_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.file = UploadedFile.objects.create(FileName="export.csv")
+        for town, region, sites in self.rows:
+            SiteRecords.objects.create(Town=get_town(town), Region=get_region(region), Number_of_Galamsay_Sites=sites, FileID=self.file)
+        self.client = APIClient()
+
+    def export(self, query='', **headers):
+        response = self.client.get(f'/api/export/{self.file.id}/{query}', **headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_csv_export_round_trips(self):
+        response, body = self.export('?fmt=csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="export.csv"', response['Content-Disposition'])
+        self.assertEqual(list(csv.reader(io.StringIO(body.decode()))), [
+            ["Town", "Region", "Number_of_Galamsay_Sites"],
+            *[[town, region, str(sites)] for town, region, sites in self.rows]
+        ])
+
+    def test_ndjson_and_gzip_exports(self):
+        _, body = self.export('?fmt=ndjson')
+        self.assertEqual([json.loads(line) for line in body.decode().splitlines()], [
+            {"Town": town, "Region": region, "Number_of_Galamsay_Sites": sites} for town, region, sites in self.rows
+        ])
+        response, compressed = self.export('?fmt=ndjson&compress=gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(compressed), body)
+
+    def test_columnar_export(self):
+        response, body = self.export('?fmt=columnar')
+        self.assertEqual(response.status_code, 200)
+        path = os.path.join(self.export_dir, "download.gcol")
+        with open(path, 'wb') as handle:
+            handle.write(body)
+        snapshot = snapshots.Snapshot(path)
+        self.assertEqual(snapshot.rows, 3)
+        self.assertEqual(snapshot.region_stats(), {"Ashanti": (2, 20, 5, 15), "Western": (1, 10, 10, 10)})
+
+    def test_range_requests_resume_from_the_spool(self):
+        response, full = self.export()
+        etag = response['ETag']
+        self.assertEqual(len(os.listdir(self.export_dir)), 1)  # Spooled while streaming
+
+        response, part = self.export(HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(part, full[10:])
+        self.assertEqual(response['Content-Range'], f'bytes 10-{len(full) - 1}/{len(full)}')
+
+        response, part = self.export(HTTP_RANGE='bytes=-5', HTTP_IF_RANGE=etag)
+        self.assertEqual(part, full[-5:])
+        response, body = self.export(HTTP_RANGE='bytes=5-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, body), (200, full))
+        response, _ = self.export(HTTP_RANGE=f'bytes={len(full)}-')
+        self.assertEqual(response.status_code, 416)
+
+        response, _ = self.export(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_update_removes_spools_of_the_old_version(self):
+        self.export('?fmt=csv')
+        self.export('?fmt=ndjson')
+        content = "Town,Region,Number_of_Galamsay_Sites\nObuasi,Ashanti,20\n"
+        with self.captureOnCommitCallbacks(execute=True):
+            update_csv(SimpleUploadedFile("export.csv", content.encode()), self.file)
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+        _, body = self.export('?fmt=csv')
+        self.assertEqual(body.decode().splitlines()[1:], ["Obuasi,Ashanti,20"])
+        self.assertEqual(os.listdir(self.export_dir), [os.path.basename(exports.spool_path(self.file, exports.CSV))])
+
+    def test_invalid_requests_and_cleanup(self):
+        self.assertEqual(self.export('?fmt=xml')[0].status_code, 400)
+        self.assertEqual(self.export('?compress=lz4')[0].status_code, 400)
+        self.assertEqual(self.client.get('/api/export/999/').status_code, 404)
+
+        # A range of an export that is not spooled yet gets the whole export, spooled as it streams
+        response, body = self.export(HTTP_RANGE='bytes=0-3')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(body.startswith(b'Town,Region'))
+        self.assertTrue(os.listdir(self.export_dir))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.file.delete()
+        self.assertEqual(os.listdir(self.export_dir), [])
+
+
+
+class CoalescingTestCase(SimpleTestCase):
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return "answer"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(coalesce('key', compute))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [("answer", False)] * 4 + [("answer", True)])
+        # Once it is done, the next caller computes again
+        self.assertEqual(coalesce('key', lambda: "again"), ("again", True))
+
+    def test_waiting_callers_compute_when_the_first_fails(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing():
+            started.set()
+            release.wait(5)
+            raise ValueError("boom")
+
+        def first():
+            with self.assertRaises(ValueError):
+                coalesce('failing', failing)
+
+        results = []
+        leader = threading.Thread(target=first)
+        leader.start()
+        started.wait(5)
+        waiter = threading.Thread(target=lambda: results.append(coalesce('failing', lambda: "recovered")))
+        waiter.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join()
+        waiter.join()
+        self.assertEqual(results, [("recovered", True)])
+
+
+class FastJSONRendererTestCase(TestCase):
+    payloads = [
+        [{"id": 1, "Town": "Obuasi", "Region": "Ashanti", "Number_of_Galamsay_Sites": 15}],
+        {"results": [], "next_cursor": None, "next": "http://testserver/api/getsitedata/1/?cursor=5"},
+        [{"Region": "Ashanti", "average_sites": 10 / 3}, {"Region": "Western", "average_sites": 12.0}],
+        {"tiny": 0.00001, "huge": 1e16, "negative": -2.5e-7},
+        {"Town": "Akyem\u2028Oda \u00e9\u2029", 1: True, None: [1.5, (2, 3)]},
+        {"date": datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=dt_timezone.utc), "day": date(2025, 1, 2)},
+        {"amount": Decimal("1.50"), "label": gettext_lazy("File not found")},
+    ]
+
+    def test_output_matches_json_renderer(self):
+        for data in self.payloads:
+            with self.subTest(data=data):
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_stdlib_fallback(self):
+        with mock.patch.object(renderers, 'orjson', None):
+            for data in self.payloads:
+                self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_indent_and_errors_use_json_renderer(self):
+        data = {"Region": "Ashanti"}
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'), JSONRenderer().render(data, 'application/json; indent=2'))
+        with self.assertRaises(TypeError):
+            FastJSONRenderer().render({"value": object()})
+        # Non-finite floats are refused like JSONRenderer does, not written as null
+        for value in (float('nan'), float('inf'), [None, -float('inf')]):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                FastJSONRenderer().render({"average_sites": value})
+
+    def test_site_data_matches_the_serializers(self):
+        uploaded_file = UploadedFile.objects.create(FileName="render.csv")
+        for town, region, sites in [("Obuasi", "Ashanti", 15), ("Tarkwa", "Western", 10), ("Akyem Oda", "Eastern", 7)]:
+            SiteRecords.objects.create(Town=get_town(town), Region=get_region(region), Number_of_Galamsay_Sites=sites, FileID=uploaded_file)
+        build_region_aggregates(uploaded_file)
+        cache.clear()
+        client = APIClient()
+
+        sites = SiteRecords.objects.filter(FileID=uploaded_file).order_by('id').select_related('Town', 'Region')
+        expected = JSONRenderer().render(SiteRecordsSerializer(sites, many=True).data)
+        self.assertEqual(client.get(f'/api/getsitedata/{uploaded_file.id}/').content, expected)
+        stream = client.get(f'/api/getsitedata/{uploaded_file.id}/?stream=1')
+        self.assertEqual(b''.join(stream.streaming_content), expected)
+
+        averages = [{"Region": region, "average_sites": total} for region, total in [("Ashanti", 15), ("Eastern", 7), ("Western", 10)]]
+        self.assertEqual(
+            client.get(f'/api/averagesitesperregion/{uploaded_file.id}/').content,
+            JSONRenderer().render(AverageSitesPerRegionSerializer(averages, many=True).data)
+        )
+        self.assertEqual(
+            client.get(f'/api/regionwithhighestsite/{uploaded_file.id}/').content,
+            JSONRenderer().render(RegionWithHighestSitesSerializer({"Region": "Ashanti", "total_sites": 15}).data)
+        )
+
+@override_settings(GALAMSEY_UPLOAD_JOBS_EAGER=True)
+class SiteRecordsAdminTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.file = UploadedFile.objects.create(FileName="admin.csv")
+        for town, region, sites in [("Obuasi", "Ashanti", 15), ("Konongo", "Ashanti", 5), ("Tarkwa", "Western", 10)]:
+            SiteRecords.objects.create(Town=get_town(town), Region=get_region(region), Number_of_Galamsay_Sites=sites, FileID=self.file)
+        build_region_aggregates(self.file)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        self.url = '/admin/DbPopulate/siterecords/'
+
+    def test_changelist_search_and_region_filter(self):
+        response = self.client.get(self.url, {'q': 'ashan'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+
+        western = get_region("Western")
+        response = self.client.get(self.url, {'region': western.id})
+        self.assertEqual([site.Town.Name for site in response.context['cl'].result_list], ["Tarkwa"])
+        tarkwa = response.context['cl'].result_list[0]
+        with self.assertNumQueries(0):  # Town, Region and file are selected with the rows
+            self.assertEqual(str(tarkwa), f"[{tarkwa.id}] [Tarkwa] - [Western] - [10] - [{self.file}]")
+        self.assertEqual(cache.get('galamsey:admin:regions'), [(get_region("Ashanti").id, "Ashanti"), (western.id, "Western")])
+
+        # No query per row for the related columns, and no full count
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+        self.assertFalse([query for query in context.captured_queries if 'COUNT(*)' in query['sql'] and 'LIMIT' not in query['sql']])
+        self.assertLess(len(context.captured_queries), 12)
+
+    @override_settings(GALAMSEY_ADMIN_COUNT_LIMIT=2)
+    def test_large_tables_are_not_counted_exactly(self):
+        # Without statistics the count stops at the limit
+        self.assertEqual(self.client.get(self.url).context['cl'].result_count, 2)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(self.client.get(self.url).context['cl'].result_count, 3)
+        response = self.client.get(self.url, {'q': 'ashanti'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_background_delete_rebuilds_the_file(self):
+        konongo = SiteRecords.objects.get(Town__Name="Konongo")
+        choices = self.client.get(self.url).context['action_form'].fields['action'].choices
+        self.assertEqual([name for name, _ in choices if name], ['delete_in_background'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'action': 'delete_in_background', '_selected_action': [konongo.id]})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(SiteRecords.objects.filter(id=konongo.id).exists())
+        ashanti = RegionAggregate.objects.get(FileID=self.file, Region__Name="Ashanti")
+        self.assertEqual((ashanti.RecordCount, ashanti.TotalSites), (1, 15))
+        # The file's content version moves on, its upload date does not
+        refreshed = UploadedFile.objects.get(id=self.file.id)
+        self.assertEqual(refreshed.DateUploaded, self.file.DateUploaded)
+        self.assertGreater(refreshed.DateModified, self.file.DateModified)
+
+
+
+@override_settings(GALAMSEY_PURGE_BATCH_PAUSE=0, GALAMSEY_UPLOAD_JOBS_EAGER=True)
+class RetentionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # The command also removes stale snapshots and exports, so keep it away from the real ones
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.export_dir = os.path.join(directory, "exports")
+        settings_override = override_settings(GALAMSEY_EXPORT_DIR=self.export_dir, GALAMSEY_SNAPSHOT_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.files = []
+        for age_days, name in [(40, "daily.csv"), (20, "daily.csv"), (1, "daily.csv"), (30, "other.csv")]:
+            uploaded_file = UploadedFile.objects.create(FileName=name)
+            UploadedFile.objects.filter(id=uploaded_file.id).update(DateUploaded=timezone.now() - timedelta(days=age_days))
+            uploaded_file.refresh_from_db()
+            for town, region, sites in [("Obuasi", "Ashanti", 15), ("Tarkwa", "Western", 10)]:
+                SiteRecords.objects.create(Town=get_town(town), Region=get_region(region), Number_of_Galamsay_Sites=sites, FileID=uploaded_file)
+            build_region_aggregates(uploaded_file)
+            self.files.append(uploaded_file)
+
+    def test_purge_file_deletes_records_in_batches(self):
+        purged = self.files[0]
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(purge_file(purged, batch_size=1), 2)
+        # One DELETE per batch, and the records are never loaded whole
+        deletes = [query['sql'] for query in context.captured_queries if query['sql'].startswith('DELETE FROM "DbPopulate_siterecords" WHERE "DbPopulate_siterecords"."id" IN')]
+        self.assertEqual(len(deletes), 2)
+        self.assertFalse(UploadedFile.objects.filter(id=purged.id).exists())
+        self.assertFalse(SiteRecords.objects.filter(FileID=purged.id).exists())
+        self.assertFalse(RegionAggregate.objects.filter(FileID=purged.id).exists())
+        self.assertEqual(SiteRecords.objects.count(), 6)
+
+    def test_interrupted_purge_is_not_a_duplicate_target(self):
+        purged = self.files[0]
+        UploadedFile.objects.filter(id=purged.id).update(ContentHash="abc")
+        with override_settings(GALAMSEY_PURGE_BATCH_PAUSE=1), \
+                mock.patch('DbPopulate.purge.time.sleep', side_effect=RuntimeError("interrupted")):
+            with self.assertRaises(RuntimeError):
+                purge_file(purged, batch_size=1)
+        self.assertEqual(SiteRecords.objects.filter(FileID=purged.id).count(), 1)
+        self.assertIsNone(UploadedFile.objects.get(id=purged.id).ContentHash)
+
+    def test_retention_candidates(self):
+        ids = lambda files: [uploaded_file.id for uploaded_file in files]
+        with self.assertNumQueries(1):  # The window is filtered in SQL
+            list(retention_candidates(keep_last=1))
+        self.assertEqual(ids(retention_candidates(keep_last=1)), [self.files[0].id, self.files[1].id])
+        self.assertEqual(ids(retention_candidates(max_age_days=25)), [self.files[0].id, self.files[3].id])
+        self.assertEqual(ids(retention_candidates(keep_last=2, max_age_days=25)), [self.files[0].id, self.files[3].id])
+
+    def test_apply_retention_command(self):
+        out = io.StringIO()
+        call_command('apply_retention', '--keep-last', '1', '--dry-run', stdout=out)
+        self.assertIn('2 file(s) would be purged', out.getvalue())
+        self.assertEqual(UploadedFile.objects.count(), 4)
+
+        # A spooled export of a purged file is removed, the current one kept
+        for uploaded_file in (self.files[0], self.files[2]):
+            exports.spool_export(SiteRecords.objects.filter(FileID=uploaded_file), uploaded_file, exports.CSV)
+        out = io.StringIO()
+        call_command('apply_retention', '--keep-last', '1', '--batch-size', '1', stdout=out)
+        self.assertEqual(os.listdir(self.export_dir), [os.path.basename(exports.spool_path(self.files[2], exports.CSV))])
+        self.assertIn('Purged 2 file(s) and 4 site record(s)', out.getvalue())
+        self.assertEqual(sorted(UploadedFile.objects.values_list('id', flat=True)), [self.files[2].id, self.files[3].id])
+
+        with self.assertRaises(CommandError):
+            call_command('apply_retention', stdout=io.StringIO())
+
+    def test_admin_purge_action(self):
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "password"))
+        url = '/admin/DbPopulate/uploadedfile/'
+        choices = self.client.get(url).context['action_form'].fields['action'].choices
+        self.assertEqual([name for name, _ in choices if name], ['purge_in_background'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'action': 'purge_in_background', '_selected_action': [self.files[1].id]})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(UploadedFile.objects.filter(id=self.files[1].id).exists())
+        self.assertEqual(SiteRecords.objects.count(), 6)
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.file = UploadedFile.objects.create(FileName="metrics.csv")
+        SiteRecords.objects.create(Town=get_town("Obuasi"), Region=get_region("Ashanti"), Number_of_Galamsay_Sites=15, FileID=self.file)
+        self.client = APIClient()
+
+    def test_metrics_are_recorded_per_view(self):
+        self.client.get(f'/api/getsitedata/{self.file.id}/')
+        self.client.get(f'/api/getsitedata/{self.file.id}/?stream=ndjson').getvalue()
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('galamsey_requests_total{view="get-site-data",method="GET",status="200"} 2', text)
+        self.assertIn('galamsey_db_queries_count{view="get-site-data"} 2', text)
+        self.assertIn('galamsey_response_size_bytes_bucket{view="get-site-data",le="+Inf"} 2', text)
+        self.assertIn('# TYPE galamsey_serialization_duration_seconds histogram', text)
+
+    def test_async_views_count_their_queries(self):
+        async def get():
+            return await AsyncClient().get(f'/api/async/averagesitesperregion/{self.file.id}/')
+        self.assertEqual(async_to_sync(get)().status_code, 200)
+        text = self.client.get('/metrics').content.decode()
+        count = re.search(r'galamsey_db_queries_sum\{view="async-average-sites-per-region"\} (\S+)', text)
+        self.assertGreater(float(count.group(1)), 0)
+
+    def test_sampled_profiles(self):
+        with self.settings(GALAMSEY_PROFILE_SAMPLE_RATE=1.0):
+            self.client.get(f'/api/averagesitesperregion/{self.file.id}/')
+        profiles = self.client.get('/metrics/profiles').json()['profiles']
+        self.assertEqual(profiles[0]['view'], 'average-sites-per-region')
+        self.assertIn('cumulative', profiles[0]['stats'])
+
+    def test_metrics_are_local_only(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 403)
+
+
+class BenchmarkHelpersTestCase(TestCase):
+    def test_generated_csv_is_shaped_like_the_sample(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = generate_csv(os.path.join(directory, "bench.csv"), 500, regions=4, towns=20, dirty_ratio=0.1)
+
+        with open(path) as handle:
+            lines = handle.read().splitlines()
+        self.assertEqual(lines[0], "Town,Region,Number_of_Galamsay_Sites")
+        self.assertEqual(len(lines), 501)
+        rows = [line.split(',') for line in lines[1:]]
+        valid = [row for row in rows if row[0] and row[1] and row[2].isdigit()]
+        self.assertGreater(len(valid), 400)
+        self.assertLess(len(valid), 500)
+        self.assertLessEqual(len({row[1] for row in valid}), 4)
+        self.assertLessEqual(len({row[0] for row in valid}), 20)
+
+        # The same seed gives the same file
+        again = generate_csv(os.path.join(directory, "again.csv"), 500, regions=4, towns=20, dirty_ratio=0.1)
+        with open(again) as handle:
+            self.assertEqual(handle.read().splitlines(), lines)
+
+    def test_percentiles(self):
+        result = percentiles([i / 1000 for i in range(1, 101)])
+        self.assertEqual((result['p50_ms'], result['p95_ms'], result['p99_ms']), (50.0, 95.0, 99.0))
+
+
+class BulkLoadTestCase(TestCase):
+    def upload(self, content):
+        upload = SimpleUploadedFile("bulk.csv", content.encode('utf-8'), content_type="text/csv")
+        return self.client.post('/api/upload/', {'file': upload}, format='multipart')
+
+    def test_copy_statement(self):
+        self.assertEqual(
+            copy_statement(connection),
+            'COPY "DbPopulate_siterecords" ("Town_id", "Region_id", "Number_of_Galamsay_Sites", "FileID_id", "RowNumber") FROM STDIN'
+        )
+
+    @skipUnless(connection.vendor == 'postgresql', "COPY FROM STDIN needs PostgreSQL")
+    @override_settings(GALAMSEY_INGEST_BATCH_SIZE=2)
+    def test_upload_is_copied(self):
+        self.assertTrue(copy_enabled(connection))
+        with mock.patch.object(SiteRecords.objects, 'bulk_create') as bulk_create:
+            response = self.upload("Obuasi,Ashanti,15\nTarkwa,Western,10\nKonongo,Ashanti,5\n")
+        bulk_create.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        sites = SiteRecords.objects.filter(FileID=response.data['FileID']).order_by('RowNumber')
+        self.assertEqual(list(sites.values_list('RowNumber', 'Town__Name', 'Region__Name', 'Number_of_Galamsay_Sites')), [
+            (1, "Obuasi", "Ashanti", 15),
+            (2, "Tarkwa", "Western", 10),
+            (3, "Konongo", "Ashanti", 5),
+        ])
+
+
+class ReadWriteRouterTestCase(SimpleTestCase):
+    def test_only_reader_views_read_from_the_reader(self):
+        router = ReadWriteRouter()
+        read = reads_from_reader(lambda: router.db_for_read(SiteRecords))
+        with mock.patch('DbPopulate.routers.reader_available', return_value=True):
+            self.assertEqual(read(), 'reader')
+            self.assertIsNone(router.db_for_read(SiteRecords))
+            self.assertEqual(router.db_for_write(SiteRecords), 'default')
+        # In tests the reader mirrors the writer, so reads stay on the writer's connection
+        self.assertIsNone(read())
+        self.assertFalse(router.allow_migrate('reader', 'DbPopulate'))
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class QueryPlanTestCase(TestCase):
+    """
+    Runs every analytic endpoint and fails if any of its queries falls back
+    to a full table scan.
+    """
+    full_scan = re.compile(r'\bSCAN\b')
+
+    def setUp(self):
+        self.file = UploadedFile.objects.create(FileName="plans.csv")
+        SiteRecords.objects.bulk_create([
+            SiteRecords(Town=get_town(f"Town {i}"), Region=get_region(f"Region {i % 4}"), Number_of_Galamsay_Sites=i, FileID=self.file)
+            for i in range(50)
+        ])
+        self.client = APIClient()
+
+    def query_plans(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 500)
+
+        plans = {}
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    plans[query['sql']] = [row[-1] for row in cursor.fetchall()]
+        return plans
+
+    def assertNoFullScan(self, url):
+        plans = self.query_plans(url)
+        self.assertTrue(plans)
+        for sql, plan in plans.items():
+            for step in plan:
+                self.assertIsNone(self.full_scan.search(step), f"{url} scans a table: {step}\n{sql}")
+
+    def test_site_data_plan(self):
+        self.assertNoFullScan(f'/api/getsitedata/{self.file.id}/')
+
+    def test_region_aggregate_build_plan(self):
+        # A read of a file without aggregates groups its SiteRecords
+        self.assertNoFullScan(f'/api/averagesitesperregion/{self.file.id}/')
+
+    def test_analytic_plans(self):
+        call_command('backfill_region_aggregates', stdout=io.StringIO())
+        self.assertNoFullScan(f'/api/averagesitesperregion/{self.file.id}/')
+        self.assertNoFullScan(f'/api/sitesabovethreshold/{self.file.id}/5/')
+        self.assertNoFullScan(f'/api/regionwithhighestsite/{self.file.id}/')
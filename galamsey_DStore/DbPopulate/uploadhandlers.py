@@ -0,0 +1,52 @@
+"""
+Upload handlers that hash files while they are being received.
+
+They behave like Django's default memory and temporary file handlers, and
+also set `content_hash` (SHA-256, hex) on the uploaded file, so duplicate
+uploads can be recognised without reading the file a second time.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+def content_hash(file_obj):
+    """
+    SHA-256 of a file: taken from the upload handler when it hashed the file
+    as it arrived, otherwise computed by reading the file once.
+    """
+    digest = getattr(file_obj, 'content_hash', None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file_obj.chunks():
+            hasher.update(chunk)
+        file_obj.seek(0)
+        digest = hasher.hexdigest()
+    return digest
+
+
+class HashingMixin:
+    def new_file(self, *args, **kwargs):
+        # Set up first: the memory handler stops the handler chain from new_file()
+        self.hasher = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def file_complete(self, file_size):
+        file_obj = super().file_complete(file_size)
+        if file_obj is not None:
+            file_obj.content_hash = self.hasher.hexdigest()
+        return file_obj
+
+
+class HashingMemoryFileUploadHandler(HashingMixin, MemoryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        # Large files are passed on to the temporary file handler, which hashes them
+        if self.activated:
+            self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+
+class HashingTemporaryFileUploadHandler(HashingMixin, TemporaryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
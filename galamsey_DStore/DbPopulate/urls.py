@@ -1,5 +1,6 @@
 from django.urls import path
-from .views import UploadedFileListView, FileUploadView,api_root, get_site_data, average_sites_per_region, sites_above_threshold, region_with_highest_site
+from . import async_views
+from .views import UploadedFileListView, FileUploadView,api_root, get_site_data, average_sites_per_region, sites_above_threshold, region_with_highest_site, upload_job_status, response_cache_stats, region_trends, ranking, summary, summaries, export_file
 
 urlpatterns = [
     path('', api_root, name='api-root'),
@@ -7,6 +8,17 @@ urlpatterns = [
     path('averagesitesperregion/<int:file_id>/', average_sites_per_region, name='average-sites-per-region'),
     path('sitesabovethreshold/<int:file_id>/<int:threshold>/', sites_above_threshold, name='sites-above-threshold'),
     path('regionwithhighestsite/<int:file_id>/', region_with_highest_site, name='region-with-highest-site'),
+    path('ranking/<int:file_id>/', ranking, name='ranking'),
+    path('summary/<int:file_id>/', summary, name='summary'),
+    path('summary/', summaries, name='summaries'),
+    path('export/<int:file_id>/', export_file, name='export-file'),
+    path('regiontrends/', region_trends, name='region-trends'),
+    path('async/getsitedata/<int:file_id>/', async_views.get_site_data, name='async-get-site-data'),
+    path('async/averagesitesperregion/<int:file_id>/', async_views.average_sites_per_region, name='async-average-sites-per-region'),
+    path('async/sitesabovethreshold/<int:file_id>/<int:threshold>/', async_views.sites_above_threshold, name='async-sites-above-threshold'),
+    path('async/regionwithhighestsite/<int:file_id>/', async_views.region_with_highest_site, name='async-region-with-highest-site'),
     path('upload/', FileUploadView.as_view(), name='file-upload'),
+    path('uploadjobs/<int:job_id>/', upload_job_status, name='upload-job-status'),
+    path('cachestats/', response_cache_stats, name='response-cache-stats'),
     path('uploadedfiles/', UploadedFileListView.as_view(), name='uploaded-files-list'),
 ]
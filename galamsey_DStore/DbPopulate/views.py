@@ -1,17 +1,50 @@
-import io
+import csv
+import math
 
-from django.db.models import Avg, Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.utils.dateparse import parse_date, parse_datetime
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.urls import reverse
+from django.views.decorators.http import require_GET
 from rest_framework.decorators import api_view
-from .serializers import SiteRecordsSerializer, UploadedFileSerializer, RecordSiteSerializer, AverageSitesPerRegionSerializer, RegionWithHighestSitesSerializer
+from .serializers import UploadedFileSerializer, RecordSiteSerializer, UploadJobSerializer
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status, generics
-from .models import UploadedFile, SiteRecords
+from .models import UploadedFile, SiteRecords, UploadJob
+from .aggregates import cross_file_region_stats, region_stats
+from .caching import cache_stats, cached_file_response
+from .ingest import CREATED, DUPLICATE, UPDATED, IngestResult, find_duplicate, ingest_upload
+from .exports import COMPRESSIONS, CSV, EXPORT_FORMATS, export_response
+from .formats import UnsupportedFormat, UploadFormatError
+from .metrics import registry
+from .ranking import REGION_METRICS, get_file_rankings, town_ranking
+from .routers import reads_from_reader
+from .streaming import build_rows, stream_rows
+from .summary import file_summary, files_summary, parse_metrics
+from .jobs import create_upload_job, expire_stale_job, get_job_progress
 
 # Create your views here.
 
+# Response key of each site record field, and the lookup it is read from.
+# Responses are built from values_list() rows rather than through serializers.
+SITE_DATA_FIELDS = {
+    'id': 'id',
+    'Town': 'Town__Name',
+    'Region': 'Region__Name',
+    'Number_of_Galamsay_Sites': 'Number_of_Galamsay_Sites',
+}
+DEFAULT_SITE_DATA_PAGE_SIZE = 1000
+DEFAULT_CROSS_FILE_MAX_FILES = 1000
+DEFAULT_RANKING_SIZE = 10
+
+# Message and status code of an upload response, by how the upload was stored
+UPLOAD_OUTCOMES = {
+    CREATED: ("File uploaded and data stored successfully", status.HTTP_201_CREATED),
+    UPDATED: ("File matches an earlier version; only the changed rows were stored", status.HTTP_200_OK),
+    DUPLICATE: ("Identical file already uploaded; no rows were stored", status.HTTP_200_OK),
+}
+
 # CRUD Operations
 @api_view(['GET'])
 def api_root(request, format=None):
@@ -24,7 +57,13 @@ def api_root(request, format=None):
         "Average Sites Per Region": reverse('average-sites-per-region', args=[1]),
         "Sites Above Threshold": reverse('sites-above-threshold', args=[1, 5]),  # Example threshold=5
         "Region with Highest Sites": reverse('region-with-highest-site', args=[1]),
-        "File Upload": reverse('file-upload')
+        "Ranked Regions": reverse('ranking', args=[1]) + '?by=region&metric=sum&top=5',
+        "Region Trends Across Files": reverse('region-trends') + '?file_ids=1,2',
+        "File Summary": reverse('summary', args=[1]) + '?metrics=average_sites_per_region,region_with_highest_site',
+        "Export File Records": reverse('export-file', args=[1]) + '?fmt=csv',
+        "File Upload": reverse('file-upload'),
+        "Upload Job Status": reverse('upload-job-status', args=[1]),
+        "Response Cache Stats": reverse('response-cache-stats')
     }
 
     # Generate an HTML response with clickable links
@@ -43,22 +82,69 @@ def api_root(request, format=None):
 
 # 1. All sites that were recorded (GET api/getsitedata [FileID])
 @api_view(['GET'])
+@reads_from_reader
+@cached_file_response('site-data')
 def get_site_data(request, file_id):
     """
     Retrieve all site records for a specific file.
+
+    ?cursor=<id>&page_size=<n> returns one page of records after the given id.
+    ?stream=1 (JSON array) or ?stream=ndjson streams every record instead.
     """
     try:
         file = UploadedFile.objects.get(id=file_id)
     except UploadedFile.DoesNotExist:
         return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    sites = SiteRecords.objects.filter(FileID=file)
-    serializer = SiteRecordsSerializer(sites, many=True)
+    sites = SiteRecords.objects.filter(FileID=file).order_by('id')
+
+    stream = request.query_params.get('stream')
+    if stream:
+        # Streams are read after the view returns: pin the connection chosen now
+        return stream_rows(sites.using(sites.db), SITE_DATA_FIELDS, ndjson=(stream == 'ndjson'))
+
+    if 'cursor' in request.query_params or 'page_size' in request.query_params:
+        return get_site_data_page(request, sites)
+
+    records = build_rows(sites.values_list(*SITE_DATA_FIELDS.values()), SITE_DATA_FIELDS)
+
+    return Response(records, status=status.HTTP_200_OK)
+
+def get_site_data_page(request, sites):
+    """
+    Keyset pagination on id: fetch page_size records with an id above the cursor.
+    """
+    max_page_size = getattr(settings, 'GALAMSEY_SITE_DATA_MAX_PAGE_SIZE', DEFAULT_SITE_DATA_PAGE_SIZE)
+    try:
+        cursor = int(request.query_params.get('cursor', 0))
+        page_size = int(request.query_params.get('page_size', max_page_size))
+    except ValueError:
+        return Response({"error": "cursor and page_size must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+    page_size = max(1, min(page_size, max_page_size))
+
+    # Fetch one extra record to know whether there is a next page
+    rows = sites.filter(id__gt=cursor).values_list(*SITE_DATA_FIELDS.values())[:page_size + 1]
+    page = build_rows(rows, SITE_DATA_FIELDS)
+    next_cursor = None
+    next_url = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = page[-1]['id']
+        query = request.query_params.copy()
+        query['cursor'] = next_cursor
+        query['page_size'] = page_size
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
 
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return Response({
+        "results": page,
+        "next_cursor": next_cursor,
+        "next": next_url
+    }, status=status.HTTP_200_OK)
 
 # 2. Average sites per region (GET api/averagesitesperregion [FileID])
 @api_view(['GET'])
+@reads_from_reader
+@cached_file_response('average-sites-per-region')
 def average_sites_per_region(request, file_id):
     """
     Calculate the average number of sites per region for a specific file.
@@ -68,13 +154,17 @@ def average_sites_per_region(request, file_id):
     except UploadedFile.DoesNotExist:
         return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    averages = SiteRecords.objects.filter(FileID=file).values('Region').annotate(average_sites=Avg('Number_of_Galamsay_Sites'))
+    averages = [
+        {"Region": aggregate.Region.Name, "average_sites": aggregate.TotalSites / aggregate.RecordCount}
+        for aggregate in region_stats(file)
+    ]
 
-    serializer = AverageSitesPerRegionSerializer(averages, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return Response(averages, status=status.HTTP_200_OK)
 
 # 3. Regions with Sites above a given threshold (GET api/sitesabovethreshold [FileID, threshold])
 @api_view(['GET'])
+@reads_from_reader
+@cached_file_response('sites-above-threshold')
 def sites_above_threshold(request, file_id, threshold):
     """
     Retrieve regions where the total number of galamsay sites exceeds a given threshold.
@@ -85,14 +175,12 @@ def sites_above_threshold(request, file_id, threshold):
     except UploadedFile.DoesNotExist:
         return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    # Aggregate total number of sites per region
-    region_totals = (
-        SiteRecords.objects
-        .filter(FileID=file)
-        .values('Region')
-        .annotate(total_sites=Sum('Number_of_Galamsay_Sites'))
-        .filter(total_sites__gt=threshold)  # Keep only regions above threshold
-    )
+    # Total number of sites per region, precomputed at upload time
+    region_totals = [
+        {"Region": aggregate.Region.Name, "total_sites": aggregate.TotalSites}
+        for aggregate in region_stats(file)
+        if aggregate.TotalSites > threshold  # Keep only regions above threshold
+    ]
 
     if not region_totals:
         return Response({"message": "No regions exceed the threshold"}, status=status.HTTP_404_NOT_FOUND)
@@ -101,6 +189,8 @@ def sites_above_threshold(request, file_id, threshold):
 
 # 4. Region with Highest number of Sites (GET api/regionwithhighestsite [FileID])
 @api_view(['GET'])
+@reads_from_reader
+@cached_file_response('region-with-highest-site')
 def region_with_highest_site(request, file_id):
     """
     Find the region with the highest number of galamsay sites for a specific file.
@@ -110,13 +200,268 @@ def region_with_highest_site(request, file_id):
     except UploadedFile.DoesNotExist:
         return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    highest_region = SiteRecords.objects.filter(FileID=file).values('Region').annotate(total_sites=Sum('Number_of_Galamsay_Sites')).order_by('-total_sites').first()
+    highest_region = max(region_stats(file), key=lambda aggregate: aggregate.TotalSites, default=None)
 
     if not highest_region:
         return Response({"error": "No records found"}, status=status.HTTP_404_NOT_FOUND)
 
-    serializer = RegionWithHighestSitesSerializer(highest_region)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return Response({"Region": highest_region.Region.Name, "total_sites": highest_region.TotalSites}, status=status.HTTP_200_OK)
+
+# 5. Ranked regions or towns (GET api/ranking [FileID] ?by=&metric=&top=|bottom=|above=|percentile=)
+@api_view(['GET'])
+@reads_from_reader
+@cached_file_response('ranking')
+def ranking(request, file_id):
+    """
+    Rank the regions (by sum, avg, max, min or count of sites) or towns of a file.
+    Pick one of ?top=K, ?bottom=K, ?above=<threshold> or ?percentile=<0-100>; top=10 by default.
+    """
+    try:
+        file = UploadedFile.objects.get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    by = request.query_params.get('by', 'region')
+    metric = request.query_params.get('metric', 'sum')
+    if by not in ('region', 'town'):
+        return Response({"error": "by must be region or town"}, status=status.HTTP_400_BAD_REQUEST)
+    if by == 'town' and 'metric' in request.query_params:
+        return Response({"error": "metric only applies to by=region; towns are ranked by their number of sites"}, status=status.HTTP_400_BAD_REQUEST)
+    if by == 'region' and metric not in REGION_METRICS:
+        return Response({"error": f"metric must be one of {', '.join(REGION_METRICS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    modes = [mode for mode in ('top', 'bottom', 'above', 'percentile') if mode in request.query_params]
+    if len(modes) > 1:
+        return Response({"error": "Use only one of top, bottom, above or percentile"}, status=status.HTTP_400_BAD_REQUEST)
+    mode = modes[0] if modes else 'top'
+    raw_value = request.query_params.get(mode, DEFAULT_RANKING_SIZE)
+    if mode in ('top', 'bottom'):
+        try:
+            value = int(raw_value)
+        except ValueError:
+            value = -1
+        if value < 0:
+            return Response({"error": f"{mode} must be a non-negative integer"}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        try:
+            value = float(raw_value)
+        except ValueError:
+            value = math.nan
+        if not math.isfinite(value):
+            return Response({"error": f"{mode} must be a finite number"}, status=status.HTTP_400_BAD_REQUEST)
+        if mode == 'percentile' and not 0 <= value <= 100:
+            return Response({"error": "percentile must be between 0 and 100"}, status=status.HTTP_400_BAD_REQUEST)
+
+    rankings = get_file_rankings(file)
+    if by == 'town':
+        try:
+            items = town_ranking(file, mode, value, rankings.record_count)
+        except ValueError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        sorted_items = rankings.regions[metric]
+        if mode == 'top':
+            items = sorted_items.top(value)
+        elif mode == 'bottom':
+            items = sorted_items.bottom(value)
+        elif mode == 'above':
+            items = sorted_items.above(value)
+        else:
+            cutoff = sorted_items.percentile_cutoff(value)
+            items = [] if cutoff is None else sorted_items.at_least(cutoff)
+
+    if by == 'town':
+        results = [
+            {"Town": town, "Region": region, "Number_of_Galamsay_Sites": sites}
+            for town, region, sites in items
+        ]
+    else:
+        results = [{"Region": item['Region'], REGION_METRICS[metric]: item[metric]} for item in items]
+
+    return Response(results, status=status.HTTP_200_OK)
+
+# 6. Region totals and trends across many files (GET api/regiontrends ?file_ids= or ?start=&end=)
+@api_view(['GET'])
+@reads_from_reader
+def region_trends(request):
+    """
+    Per-region totals and averages, and per-file trends, over a set of files chosen
+    by ?file_ids=1,2,3 and/or an upload date range ?start=YYYY-MM-DD&end=YYYY-MM-DD.
+    """
+    files = UploadedFile.objects.all()
+    filtered = False
+
+    if request.query_params.get('file_ids'):
+        try:
+            file_ids = [int(file_id) for file_id in request.query_params['file_ids'].split(',') if file_id.strip()]
+        except ValueError:
+            return Response({"error": "file_ids must be a comma separated list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        files = files.filter(id__in=file_ids)
+        filtered = True
+
+    for param in ('start', 'end'):
+        value = request.query_params.get(param)
+        if not value:
+            continue
+        try:
+            day = parse_date(value)
+            moment = None if day else parse_datetime(value)
+        except ValueError:
+            day = moment = None
+        if moment is None and day is None:
+            return Response({"error": f"{param} must be an ISO date or datetime"}, status=status.HTTP_400_BAD_REQUEST)
+        if param == 'start':
+            files = files.filter(DateUploaded__gte=moment) if moment else files.filter(DateUploaded__date__gte=day)
+        else:
+            files = files.filter(DateUploaded__lte=moment) if moment else files.filter(DateUploaded__date__lte=day)
+        filtered = True
+
+    if not filtered:
+        return Response({"error": "Pass file_ids or a start/end upload date"}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_files = getattr(settings, 'GALAMSEY_CROSS_FILE_MAX_FILES', DEFAULT_CROSS_FILE_MAX_FILES)
+    try:
+        files, regions, trends = cross_file_region_stats(files, limit=max_files)
+    except ValueError as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    if not files:
+        return Response({"error": "No files found"}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response({
+        "files": [{"FileID": f.id, "FileName": f.FileName, "DateUploaded": f.DateUploaded} for f in files],
+        "regions": regions,
+        "trends": trends
+    }, status=status.HTTP_200_OK)
+
+# 7. Several analytics of a file at once (GET api/summary [FileID] ?metrics=&threshold=)
+@api_view(['GET'])
+@reads_from_reader
+@cached_file_response('summary')
+def summary(request, file_id):
+    """
+    Compute the requested metrics (?metrics=a,b; all by default) of a file from
+    one read of its region statistics. sites_above_threshold needs ?threshold=.
+    """
+    try:
+        file = UploadedFile.objects.get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return Response({"error": "File not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    names = [name.strip() for name in request.query_params.get('metrics', '').split(',') if name.strip()]
+    try:
+        threshold = summary_threshold(request.query_params.get('threshold'))
+        metrics = parse_metrics(names, threshold)
+    except ValueError as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({"FileID": file.id, **file_summary(file, metrics, threshold)}, status=status.HTTP_200_OK)
+
+# Several analytics of many files at once (POST api/summary {file_ids, metrics, threshold})
+@api_view(['POST'])
+@reads_from_reader
+def summaries(request):
+    """
+    The multi-file variant of api/summary: the aggregates of every file are read in one query.
+    Files that do not exist are listed under "missing".
+    """
+    file_ids = request.data.get('file_ids')
+    names = request.data.get('metrics') or []
+    if not isinstance(file_ids, list) or not file_ids:
+        return Response({"error": "file_ids must be a non-empty list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(names, list):
+        return Response({"error": "metrics must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+    max_files = getattr(settings, 'GALAMSEY_CROSS_FILE_MAX_FILES', DEFAULT_CROSS_FILE_MAX_FILES)
+    if len(file_ids) > max_files:
+        return Response({"error": f"At most {max_files} files per request"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        file_ids = [int(file_id) for file_id in file_ids]
+        threshold = summary_threshold(request.data.get('threshold'))
+        metrics = parse_metrics(names, threshold)
+    except (TypeError, ValueError) as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    files = {file.id: file for file in UploadedFile.objects.filter(id__in=file_ids)}
+    if not files:
+        return Response({"error": "No files found"}, status=status.HTTP_404_NOT_FOUND)
+
+    found = [files[file_id] for file_id in dict.fromkeys(file_ids) if file_id in files]
+    return Response({
+        "files": files_summary(found, metrics, threshold),
+        "missing": [file_id for file_id in dict.fromkeys(file_ids) if file_id not in files]
+    }, status=status.HTTP_200_OK)
+
+def summary_threshold(value):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("threshold must be an integer")
+
+# 8. Bulk export of a file's records (GET api/export [FileID] ?fmt=csv|ndjson|columnar&compress=gzip)
+@require_GET
+@reads_from_reader
+def export_file(request, file_id):
+    """
+    Stream every record of a file for download. A plain Django view, so any
+    Accept header is honoured; supports Range requests to resume downloads.
+    """
+    try:
+        file = UploadedFile.objects.get(id=file_id)
+    except UploadedFile.DoesNotExist:
+        return JsonResponse({"error": "File not found"}, status=404)
+
+    fmt = request.GET.get('fmt', CSV)
+    compress = request.GET.get('compress') or None
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({"error": f"fmt must be one of {', '.join(EXPORT_FORMATS)}"}, status=400)
+    if compress is not None and compress not in COMPRESSIONS:
+        return JsonResponse({"error": f"compress must be one of {', '.join(COMPRESSIONS)}"}, status=400)
+
+    # Exports are read after the view returns: pin the connection chosen now
+    sites = SiteRecords.objects.filter(FileID=file)
+    return export_response(request, sites.using(sites.db), file, fmt, compress)
+
+# 9. Progress of a background upload (GET api/uploadjobs [JobID])
+@api_view(['GET'])
+def upload_job_status(request, job_id):
+    """
+    Report the progress of an asynchronous upload and, once done, its FileID.
+    """
+    try:
+        job = UploadJob.objects.get(id=job_id)
+    except UploadJob.DoesNotExist:
+        return Response({"error": "Upload job not found"}, status=status.HTTP_404_NOT_FOUND)
+    job = expire_stale_job(job)
+
+    data = UploadJobSerializer(job).data
+    data.update(get_job_progress(job))
+    return Response(data, status=status.HTTP_200_OK)
+
+# 10. Hit ratio of the analytic response cache (GET api/cachestats)
+@api_view(['GET'])
+def response_cache_stats(request):
+    """
+    Report response cache hits and misses for the per-file read endpoints.
+    """
+    return Response(cache_stats(), status=status.HTTP_200_OK)
+
+# Request metrics in Prometheus text format (GET /metrics), local clients only
+def metrics_view(request):
+    """
+    Export the per-view request metrics recorded by InstrumentationMiddleware.
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'GALAMSEY_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def profiles_view(request):
+    """
+    The most recent sampled cProfile reports, newest first.
+    """
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'GALAMSEY_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        return HttpResponseForbidden()
+    return JsonResponse({"profiles": list(reversed(registry.profiles))})
 
 class UploadedFileListView(generics.ListAPIView):
     queryset = UploadedFile.objects.all()
@@ -137,28 +482,44 @@ class FileUploadView(generics.CreateAPIView):
         if not file_obj:
             return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Save file details in UploadedFile model
-        uploaded_file = UploadedFile.objects.create(FileName=file_obj.name)
+        # Asynchronous mode: store the file and ingest it in the background,
+        # unless it is already stored (identical content is never stored twice)
+        if request.query_params.get('async') in ('1', 'true'):
+            duplicate = find_duplicate(file_obj)
+            if duplicate is not None:
+                return self.upload_response(IngestResult(uploaded_file=duplicate, status=DUPLICATE))
+            job = create_upload_job(file_obj)
+            return Response({
+                "message": "File accepted for processing",
+                "JobID": job.id,
+                "FileName": job.FileName,
+                "StatusURL": request.build_absolute_uri(reverse('upload-job-status', args=[job.id]))
+            }, status=status.HTTP_202_ACCEPTED)
 
-        # Read and parse CSV content
+        # Stream, parse and store the CSV (or its changes) in one transaction;
+        # a duplicate is answered with the file already stored
         try:
-            file_stream = io.TextIOWrapper(file_obj, encoding='utf-8')
-            for line in file_stream:
-                data = line.strip().split(',')
-                if len(data) == 3:  # Ensure valid format
-                    town, region, sites = data
-                    SiteRecords.objects.create(
-                        Town=town.strip(),
-                        Region=region.strip(),
-                        Number_of_Galamsay_Sites=int(sites.strip()),
-                        FileID=uploaded_file
-                    )
+            result = ingest_upload(file_obj)
+        except UnsupportedFormat as e:
+            return Response({"error": str(e)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        except UploadFormatError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except (UnicodeDecodeError, csv.Error) as e:
+            return Response({"error": f"Invalid CSV file: {e}"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        return Response({
-            "message": "File uploaded and data stored successfully",
-            "FileID": uploaded_file.id,
-            "FileName": uploaded_file.FileName
-        }, status=status.HTTP_201_CREATED)
+        return self.upload_response(result)
 
+    def upload_response(self, result):
+        message, status_code = UPLOAD_OUTCOMES[result.status]
+        return Response({
+            "message": message,
+            "FileID": result.uploaded_file.id,
+            "FileName": result.uploaded_file.FileName,
+            "UploadStatus": result.status,
+            "RowsAccepted": result.rows_accepted,
+            "RowsRejected": result.rows_rejected,
+            "RejectedLines": result.errors.errors,
+            "RowsChanged": result.rows_changed
+        }, status=status_code)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'DbPopulate.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,6 +61,11 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
     ],
+    # JSONRenderer's output, encoded with orjson when it is installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'DbPopulate.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 ROOT_URLCONF = 'galamsey_DStore.urls'
@@ -84,13 +91,105 @@ WSGI_APPLICATION = 'galamsey_DStore.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# SQLite by default. GALAMSEY_DB_ENGINE=postgresql selects PostgreSQL (needs
+# psycopg), configured by GALAMSEY_DB_NAME/USER/PASSWORD/HOST/PORT.
+
+if os.environ.get('GALAMSEY_DB_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('GALAMSEY_DB_NAME', 'galamsey'),
+            'USER': os.environ.get('GALAMSEY_DB_USER', 'galamsey'),
+            'PASSWORD': os.environ.get('GALAMSEY_DB_PASSWORD', ''),
+            'HOST': os.environ.get('GALAMSEY_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('GALAMSEY_DB_PORT', '5432'),
+            # Keep connections open between requests, checking them before reuse
+            'CONN_MAX_AGE': int(os.environ.get('GALAMSEY_DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    # GALAMSEY_DB_POOL=1 shares a psycopg connection pool between threads
+    # instead (needs psycopg[pool]); persistent connections must then be off
+    if os.environ.get('GALAMSEY_DB_POOL') == '1':
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('GALAMSEY_DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('GALAMSEY_DB_POOL_MAX_SIZE', '10')),
+            'timeout': 30,
+        }
+else:
+    GALAMSEY_SQLITE_PATH = Path(os.environ.get('GALAMSEY_DB_NAME', BASE_DIR / 'db.sqlite3')).resolve()
+    # Performance profile run on every connection. WAL lets readers keep
+    # reading committed data while an upload writes; it is stored in the
+    # database file, so migrate switches it on once (DbPopulate.signals) and
+    # commands that only read, like makemigrations, leave the file untouched
+    GALAMSEY_SQLITE_PRAGMAS = [
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA mmap_size=268435456',  # 256 MB
+        'PRAGMA cache_size=-65536',  # 64 MB
+        'PRAGMA busy_timeout=30000',
+    ]
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': GALAMSEY_SQLITE_PATH,
+            # Parallel loaders (import_csv --workers) take the write lock up front
+            # and wait for each other instead of failing with "database is locked"
+            'OPTIONS': {
+                'timeout': 30,
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': ';'.join(GALAMSEY_SQLITE_PRAGMAS),
+            },
+        },
+        # Read-only connections used by the analytic views (see DbPopulate.routers)
+        'reader': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': f'{GALAMSEY_SQLITE_PATH.as_uri()}?mode=ro',
+            'OPTIONS': {
+                'timeout': 30,
+                'init_command': ';'.join(GALAMSEY_SQLITE_PRAGMAS + ['PRAGMA query_only=1']),
+            },
+            'TEST': {'MIRROR': 'default'},
+        },
+    }
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+DATABASE_ROUTERS = ['DbPopulate.routers.ReadWriteRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Cached responses are invalidated per file on upload and delete, so every
+# worker process must see the same cache. The default file cache is shared
+# by the processes of one host; GALAMSEY_CACHE_BACKEND=redis (with
+# GALAMSEY_REDIS_URL, needs the redis package) shares it between hosts.
+# GALAMSEY_CACHE_BACKEND=locmem keeps a separate cache in each process and
+# is only correct with a single worker process (e.g. runserver).
+
+GALAMSEY_CACHE_BACKEND = os.environ.get('GALAMSEY_CACHE_BACKEND', 'file')
+if GALAMSEY_CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'galamsey',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+elif GALAMSEY_CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('GALAMSEY_REDIS_URL', 'redis://127.0.0.1:6379/0'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('GALAMSEY_CACHE_DIR', str(BASE_DIR / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
     }
-}
 
 
 # Password validation
@@ -134,4 +233,103 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True
-CORS_ALLOW_METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
\ No newline at end of file
+CORS_ALLOW_METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+
+# Galamsey data store tuning
+
+# Number of SiteRecords written per INSERT (per COPY on PostgreSQL) when ingesting an uploaded CSV
+GALAMSEY_INGEST_BATCH_SIZE = 5000
+
+# Uploads stored on disk and larger than GALAMSEY_PARALLEL_PARSE_MIN_BYTES are
+# parsed on GALAMSEY_PARSE_WORKERS processes, GALAMSEY_PARSE_CHUNK_BYTES at a
+# time. Upload responses list the first GALAMSEY_INGEST_MAX_ERRORS rejected lines.
+GALAMSEY_PARSE_WORKERS = os.cpu_count() or 1
+GALAMSEY_PARALLEL_PARSE_MIN_BYTES = 16 * 1024 * 1024
+GALAMSEY_PARSE_CHUNK_BYTES = 4 * 1024 * 1024
+GALAMSEY_INGEST_MAX_ERRORS = 100
+
+# New SiteRecords are streamed with COPY FROM STDIN on PostgreSQL
+GALAMSEY_POSTGRES_COPY = True
+
+# Uploads are hashed as they are received. An upload identical to a stored
+# file returns that file; one changing at most this share of the rows of the
+# latest file with the same name updates that file in place.
+FILE_UPLOAD_HANDLERS = [
+    'DbPopulate.uploadhandlers.HashingMemoryFileUploadHandler',
+    'DbPopulate.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+GALAMSEY_DELTA_MAX_CHANGED_RATIO = 0.1
+
+# Raw files of asynchronous uploads are kept here until they are ingested
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Background threads used for asynchronous uploads (POST api/upload/?async=1).
+# Set GALAMSEY_UPLOAD_JOBS_EAGER to run them inline instead, e.g. in tests.
+GALAMSEY_UPLOAD_WORKERS = 2
+GALAMSEY_UPLOAD_JOBS_EAGER = False
+# Seconds after which a job still pending or running is reported as failed
+# (its worker was lost, e.g. to a restart); None never expires jobs.
+GALAMSEY_UPLOAD_JOB_TIMEOUT = 6 * 60 * 60
+
+# Largest page served by api/getsitedata/<id>/?cursor=..., and the number of
+# rows fetched per database round trip when streaming with ?stream=1
+GALAMSEY_SITE_DATA_MAX_PAGE_SIZE = 1000
+GALAMSEY_STREAM_CHUNK_SIZE = 2000
+
+# Cached responses of the per-file read endpoints live this many seconds;
+# lists longer than GALAMSEY_RESPONSE_CACHE_MAX_ROWS are never cached
+GALAMSEY_RESPONSE_CACHE_ALIAS = 'default'
+GALAMSEY_RESPONSE_CACHE_TIMEOUT = 60 * 60
+GALAMSEY_RESPONSE_CACHE_MAX_ROWS = 10000
+
+# Identical concurrent cache misses run the view once and share its response.
+# Other processes wait up to GALAMSEY_COALESCE_WAIT seconds for it through a
+# lock in the response cache (0 turns that off); this needs a shared cache.
+GALAMSEY_COALESCE_REQUESTS = True
+GALAMSEY_COALESCE_WAIT = 10
+GALAMSEY_COALESCE_POLL_INTERVAL = 0.05
+
+# Most files a single api/regiontrends/ request may cover
+GALAMSEY_CROSS_FILE_MAX_FILES = 1000
+
+# Files whose sorted region rankings are kept in memory per process (towns
+# are ranked with indexed queries instead)
+GALAMSEY_RANKING_CACHE_SIZE = 32
+# Most towns a single api/ranking/?by=town response may hold; larger
+# selections are answered with 400
+GALAMSEY_RANKING_MAX_TOWNS = 10000
+
+# Per-view request metrics, exported at /metrics for the listed client IPs.
+# A GALAMSEY_PROFILE_SAMPLE_RATE share of requests is profiled with cProfile
+# (see /metrics/profiles); keep it small in production.
+GALAMSEY_METRICS_ENABLED = True
+GALAMSEY_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+GALAMSEY_PROFILE_SAMPLE_RATE = float(os.environ.get('GALAMSEY_PROFILE_SAMPLE_RATE', '0'))
+
+# Columnar, memory-mapped snapshots of every ingested file, used to answer the
+# region analytics without touching SiteRecords. Enable with GALAMSEY_SNAPSHOTS=1;
+# NumPy is used for the aggregations when installed.
+GALAMSEY_SNAPSHOTS_ENABLED = os.environ.get('GALAMSEY_SNAPSHOTS', '') == '1'
+GALAMSEY_SNAPSHOT_DIR = BASE_DIR / 'snapshots'
+GALAMSEY_OPEN_SNAPSHOTS = 64
+
+# Spooled exports (api/export/<id>/), kept so downloads can be resumed with Range requests
+GALAMSEY_EXPORT_DIR = BASE_DIR / 'exports'
+
+# The SiteRecords admin never counts the whole table: it shows the planner's
+# estimate (on SQLite, once ANALYZE has run) and otherwise counts up to
+# GALAMSEY_ADMIN_COUNT_LIMIT rows, as it does for filtered results. Its
+# region filter choices are cached for GALAMSEY_ADMIN_FILTER_CACHE_TIMEOUT seconds.
+GALAMSEY_ADMIN_COUNT_LIMIT = 100000
+GALAMSEY_ADMIN_FILTER_CACHE_TIMEOUT = 5 * 60
+
+# Records deleted per transaction by background deletes and purges, with a
+# pause of GALAMSEY_PURGE_BATCH_PAUSE seconds between batches for live ingests
+GALAMSEY_PURGE_BATCH_SIZE = 10000
+GALAMSEY_PURGE_BATCH_PAUSE = 0.05
+
+# Retention policy applied by `manage.py apply_retention`: keep the newest
+# GALAMSEY_RETENTION_KEEP_LAST uploads of each file name and/or purge uploads
+# older than GALAMSEY_RETENTION_MAX_AGE_DAYS. None disables a rule.
+GALAMSEY_RETENTION_KEEP_LAST = None
+GALAMSEY_RETENTION_MAX_AGE_DAYS = None
@@ -19,6 +19,7 @@ from django.urls import path
 from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
+from DbPopulate.views import metrics_view, profiles_view
 
 # Simple homepage view
 def home(request):
@@ -29,5 +30,7 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("", home),  # Add this line to handle requests to "/"
     path("api/", include('DbPopulate.urls')),  # Include DGApp URLs
+    path("metrics", metrics_view, name='metrics'),  # Prometheus scrape endpoint
+    path("metrics/profiles", profiles_view, name='metrics-profiles'),
     ]
 